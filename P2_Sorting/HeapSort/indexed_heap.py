@@ -0,0 +1,281 @@
+from P2_Sorting.HeapSort.heap import heap_parent, heap_left_child
+from Common.common import default_key
+from operator import lt, gt
+from random import randint, shuffle
+from unittest import TestCase
+
+
+class IndexedHeap(object):
+    """
+    Binary heap over hashable items, with an item-to-position index, so that each item is its own handle: its
+    priority can be changed, and it can be removed, in O(log n) time. The heap is a min heap, or a max heap with
+    max_heap, with no need to negate priorities. Each item's priority is given on push or computed once by the key
+    function, and cached next to the item, so that sifting compares the cached priorities.
+    """
+    def __init__(self, key=None, max_heap: bool = False):
+        """
+        :param key: The function computing the priority of an item pushed without one, the item itself by default.
+        :param max_heap: Whether the item with the maximum priority comes first, rather than the minimum.
+        """
+        self._items = []
+        self._priorities = []
+        self._positions = {}
+        self._key = default_key if key is None else key
+        self._max_heap = max_heap
+        # Whether the first priority must come before the second one.
+        self._before = gt if max_heap else lt
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    @property
+    def max_heap(self) -> bool:
+        return self._max_heap
+
+    def priority(self, item):
+        """
+        Gets the priority of an item in the heap. Raises a KeyError if the item is not in the heap.
+        :param item: The item.
+        :return: The priority of the item.
+        """
+        return self._priorities[self._positions[item]]
+
+    def push(self, item, priority=None):
+        """
+        Inserts a new item in O(log n) time.
+        :param item: The item to insert, which must not be in the heap yet.
+        :param priority: The priority of the item, key(item) by default.
+        """
+        assert item not in self._positions
+        self._items.append(item)
+        self._priorities.append(self._key(item) if priority is None else priority)
+        self._positions[item] = len(self._items) - 1
+        self._sift_up(len(self._items) - 1)
+
+    def decrease_key(self, item, priority):
+        """
+        Decreases the priority of an item already in the heap in O(log n) time.
+        :param item: The item.
+        :param priority: The new priority, which must be no larger than the current one.
+        """
+        i = self._positions[item]
+        assert priority <= self._priorities[i]
+        self._priorities[i] = priority
+        if self._max_heap:
+            self._sift_down(i)
+        else:
+            self._sift_up(i)
+
+    def update_key(self, item, priority=None):
+        """
+        Changes the priority of an item already in the heap to any value in O(log n) time.
+        :param item: The item.
+        :param priority: The new priority, or None to compute it again with the key function after the item changed.
+        """
+        i = self._positions[item]
+        old_priority = self._priorities[i]
+        priority = self._key(item) if priority is None else priority
+        self._priorities[i] = priority
+        if self._before(priority, old_priority):
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def push_or_decrease(self, item, priority):
+        """
+        Inserts an item, or decreases its priority if it is already in the heap and the new priority is smaller.
+        :param item: The item.
+        :param priority: The priority.
+        """
+        i = self._positions.get(item)
+        if i is None:
+            self.push(item, priority)
+        elif priority < self._priorities[i]:
+            self.decrease_key(item, priority)
+
+    def remove(self, item):
+        """
+        Removes an item in O(log n) time. Raises a KeyError if the item is not in the heap.
+        :return: The priority of the item.
+        """
+        i = self._positions.pop(item)
+        items, priorities = self._items, self._priorities
+        priority = priorities[i]
+        last_item, last_priority = items.pop(), priorities.pop()
+        if i < len(items):
+            items[i], priorities[i] = last_item, last_priority
+            self._positions[last_item] = i
+            if self._before(last_priority, priority):
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+        return priority
+
+    def peek(self):
+        """
+        Gets the first item. Raises a ValueError if the heap is empty.
+        :return: The (item, priority) pair.
+        """
+        if not self._items:
+            raise ValueError('This heap is empty')
+        return self._items[0], self._priorities[0]
+
+    def pop(self):
+        """
+        Extracts the first item in O(log n) time. Raises a ValueError if the heap is empty.
+        :return: The (item, priority) pair.
+        """
+        if not self._items:
+            raise ValueError('This heap is empty')
+        items, priorities = self._items, self._priorities
+        first_item, first_priority = items[0], priorities[0]
+        del self._positions[first_item]
+        last_item, last_priority = items.pop(), priorities.pop()
+        if items:
+            items[0], priorities[0] = last_item, last_priority
+            self._positions[last_item] = 0
+            self._sift_down(0)
+        return first_item, first_priority
+
+    def pushpop(self, item, priority=None):
+        """
+        Inserts a new item and then extracts the first item, with a single sift down, if any, in O(log n) time.
+        :param item: The item to insert, which must not be in the heap yet.
+        :param priority: The priority of the item, key(item) by default.
+        :return: The (item, priority) pair, which is the new one if it comes no later than the first one.
+        """
+        assert item not in self._positions
+        priority = self._key(item) if priority is None else priority
+        items, priorities = self._items, self._priorities
+        if not items or not self._before(priorities[0], priority):
+            return item, priority
+        first_item, first_priority = items[0], priorities[0]
+        del self._positions[first_item]
+        items[0], priorities[0] = item, priority
+        self._positions[item] = 0
+        self._sift_down(0)
+        return first_item, first_priority
+
+    def _sift_up(self, i):
+        items, priorities, positions, before = self._items, self._priorities, self._positions, self._before
+        item, priority = items[i], priorities[i]
+        while i > 0:
+            parent = heap_parent(i)
+            if not before(priority, priorities[parent]):
+                break
+            items[i], priorities[i] = items[parent], priorities[parent]
+            positions[items[i]] = i
+            i = parent
+        items[i], priorities[i] = item, priority
+        positions[item] = i
+
+    def _sift_down(self, i):
+        items, priorities, positions, before = self._items, self._priorities, self._positions, self._before
+        n = len(items)
+        item, priority = items[i], priorities[i]
+        while True:
+            child = heap_left_child(i)
+            if child >= n:
+                break
+            if child + 1 < n and before(priorities[child + 1], priorities[child]):
+                child += 1
+            if not before(priorities[child], priority):
+                break
+            items[i], priorities[i] = items[child], priorities[child]
+            positions[items[i]] = i
+            i = child
+        items[i], priorities[i] = item, priority
+        positions[item] = i
+
+
+class IndexedMinHeap(IndexedHeap):
+    """Indexed binary min heap with explicit priorities, see IndexedHeap."""
+    def __init__(self):
+        super().__init__()
+
+
+class TestIndexedMinHeap(TestCase):
+    def test_push_pop(self):
+        heap = IndexedMinHeap()
+        self.assertRaises(ValueError, heap.pop)
+        keys = list(range(100))
+        shuffle(keys)
+        for k in keys:
+            heap.push('v%d' % k, k)
+        self.assertEqual(100, len(heap))
+        self.assertEqual(('v0', 0), heap.peek())
+        self.assertSequenceEqual([('v%d' % k, k) for k in range(100)], [heap.pop() for _ in range(100)])
+        self.assertEqual(0, len(heap))
+
+    def test_decrease_key(self):
+        heap = IndexedMinHeap()
+        expected = {}
+        for i in range(200):
+            priority = randint(0, 1000)
+            heap.push(i, priority)
+            expected[i] = priority
+        for _ in range(300):
+            item = randint(0, 199)
+            priority = randint(-1000, 1000)
+            heap.push_or_decrease(item, priority)
+            expected[item] = min(expected[item], priority)
+            self.assertEqual(expected[item], heap.priority(item))
+        for _ in range(100):
+            item = randint(0, 199)
+            priority = randint(-1000, 1000)
+            heap.update_key(item, priority)
+            expected[item] = priority
+        result = []
+        while heap:
+            item, priority = heap.pop()
+            self.assertFalse(item in heap)
+            self.assertEqual(expected[item], priority)
+            result.append(priority)
+        self.assertSequenceEqual(sorted(expected.values()), result)
+
+    def test_max_heap_and_keys(self):
+        class Job(object):
+            def __init__(self, weight):
+                self.weight = weight
+
+        key_calls = []
+
+        def key(job):
+            key_calls.append(job)
+            return job.weight
+
+        heap = IndexedHeap(key=key, max_heap=True)
+        jobs = [Job(randint(0, 50)) for _ in range(100)]
+        for job in jobs:
+            heap.push(job)
+        self.assertEqual(len(jobs), len(key_calls))
+        self.assertEqual(max(job.weight for job in jobs), heap.peek()[1])
+
+        for job in jobs[::3]:
+            self.assertEqual(job.weight, heap.remove(job))
+            self.assertFalse(job in heap)
+        self.assertRaises(KeyError, lambda: heap.remove(jobs[0]))
+        for job in jobs[1::3]:
+            job.weight = randint(0, 50)
+            heap.update_key(job)
+        heap.decrease_key(jobs[2], jobs[2].weight - 100)
+        jobs[2].weight -= 100
+
+        job = Job(1000)
+        self.assertIs(job, heap.pushpop(job)[0])
+        self.assertFalse(job in heap)
+        job = Job(-1)
+        top = heap.peek()
+        self.assertEqual(top, heap.pushpop(job))
+        self.assertTrue(job in heap)
+
+        remaining = [job] + [job for i, job in enumerate(jobs) if i % 3 and job is not top[0]]
+        self.assertEqual(len(remaining), len(heap))
+        result = []
+        while heap:
+            result.append(heap.pop()[1])
+        self.assertSequenceEqual(sorted((job.weight for job in remaining), reverse=True), result)
+        self.assertEqual(('x', 3), IndexedHeap().pushpop('x', 3))
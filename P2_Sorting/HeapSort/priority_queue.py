@@ -30,7 +30,7 @@ class MaxPriorityQueue(object):
         """
 
         if len(self) <= 0:
-            ValueError('This priority queue is empty')
+            raise ValueError('This priority queue is empty')
 
         max_elem = self._array[0]
         heap_size = len(self._array) - 1
@@ -45,7 +45,7 @@ class MaxPriorityQueue(object):
         :return: The max priority element.
         """
         if len(self) <= 0:
-            ValueError('This priority queue is empty')
+            raise ValueError('This priority queue is empty')
 
         return self._array[0]
 
@@ -128,6 +128,8 @@ class TestMaxPriorityQueue(TestCase):
         while len(pq) > 0:
             out_array.append(pq.extract_max())
         self.assertEqual(out_array, [5, 4, 4, 3, 3, 2, 2])
+        self.assertRaises(ValueError, pq.get_max)
+        self.assertRaises(ValueError, pq.extract_max)
 
     def test_merge_sorted_lists(self):
         sorted_lists = (
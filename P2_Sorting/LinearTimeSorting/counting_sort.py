@@ -90,13 +90,17 @@ def counting_sort_in_place(array: List[T], key: Callable[[T], int]=None):
 
 def query_count_in_range(array: List[int], queries: Tuple[(int, int)]):
     """
-    Ex 8.2-4.
-    :param array: Input array.
+    Ex 8.2-4. The cumulative counts take O(n + k) time to build, and each query O(1) time. For data that changes
+    between queries, pass a FenwickCounts (see range_query_trees) instead of the array, which is updated in O(lg k)
+    time and answers each query in O(lg k) time.
+    :param array: Input array, or a FenwickCounts of the input, or anything else with its count_range method.
     :param queries: Range queries. For each query, the first element is the lower bound while the second the upper.
     :return: Count in range.
     """
     assert array is not None
     assert queries is not None
+    if hasattr(array, 'count_range'):
+        return [array.count_range(lo, hi) for lo, hi in queries]
     n = len(array)
     qc = len(queries)
     if n == 0:
@@ -127,6 +131,7 @@ class TestCountingSort(unittest.TestCase):
             self.assertEqual(case.sorted_array, case.array)
 
     def test_query_count_in_range(self):
+        from P3_DataStructures.Augment.range_query_trees import FenwickCounts
         case_class = namedtuple('case_class', 'array queries expected_res')
         cases = (
             case_class(array=(), queries=((1, 2), (3, 4)), expected_res=[0, 0]),
@@ -135,6 +140,7 @@ class TestCountingSort(unittest.TestCase):
         )
         for case in cases:
             self.assertEqual(case.expected_res, query_count_in_range(case.array, case.queries))
+            self.assertEqual(case.expected_res, query_count_in_range(FenwickCounts.from_keys(case.array), case.queries))
 
     def _get_counting_sort_cases(self):
         case_class = namedtuple('case_class', 'array sorted_array key')
@@ -4,25 +4,42 @@
 """
 
 
-from P3_DataStructures.RBTree.basic_ops import RBTreeNode, RBTree, rb_insert_raw, rb_insert_fixup, rb_search, rb_pop_raw, rb_pop_fixup,\
-    RB_BLACK
+from P3_DataStructures.RBTree.basic_ops import RBTreeNode, CompactRBTreeNode, RBTree, rb_insert_raw, rb_insert_fixup,\
+    rb_search, rb_pop_raw, rb_pop_fixup, rb_build_sorted, RB_BLACK
 from unittest import TestCase
 from Common.common import rand_permutate
-from random import randint, uniform
+from random import randint, uniform, expovariate
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from math import ceil
+import time
 
 
 class OSTreeNodeAugment(object):
+    __slots__ = ('size',)
+
     def __init__(self, size=0):
         self.size = size
 
 
-def os_tree_create(key=None):
+def os_tree_create(key=None, node_class=CompactRBTreeNode):
     """Create an OS tree based on a red-black tree."""
-    rbt = RBTree(key)
+    rbt = RBTree(key, node_class)
     rbt.nil.aug = OSTreeNodeAugment()
     return rbt
 
 
+def os_on_subtree_built(node: RBTreeNode):
+    node.aug = OSTreeNodeAugment(node.left.aug.size + node.right.aug.size + 1)
+
+
+def os_tree_from_sorted(sorted_data, key=None, node_class=CompactRBTreeNode) -> RBTree:
+    """Create an OS tree from data sorted by key in O(n) time, see rb_build_sorted."""
+    ost = os_tree_create(key, node_class)
+    rb_build_sorted(ost, sorted_data, os_on_subtree_built)
+    return ost
+
+
 def os_select(ost: RBTree, i: int):
     """
     Ex 14.1-3. Select an order statistic iteratively.
@@ -74,6 +91,80 @@ def os_key_rank(ost: RBTree, k):
     return _os_key_rank(ost, ost.root, k)
 
 
+def os_count_below(ost: RBTree, k, inclusive: bool = False) -> int:
+    """
+    The number of keys less than k, or no greater than k if inclusive, in O(lg n) time. That's the index at which
+    bisect_left, or bisect_right if inclusive, would insert k into the sorted keys.
+    """
+    count = 0
+    node = ost.root
+    key = ost.key
+    while node != ost.nil:
+        node_key = key(node.data)
+        if node_key < k or (inclusive and node_key == k):
+            count += node.left.aug.size + 1
+            node = node.right
+        else:
+            node = node.left
+    return count
+
+
+def os_count_range(ost: RBTree, lo, hi, inclusive=(True, True)) -> int:
+    """
+    The number of keys between lo and hi in O(lg n) time.
+    :param inclusive: Whether lo and hi themselves are counted.
+    """
+    lo_inclusive, hi_inclusive = inclusive
+    return max(0, os_count_below(ost, hi, hi_inclusive) - os_count_below(ost, lo, not lo_inclusive))
+
+
+def _os_select_many(ost: RBTree, node: RBTreeNode, ranks, start: int, end: int, offset: int, ret: list):
+    # ranks[start:end] are in the subtree of node, whose smallest key has rank offset + 1.
+    if start == end:
+        return
+    node_rank = offset + node.left.aug.size + 1
+    mid_start = bisect_left(ranks, node_rank, start, end)
+    mid_end = bisect_right(ranks, node_rank, mid_start, end)
+    _os_select_many(ost, node.left, ranks, start, mid_start, offset, ret)
+    ret.extend(node for _ in range(mid_end - mid_start))
+    _os_select_many(ost, node.right, ranks, mid_end, end, node_rank, ret)
+
+
+def os_select_many(ost: RBTree, ranks) -> list:
+    """
+    Select several order statistics in one traversal, which visits the union of the paths to them, that is
+    O(min(n, m lg(n / m) + lg n)) nodes for m ranks, instead of O(m lg n) with os_select.
+    :param ranks: Ranks in ascending order.
+    :return: The nodes whose keys are the ranks'th smallest, in the same order.
+    """
+    ranks = ranks if isinstance(ranks, list) else list(ranks)
+    if ranks:
+        assert 1 <= ranks[0] and ranks[-1] <= ost.root.aug.size
+    ret = []
+    _os_select_many(ost, ost.root, ranks, 0, len(ranks), 0, ret)
+    return ret
+
+
+def os_percentile_rank(n: int, percentile: float) -> int:
+    """The rank of the given percentile, between 0 and 100, among n keys, by the nearest-rank method."""
+    assert n > 0 and 0 <= percentile <= 100
+    return max(1, ceil(percentile / 100 * n))
+
+
+def os_percentiles(ost: RBTree, percentiles=(50, 95, 99)) -> list:
+    """
+    :param percentiles: Percentiles between 0 and 100, in any order.
+    :return: The nodes at the given percentiles by the nearest-rank method, in the same order.
+    """
+    n = ost.root.aug.size
+    ranks = [os_percentile_rank(n, p) for p in percentiles]
+    order = sorted(range(len(ranks)), key=ranks.__getitem__)
+    ret = [None] * len(ranks)
+    for i, node in zip(order, os_select_many(ost, [ranks[i] for i in order])):
+        ret[i] = node
+    return ret
+
+
 def os_on_left_rotation_complete(root: RBTreeNode):
     left = root.left
     root.aug.size = left.aug.size
@@ -115,10 +206,13 @@ def os_pop(ost: RBTree, node: RBTreeNode):
 
 class TestOSTree(TestCase):
     def test_rand_insert(self):
+        for node_class in (CompactRBTreeNode, RBTreeNode):
+            self._test_rand_insert(os_tree_create(node_class=node_class))
+
+    def _test_rand_insert(self, ost: RBTree):
         _len = 100
         insertion_seq = list(range(_len))
         rand_permutate(insertion_seq)
-        ost = os_tree_create()
         cnt = 0
         for i in insertion_seq:
             os_insert(ost, i)
@@ -130,6 +224,20 @@ class TestOSTree(TestCase):
             node1 = os_select(ost, i + 1)
             self.assertEqual(node, node1)
 
+    def test_from_sorted(self):
+        for n in (0, 1, 2, 10, 100, 255):
+            ost = os_tree_from_sorted(range(n))
+            for i in range(n):
+                self.assertEqual(i, os_select(ost, i + 1).data)
+                self.assertEqual(i + 1, os_rank(ost, rb_search(ost, i)))
+            for i in range(0, n, 3):
+                os_pop(ost, rb_search(ost, i))
+            os_insert(ost, n)
+            keys = [i for i in range(n + 1) if i >= n or i % 3]
+            self.assertEqual(len(keys), ost.root.aug.size)
+            for i, k in enumerate(keys):
+                self.assertEqual(k, os_select(ost, i + 1).data)
+
     def test_rand_insert_delete(self):
         def key(x):
             return -x
@@ -161,3 +269,53 @@ class TestOSTree(TestCase):
                 self.assertEqual(j + 1, os_rank(ost, rb_search(ost, key(values[j]))))
                 self.assertEqual(values[j], os_select(ost, j + 1).data)
                 self.assertEqual(j + 1, os_key_rank(ost, key(values[j])))
+
+    def test_range_and_batch_queries(self):
+        keys = sorted(randint(0, 200) for _ in range(300))
+        ost = os_tree_from_sorted(keys)
+        for _ in range(100):
+            lo, hi = randint(-10, 210), randint(-10, 210)
+            for inclusive in ((True, True), (True, False), (False, True), (False, False)):
+                expected = sum(1 for k in keys if (lo <= k if inclusive[0] else lo < k) and
+                               (k <= hi if inclusive[1] else k < hi))
+                self.assertEqual(expected, os_count_range(ost, lo, hi, inclusive))
+
+            ranks = sorted(randint(1, len(keys)) for _ in range(randint(0, 20)))
+            self.assertListEqual([os_select(ost, i) for i in ranks], os_select_many(ost, ranks))
+        self.assertListEqual([os_select(ost, i) for i in range(1, len(keys) + 1)],
+                             os_select_many(ost, range(1, len(keys) + 1)))
+
+        percentiles = (99, 50, 0, 95, 100, 12.5)
+        self.assertListEqual([keys[max(1, ceil(p / 100 * len(keys))) - 1] for p in percentiles],
+                             [node.data for node in os_percentiles(ost, percentiles)])
+        self.assertEqual(1, os_percentile_rank(1, 99))
+        self.assertEqual(10, os_percentile_rank(10, 95))
+
+
+def _main():
+    window = 10000
+    n = 100000
+    latencies = [expovariate(1.0) for _ in range(n + window)]
+    percentiles = (50, 95, 99)
+
+    ost = os_tree_create()
+    nodes = deque(os_insert(ost, latency) for latency in latencies[:window])
+    start_time = time.time()
+    for latency in latencies[window:]:
+        nodes.append(os_insert(ost, latency))
+        os_pop(ost, nodes.popleft())
+        os_percentiles(ost, percentiles)
+    print('OS tree, window of %d: %.0f updates with p50/p95/p99 per second.' % (window, n / (time.time() - start_time)))
+
+    sorted_window = sorted(latencies[:window])
+    start_time = time.time()
+    for i, latency in enumerate(latencies[window:]):
+        insort(sorted_window, latency)
+        del sorted_window[bisect_left(sorted_window, latencies[i])]
+        [sorted_window[os_percentile_rank(window, p) - 1] for p in percentiles]
+    print('Sorted list, window of %d: %.0f updates with p50/p95/p99 per second.' %
+          (window, n / (time.time() - start_time)))
+
+
+if __name__ == '__main__':
+    _main()
@@ -1,11 +1,13 @@
-from P3_DataStructures.RBTree.basic_ops\
-    import RBTreeNode, RBTree, rb_insert_raw, rb_insert_fixup, rb_search, rb_pop_raw, rb_pop_fixup, RB_BLACK
+from P3_DataStructures.RBTree.basic_ops import RBTreeNode, CompactRBTreeNode, RBTree, rb_insert_raw, rb_insert_fixup,\
+    rb_search, rb_pop_raw, rb_pop_fixup, rb_build_sorted, rb_iter, rb_iter_nodes, RB_BLACK
 from unittest import TestCase
+from random import randint
+from heapq import heappush, heappop
 
 
 class Interval(object):
     def __init__(self, lo: int, hi: int):
-        assert 0 <= lo <= hi < (1 << 16)
+        assert lo <= hi
         self._lo = lo
         self._hi = hi
 
@@ -34,6 +36,8 @@ class Interval(object):
 
 
 class IntervalTreeNodeAug(object):
+    __slots__ = ('max_hi',)
+
     def __init__(self, max_hi=None):
         if not max_hi:
             max_hi = -float('inf')
@@ -44,16 +48,31 @@ def interval_default_key(interval: Interval):
     """
     We use this key for the convenience of ex 14.3-5.
     """
-    return (interval.lo << 16) + interval.hi
+    return interval.lo, interval.hi
 
 
-def interval_tree_create():
+def interval_tree_create(node_class=CompactRBTreeNode):
     """Create an interval tree based on a red-black tree."""
-    rbt = RBTree(key=interval_default_key)
+    rbt = RBTree(interval_default_key, node_class)
     rbt.nil.aug = IntervalTreeNodeAug()
     return rbt
 
 
+def interval_on_subtree_built(node: RBTreeNode):
+    node.aug = IntervalTreeNodeAug()
+    node.aug.max_hi = max(node.left.aug.max_hi, node.right.aug.max_hi, node.data.hi)
+
+
+def interval_tree_from_sorted(intervals, node_class=CompactRBTreeNode) -> RBTree:
+    """
+    Create an interval tree in O(n) time from intervals sorted by interval_default_key, that is by low endpoint and
+    then by high endpoint. See rb_build_sorted.
+    """
+    int_tree = interval_tree_create(node_class)
+    rb_build_sorted(int_tree, intervals, interval_on_subtree_built)
+    return int_tree
+
+
 def interval_update_aug_upwards(int_tree: RBTree, node: RBTreeNode):
     while node != int_tree.nil:
         node.aug.max_hi = max(node.left.aug.max_hi, node.right.aug.max_hi, node.data.hi)
@@ -132,9 +151,73 @@ def interval_search_exactly(int_tree: RBTree, interval: Interval):
     return rb_search(int_tree, interval_default_key(interval))
 
 
+def _interval_search_all(int_tree: RBTree, root: RBTreeNode, interval: Interval, ret: list):
+    if root is int_tree.nil or root.aug.max_hi < interval.lo:
+        return
+    _interval_search_all(int_tree, root.left, interval, ret)
+    if root.data.lo <= interval.hi:
+        if root.data.hi >= interval.lo:
+            ret.append(root)
+        _interval_search_all(int_tree, root.right, interval, ret)
+
+
+def interval_search_all(int_tree: RBTree, interval: Interval) -> list:
+    """
+    Search all intervals in the given interval tree that overlap the given interval, and return their nodes in
+    ascending order of low endpoint. A subtree is skipped when its max_hi is below the given interval, or its low
+    endpoints are above it, so that every other subtree visited holds an overlap. That makes the visited nodes the
+    paths to the k overlaps, in O(min(n, lg n + k lg(n / k))) time, which is O(lg n + k) when the overlaps are adjacent
+    in the tree.
+    """
+    ret = []
+    _interval_search_all(int_tree, int_tree.root, interval, ret)
+    return ret
+
+
+def interval_stab(int_tree: RBTree, point: int) -> list:
+    """Search all intervals in the given interval tree that contain the given point. See interval_search_all."""
+    return interval_search_all(int_tree, Interval(point, point))
+
+
+def overlap_join(int_tree_a: RBTree, int_tree_b: RBTree):
+    """
+    Find all the pairs of overlapping intervals of two interval trees, with a sweep over both trees in ascending order
+    of low endpoint. Each interval is paired with the intervals of the other tree that start no later and are still
+    active, that is end no earlier, which are kept in a heap by high endpoint to expire them. This takes
+    O((n + m) lg(n + m) + k) time for k pairs, however they are spread out.
+    :return: A generator of the (node of int_tree_a, node of int_tree_b) pairs.
+    """
+    iters = (rb_iter_nodes(int_tree_a), rb_iter_nodes(int_tree_b))
+    nexts = [next(iters[0], None), next(iters[1], None)]
+    # The active nodes of each tree, as (high endpoint, sequence number, node).
+    actives = ([], [])
+    seq = 0
+    while True:
+        if nexts[1] is None or (nexts[0] is not None and nexts[0].data.lo <= nexts[1].data.lo):
+            side = 0
+        else:
+            side = 1
+        node = nexts[side]
+        other_active = actives[1 - side]
+        if node is None or (nexts[1 - side] is None and not other_active):
+            break
+        nexts[side] = next(iters[side], None)
+
+        lo = node.data.lo
+        while other_active and other_active[0][0] < lo:
+            heappop(other_active)
+        for _, _, other_node in other_active:
+            yield (node, other_node) if side == 0 else (other_node, node)
+        heappush(actives[side], (node.data.hi, seq, node))
+        seq += 1
+
+
 class TestIntervalTree(TestCase):
     def test_basic(self):
-        int_tree = interval_tree_create()
+        for node_class in (CompactRBTreeNode, RBTreeNode):
+            self._test_basic(interval_tree_create(node_class))
+
+    def _test_basic(self, int_tree: RBTree):
         interval_insert(int_tree, Interval(0, 3))
         interval_insert(int_tree, Interval(5, 8))
         interval_insert(int_tree, Interval(6, 10))
@@ -181,4 +264,46 @@ class TestIntervalTree(TestCase):
         node = interval_search(int_tree, Interval(0, 3))
         self.assertEqual(int_tree.nil, node)
         node = interval_search_min(int_tree, Interval(0, 3))
-        self.assertEqual(int_tree.nil, node)
\ No newline at end of file
+        self.assertEqual(int_tree.nil, node)
+
+    def test_from_sorted(self):
+        intervals = sorted({(randint(0, 100), randint(0, 50)) for _ in range(60)})
+        intervals = sorted((Interval(lo, lo + length) for lo, length in intervals), key=interval_default_key)
+        int_tree = interval_tree_from_sorted(intervals)
+        self.assertSequenceEqual(intervals, list(rb_iter(int_tree)))
+        for _ in range(100):
+            lo = randint(0, 160)
+            query = Interval(lo, lo + randint(0, 10))
+            overlaps = [x for x in intervals if Interval.are_overlapped(x, query)]
+            self.assertEqual(overlaps[0] if overlaps else None, interval_search_min(int_tree, query).data)
+        for x in intervals[::2]:
+            interval_pop(int_tree, interval_search_exactly(int_tree, x))
+        query = Interval(0, 200)
+        self.assertEqual(intervals[1], interval_search_min(int_tree, query).data)
+
+    def test_search_all(self):
+        def intervals_of(nodes):
+            return sorted((node.data.lo, node.data.hi) for node in nodes)
+
+        int_trees = []
+        for _ in range(2):
+            int_tree = interval_tree_create()
+            for _ in range(80):
+                lo = randint(0, 200)
+                interval_insert(int_tree, Interval(lo, lo + randint(0, 20)))
+            int_trees.append(int_tree)
+        intervals = list(rb_iter(int_trees[0]))
+        for _ in range(100):
+            lo = randint(0, 230)
+            query = Interval(lo, lo + randint(0, 30))
+            self.assertListEqual(sorted((x.lo, x.hi) for x in intervals if Interval.are_overlapped(x, query)),
+                                 intervals_of(interval_search_all(int_trees[0], query)))
+            self.assertListEqual(sorted((x.lo, x.hi) for x in intervals if x.lo <= lo <= x.hi),
+                                 intervals_of(interval_stab(int_trees[0], lo)))
+        self.assertListEqual([], interval_search_all(interval_tree_create(), Interval(0, 10)))
+
+        expected = sorted((x.lo, x.hi, y.lo, y.hi) for x in intervals for y in rb_iter(int_trees[1])
+                          if Interval.are_overlapped(x, y))
+        pairs = list(overlap_join(int_trees[0], int_trees[1]))
+        self.assertListEqual(expected, sorted((x.data.lo, x.data.hi, y.data.lo, y.data.hi) for x, y in pairs))
+        self.assertListEqual([], list(overlap_join(int_trees[0], interval_tree_create())))
@@ -0,0 +1,428 @@
+"""
+- Fenwick trees (binary indexed trees) and lazy-propagation segment trees over flat arrays.
+- Indexes start from 0, and ranges [lo, hi] include both ends.
+"""
+
+
+from P3_DataStructures.Augment.dynamic_order_statistics import os_tree_create, os_insert, os_pop, os_count_range
+from array import array
+from unittest import TestCase
+from random import randint
+import time
+
+
+class FenwickTree(object):
+    """Prefix sums with point updates, both in O(lg n) time, in a single array of n + 1 numbers."""
+
+    def __init__(self, n: int, typecode: str = 'q'):
+        """
+        :param n: The number of elements, all 0 at first.
+        :param typecode: The array typecode of the elements, 'q' for 64-bit ints or 'd' for floats.
+        """
+        # _tree[i] is the sum of the elements (i - (i & -i), i], 1-based.
+        self._tree = array(typecode, bytes(array(typecode).itemsize * (n + 1)))
+
+    @staticmethod
+    def from_list(values, typecode: str = 'q') -> 'FenwickTree':
+        """Build a Fenwick tree of the given elements in O(n) time."""
+        ret = FenwickTree(0, typecode)
+        tree = ret._tree = array(typecode, [0])
+        tree.extend(values)
+        n = len(tree) - 1
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        return ret
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def add(self, i: int, delta):
+        """Add delta to the i'th element."""
+        tree = self._tree
+        n = len(tree) - 1
+        assert 0 <= i < n
+        i += 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, i: int):
+        """The sum of the elements [0, i], 0 if i < 0."""
+        tree = self._tree
+        i = min(i, len(tree) - 2) + 1
+        ret = 0
+        while i > 0:
+            ret += tree[i]
+            i -= i & -i
+        return ret
+
+    def range_sum(self, lo: int, hi: int):
+        """The sum of the elements [lo, hi], 0 if hi < lo."""
+        if hi < lo:
+            return 0
+        return self.prefix_sum(hi) - self.prefix_sum(lo - 1)
+
+    def __getitem__(self, i: int):
+        return self.range_sum(i, i)
+
+    def __setitem__(self, i: int, v):
+        self.add(i, v - self[i])
+
+    def lower_bound(self, target) -> int:
+        """
+        The smallest i so that prefix_sum(i) >= target, or len(self) if there's none, in O(lg n) time. The elements
+        must be non-negative.
+        """
+        tree = self._tree
+        n = len(tree) - 1
+        pos = 0
+        step = 1 << n.bit_length()
+        while step:
+            if pos + step <= n and tree[pos + step] < target:
+                pos += step
+                target -= tree[pos]
+            step >>= 1
+        return pos
+
+
+class RangeFenwickTree(object):
+    """
+    Range updates and range sums, both in O(lg n) time, with two Fenwick trees b1 and b2 of a difference array, so that
+    prefix_sum(i) = b1.prefix_sum(i) * (i + 1) - b2.prefix_sum(i).
+    """
+
+    def __init__(self, n: int, typecode: str = 'q'):
+        self._b1 = FenwickTree(n + 1, typecode)
+        self._b2 = FenwickTree(n + 1, typecode)
+
+    def __len__(self):
+        return len(self._b1) - 1
+
+    def range_add(self, lo: int, hi: int, delta):
+        """Add delta to the elements [lo, hi]."""
+        assert 0 <= lo <= hi < len(self)
+        self._b1.add(lo, delta)
+        self._b1.add(hi + 1, -delta)
+        self._b2.add(lo, delta * lo)
+        self._b2.add(hi + 1, -delta * (hi + 1))
+
+    def prefix_sum(self, i: int):
+        """The sum of the elements [0, i], 0 if i < 0."""
+        if i < 0:
+            return 0
+        i = min(i, len(self) - 1)
+        return self._b1.prefix_sum(i) * (i + 1) - self._b2.prefix_sum(i)
+
+    def range_sum(self, lo: int, hi: int):
+        """The sum of the elements [lo, hi], 0 if hi < lo."""
+        if hi < lo:
+            return 0
+        return self.prefix_sum(hi) - self.prefix_sum(lo - 1)
+
+    def __getitem__(self, i: int):
+        return self._b1.prefix_sum(i)
+
+
+class FenwickCounts(object):
+    """
+    Multiset of ints in the domain [min_key, max_key], as a Fenwick tree of the count of each key. Insertions,
+    removals, range counts and rank selections all take O(lg k) time for a domain of k keys, in 8 * (k + 1) bytes.
+    """
+
+    def __init__(self, min_key: int, max_key: int):
+        assert min_key <= max_key
+        self._min_key = min_key
+        self._max_key = max_key
+        self._counts = FenwickTree(max_key - min_key + 1)
+        self._len = 0
+
+    @staticmethod
+    def from_keys(keys, min_key: int = None, max_key: int = None) -> 'FenwickCounts':
+        """Build the multiset of the given keys in O(n + k) time, with the domain of the keys by default."""
+        keys = keys if isinstance(keys, (list, tuple)) else list(keys)
+        if min_key is None:
+            min_key = min(keys, default=0)
+        if max_key is None:
+            max_key = max(keys, default=min_key)
+        ret = FenwickCounts(min_key, max_key)
+        counts = [0] * (max_key - min_key + 1)
+        for k in keys:
+            ret._check_key(k)
+            counts[k - min_key] += 1
+        ret._counts = FenwickTree.from_list(counts)
+        ret._len = len(keys)
+        return ret
+
+    def _check_key(self, k: int):
+        if not self._min_key <= k <= self._max_key:
+            raise ValueError('Key %r out of [%d, %d]' % (k, self._min_key, self._max_key))
+
+    @property
+    def min_key(self) -> int:
+        return self._min_key
+
+    @property
+    def max_key(self) -> int:
+        return self._max_key
+
+    def __len__(self):
+        return self._len
+
+    def add(self, k: int, count: int = 1):
+        self._check_key(k)
+        self._counts.add(k - self._min_key, count)
+        self._len += count
+
+    def remove(self, k: int, count: int = 1):
+        self._check_key(k)
+        if self.count(k) < count:
+            raise KeyError(str(k))
+        self._counts.add(k - self._min_key, -count)
+        self._len -= count
+
+    def count(self, k: int) -> int:
+        """The number of occurrences of k."""
+        if not self._min_key <= k <= self._max_key:
+            return 0
+        return self._counts[k - self._min_key]
+
+    def count_range(self, lo: int, hi: int) -> int:
+        """The number of keys in [lo, hi], which may go beyond the domain."""
+        return self._counts.range_sum(max(lo, self._min_key) - self._min_key, min(hi, self._max_key) - self._min_key)
+
+    def select(self, i: int) -> int:
+        """The i'th smallest key, starting from 1."""
+        assert 1 <= i <= self._len
+        return self._min_key + self._counts.lower_bound(i)
+
+
+class LazySegmentTree(object):
+    """
+    Range updates (adding to every element of a range) and range sum, min and max queries, all in O(lg n) time. The
+    tree is implicit: node 1 is the root, and node i has children 2i and 2i + 1, and each node's aggregates and pending
+    addition are in one of four flat arrays of 4n numbers. A range update stops at the O(lg n) nodes that cover the
+    range, and leaves its delta in their pending additions, which are pushed down to the children when a later
+    operation goes through.
+    """
+
+    def __init__(self, values, typecode: str = 'q'):
+        """
+        :param values: The initial elements.
+        :param typecode: The array typecode of the elements, 'q' for 64-bit ints or 'd' for floats.
+        """
+        values = values if isinstance(values, (list, tuple, array)) else list(values)
+        assert values, 'No elements'
+        self._n = len(values)
+        size = 4 * self._n
+        empty = bytes(array(typecode).itemsize * size)
+        self._sum = array(typecode, empty)
+        self._min = array(typecode, empty)
+        self._max = array(typecode, empty)
+        self._pending = array(typecode, empty)
+        self._build(1, 0, self._n - 1, values)
+
+    def _build(self, node: int, l: int, r: int, values):
+        if l == r:
+            self._sum[node] = self._min[node] = self._max[node] = values[l]
+            return
+        mid = (l + r) >> 1
+        self._build(2 * node, l, mid, values)
+        self._build(2 * node + 1, mid + 1, r, values)
+        self._pull(node)
+
+    def _pull(self, node: int):
+        left, right = 2 * node, 2 * node + 1
+        self._sum[node] = self._sum[left] + self._sum[right]
+        self._min[node] = min(self._min[left], self._min[right])
+        self._max[node] = max(self._max[left], self._max[right])
+
+    def _apply(self, node: int, length: int, delta):
+        self._sum[node] += delta * length
+        self._min[node] += delta
+        self._max[node] += delta
+        self._pending[node] += delta
+
+    def _push(self, node: int, l: int, mid: int, r: int):
+        delta = self._pending[node]
+        if delta:
+            self._apply(2 * node, mid - l + 1, delta)
+            self._apply(2 * node + 1, r - mid, delta)
+            self._pending[node] = 0
+
+    def __len__(self):
+        return self._n
+
+    def range_add(self, lo: int, hi: int, delta):
+        """Add delta to the elements [lo, hi]."""
+        assert 0 <= lo <= hi < self._n
+        self._range_add(1, 0, self._n - 1, lo, hi, delta)
+
+    def _range_add(self, node: int, l: int, r: int, lo: int, hi: int, delta):
+        if lo <= l and r <= hi:
+            self._apply(node, r - l + 1, delta)
+            return
+        mid = (l + r) >> 1
+        self._push(node, l, mid, r)
+        if lo <= mid:
+            self._range_add(2 * node, l, mid, lo, hi, delta)
+        if hi > mid:
+            self._range_add(2 * node + 1, mid + 1, r, lo, hi, delta)
+        self._pull(node)
+
+    def _query(self, aggregates: array, combine, node: int, l: int, r: int, lo: int, hi: int):
+        if lo <= l and r <= hi:
+            return aggregates[node]
+        mid = (l + r) >> 1
+        self._push(node, l, mid, r)
+        if hi <= mid:
+            return self._query(aggregates, combine, 2 * node, l, mid, lo, hi)
+        if lo > mid:
+            return self._query(aggregates, combine, 2 * node + 1, mid + 1, r, lo, hi)
+        return combine(self._query(aggregates, combine, 2 * node, l, mid, lo, hi),
+                       self._query(aggregates, combine, 2 * node + 1, mid + 1, r, lo, hi))
+
+    def range_sum(self, lo: int, hi: int):
+        assert 0 <= lo <= hi < self._n
+        return self._query(self._sum, _add, 1, 0, self._n - 1, lo, hi)
+
+    def range_min(self, lo: int, hi: int):
+        assert 0 <= lo <= hi < self._n
+        return self._query(self._min, min, 1, 0, self._n - 1, lo, hi)
+
+    def range_max(self, lo: int, hi: int):
+        assert 0 <= lo <= hi < self._n
+        return self._query(self._max, max, 1, 0, self._n - 1, lo, hi)
+
+    def __getitem__(self, i: int):
+        return self.range_sum(i, i)
+
+    def __setitem__(self, i: int, v):
+        self.range_add(i, i, v - self[i])
+
+
+def _add(x, y):
+    return x + y
+
+
+class TestRangeQueryTrees(TestCase):
+    def test_fenwick_tree(self):
+        for n in (1, 2, 7, 64, 100):
+            values = [randint(0, 9) for _ in range(n)]
+            trees = (FenwickTree.from_list(values), FenwickTree(n))
+            for i, v in enumerate(values):
+                trees[1].add(i, v)
+            for _ in range(100):
+                i = randint(0, n - 1)
+                values[i] = randint(0, 9)
+                for tree in trees:
+                    tree[i] = values[i]
+                lo, hi = randint(-1, n), randint(-1, n)
+                for tree in trees:
+                    self.assertEqual(sum(values[max(0, lo):hi + 1]), tree.range_sum(lo, hi))
+                    self.assertEqual(sum(values[:hi + 1]), tree.prefix_sum(hi))
+                target = randint(0, sum(values) + 1)
+                expected = next((i for i in range(n) if sum(values[:i + 1]) >= target), n)
+                self.assertEqual(expected, trees[0].lower_bound(target))
+
+    def test_range_fenwick_tree(self):
+        n = 50
+        values = [0] * n
+        tree = RangeFenwickTree(n)
+        for _ in range(200):
+            lo = randint(0, n - 1)
+            hi = randint(lo, n - 1)
+            delta = randint(-5, 5)
+            tree.range_add(lo, hi, delta)
+            for i in range(lo, hi + 1):
+                values[i] += delta
+            lo, hi = randint(-1, n), randint(-1, n)
+            self.assertEqual(sum(values[max(0, lo):hi + 1]), tree.range_sum(lo, hi))
+            i = randint(0, n - 1)
+            self.assertEqual(values[i], tree[i])
+
+    def test_fenwick_counts(self):
+        keys = [randint(-20, 20) for _ in range(100)]
+        counts = FenwickCounts.from_keys(keys, -30, 30)
+        for _ in range(300):
+            if keys and randint(0, 1):
+                k = keys.pop(randint(0, len(keys) - 1))
+                counts.remove(k)
+            else:
+                k = randint(-30, 30)
+                keys.append(k)
+                counts.add(k)
+            lo, hi = randint(-40, 40), randint(-40, 40)
+            self.assertEqual(sum(1 for k in keys if lo <= k <= hi), counts.count_range(lo, hi))
+            self.assertEqual(len(keys), len(counts))
+            if keys:
+                i = randint(1, len(keys))
+                self.assertEqual(sorted(keys)[i - 1], counts.select(i))
+        self.assertRaises(ValueError, lambda: counts.add(31))
+        self.assertRaises(KeyError, lambda: counts.remove(next(k for k in range(-30, 31) if k not in keys)))
+        self.assertEqual(0, len(FenwickCounts.from_keys([])))
+
+    def test_lazy_segment_tree(self):
+        for typecode in ('q', 'd'):
+            n = 37
+            values = [randint(-9, 9) for _ in range(n)]
+            tree = LazySegmentTree(values, typecode)
+            for _ in range(300):
+                lo = randint(0, n - 1)
+                hi = randint(lo, n - 1)
+                op = randint(0, 2)
+                if op == 0:
+                    delta = randint(-5, 5)
+                    tree.range_add(lo, hi, delta)
+                    for i in range(lo, hi + 1):
+                        values[i] += delta
+                elif op == 1:
+                    values[lo] = randint(-9, 9)
+                    tree[lo] = values[lo]
+                self.assertEqual(sum(values[lo:hi + 1]), tree.range_sum(lo, hi))
+                self.assertEqual(min(values[lo:hi + 1]), tree.range_min(lo, hi))
+                self.assertEqual(max(values[lo:hi + 1]), tree.range_max(lo, hi))
+            self.assertListEqual(values, [tree[i] for i in range(n)])
+
+
+def _main():
+    from P2_Sorting.LinearTimeSorting.counting_sort import query_count_in_range
+    key_domain = 1 << 16
+    n = 100000
+    op_count = 2000
+    keys = [randint(0, key_domain - 1) for _ in range(n)]
+    ops = [(randint(0, n - 1), randint(0, key_domain - 1), randint(0, key_domain - 1), randint(0, key_domain - 1))
+           for _ in range(op_count)]
+
+    # Each op replaces a key, then counts the keys in a range.
+    cases = (
+        ('query_count_in_range on a list', lambda: list(keys)),
+        ('query_count_in_range on FenwickCounts', lambda: FenwickCounts.from_keys(keys, 0, key_domain - 1)),
+    )
+    for desc, create in cases:
+        data = create()
+        current = list(keys)
+        start_time = time.time()
+        for i, k, lo, hi in ops:
+            if isinstance(data, FenwickCounts):
+                data.remove(current[i])
+                data.add(k)
+            else:
+                data[i] = k
+            current[i] = k
+            query_count_in_range(data, ((lo, hi),))
+        print('%s: %.0f updates with a range count per second.' % (desc, op_count / (time.time() - start_time)))
+
+    ost = os_tree_create()
+    nodes = [os_insert(ost, k) for k in keys]
+    start_time = time.time()
+    for i, k, lo, hi in ops:
+        os_pop(ost, nodes[i])
+        nodes[i] = os_insert(ost, k)
+        os_count_range(ost, lo, hi)
+    print('OS tree: %.0f updates with a range count per second.' % (op_count / (time.time() - start_time)))
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,273 @@
+from P3_DataStructures.Augment.interval_tree import Interval, interval_default_key, interval_tree_from_sorted, \
+    interval_search_all
+from array import array
+from heapq import heappush, heappop
+from unittest import TestCase
+from random import randint
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+_MAGIC = b'SII2'
+_HEADER = struct.Struct('<4sc3xQ')  # magic, typecode of the endpoint arrays, interval count.
+_TYPECODE = 'q'
+_LEAF_SIZE = 8  # Ranges up to this long are scanned rather than split.
+
+
+class StaticIntervalIndex(object):
+    """
+    Build-once interval index: the intervals sorted by interval_default_key in flat arrays of 64-bit low and high
+    endpoints, with an implicit balanced search tree over them. The tree node of the range [l, r) of the arrays is its
+    middle (l + r) // 2, whose entry of the max_hi array is the maximum high endpoint in the range, like the max_hi
+    augmentation of the interval tree, and short ranges are leaves that are scanned.
+
+    Batches of queries are answered by a single sweep over the intervals and the sorted queries, unless the batch is
+    too small to pay for visiting every interval. The arrays are saved as they are, so that a loaded index queries the
+    memory-mapped file directly.
+    """
+
+    def __init__(self):
+        self._los = array(_TYPECODE)
+        self._his = array(_TYPECODE)
+        self._max_his = array(_TYPECODE)
+        # The Interval objects the index was built from, by position in the arrays, None for a loaded index.
+        self._intervals = []
+        self._buffer = None
+        self._mmap = None
+
+    @staticmethod
+    def build(intervals) -> 'StaticIntervalIndex':
+        """Build an index of the given intervals in O(n lg n) time, O(n) if they're sorted by interval_default_key."""
+        ret = StaticIntervalIndex()
+        ret._intervals = sorted(intervals, key=interval_default_key)
+        ret._los = array(_TYPECODE, (x.lo for x in ret._intervals))
+        ret._his = array(_TYPECODE, (x.hi for x in ret._intervals))
+        ret._max_his = array(_TYPECODE, ret._his)
+        ret._build_max_his(0, len(ret._intervals))
+        return ret
+
+    def _build_max_his(self, l: int, r: int) -> int:
+        if r - l <= _LEAF_SIZE:
+            return max(self._his[l:r], default=-(1 << 63))
+        mid = (l + r) >> 1
+        self._max_his[mid] = max(self._build_max_his(l, mid), self._build_max_his(mid + 1, r), self._his[mid])
+        return self._max_his[mid]
+
+    def __len__(self):
+        return len(self._los)
+
+    def _interval(self, i: int) -> Interval:
+        return Interval(self._los[i], self._his[i]) if self._intervals is None else self._intervals[i]
+
+    def _search(self, lo: int, hi: int) -> list:
+        """:return: The positions of the intervals that overlap [lo, hi], in ascending order."""
+        los, his, max_his = self._los, self._his, self._max_his
+        ret = []
+        # An in-order traversal, where the middle of a node is pushed as a leaf range of its own.
+        stack = [(0, len(los))]
+        while stack:
+            l, r = stack.pop()
+            if r - l <= _LEAF_SIZE:
+                for i in range(l, r):
+                    if los[i] > hi:
+                        break
+                    if his[i] >= lo:
+                        ret.append(i)
+                continue
+            mid = (l + r) >> 1
+            if max_his[mid] < lo:
+                continue
+            if los[mid] <= hi:
+                stack.append((mid + 1, r))
+                stack.append((mid, mid + 1))
+            stack.append((l, mid))
+        return ret
+
+    def search(self, interval: Interval) -> list:
+        """
+        :return: The intervals that overlap the given interval, in ascending order of interval_default_key, in
+        O(min(n, lg n + k lg(n / k))) time, see interval_search_all.
+        """
+        return [self._interval(i) for i in self._search(interval.lo, interval.hi)]
+
+    def stab(self, point: int) -> list:
+        """:return: The intervals that contain the given point. See search."""
+        return [self._interval(i) for i in self._search(point, point)]
+
+    def search_batch(self, intervals) -> list:
+        """
+        :return: For each of the given intervals, the list of the intervals that overlap it, like search. A batch of m
+        queries takes O((n + m) lg(n + m) + k) time with the sweep, and separate searches are used instead when m lg n
+        is below n.
+        """
+        queries = list(intervals)
+        if len(queries) * max(1, len(self).bit_length()) < len(self):
+            return [self.search(query) for query in queries]
+        return [[self._interval(i) for i in positions] for positions in self._sweep(queries)]
+
+    def stab_batch(self, points) -> list:
+        """:return: For each of the given points, the list of the intervals that contain it. See search_batch."""
+        return self.search_batch(Interval(point, point) for point in points)
+
+    def _sweep(self, queries: list) -> list:
+        """
+        Sweep over the intervals and the queries in ascending order of low endpoint. Each one is paired with the
+        active ones of the other kind, that started no later and end no earlier, which are kept in heaps by high
+        endpoint to expire them.
+        :return: For each query, the positions of the intervals that overlap it, in ascending order.
+        """
+        los, his = self._los, self._his
+        n = len(los)
+        order = sorted(range(len(queries)), key=lambda _q: queries[_q].lo)
+        ret = [[] for _ in queries]
+        active_intervals = []  # (hi, position)
+        active_queries = []  # (hi, query index)
+        i = 0
+        for q in order:
+            query_lo = queries[q].lo
+            # The intervals starting no later than the query go first, so that ties overlap once.
+            while i < n and los[i] <= query_lo:
+                lo = los[i]
+                while active_queries and active_queries[0][0] < lo:
+                    heappop(active_queries)
+                for _, active_q in active_queries:
+                    ret[active_q].append(i)
+                heappush(active_intervals, (his[i], i))
+                i += 1
+            while active_intervals and active_intervals[0][0] < query_lo:
+                heappop(active_intervals)
+            ret[q] = sorted(position for _, position in active_intervals)
+            heappush(active_queries, (queries[q].hi, q))
+        while i < n and active_queries:
+            lo = los[i]
+            while active_queries and active_queries[0][0] < lo:
+                heappop(active_queries)
+            for _, active_q in active_queries:
+                ret[active_q].append(i)
+            i += 1
+        return ret
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self._los.typecode.encode(), len(self)))
+            for table in (self._los, self._his, self._max_his):
+                if sys.byteorder != 'little':
+                    table = array(table.typecode, table)
+                    table.byteswap()
+                f.write(table.tobytes())
+
+    @staticmethod
+    def load(path: str) -> 'StaticIntervalIndex':
+        """
+        Memory-map an index saved by save, which is queried without reading the arrays in, and returns new Interval
+        objects. See close.
+        """
+        ret = StaticIntervalIndex()
+        ret._intervals = None
+        with open(path, 'rb') as f:
+            ret._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(ret._mmap) < _HEADER.size:
+                raise ValueError('Not an interval index file: %s' % path)
+            magic, typecode, n = _HEADER.unpack_from(ret._mmap)
+            typecode = typecode.decode('ascii', 'replace')
+            if magic != _MAGIC or typecode not in ('i', 'q'):
+                raise ValueError('Not an interval index file: %s' % path)
+            size = n * array(typecode).itemsize
+            if _HEADER.size + 3 * size > len(ret._mmap):
+                raise ValueError('Truncated interval index file: %s' % path)
+            buffer = ret._buffer = memoryview(ret._mmap)
+            tables = []
+            for offset in range(_HEADER.size, _HEADER.size + 3 * size, size):
+                table = buffer[offset:offset + size].cast(typecode)
+                if sys.byteorder != 'little':
+                    table = array(typecode, table)
+                    table.byteswap()
+                tables.append(table)
+            ret._los, ret._his, ret._max_his = tables
+        except Exception:
+            ret.close()
+            raise
+        return ret
+
+    def close(self):
+        """Unmap the file of a loaded index, which can't be queried anymore."""
+        if self._mmap is not None:
+            for table in (self._los, self._his, self._max_his, self._buffer):
+                if isinstance(table, memoryview):
+                    table.release()
+            self._los = self._his = self._max_his = self._buffer = None
+            self._mmap.close()
+            self._mmap = None
+
+
+class TestStaticIntervalIndex(TestCase):
+    def test_queries(self):
+        for n in (0, 1, 5, 300):
+            intervals = []
+            for _ in range(n):
+                lo = randint(0, 1000)
+                intervals.append(Interval(lo, lo + randint(0, 50)))
+            index = StaticIntervalIndex.build(intervals)
+            self.assertEqual(n, len(index))
+            sorted_intervals = sorted(intervals, key=interval_default_key)
+            queries = []
+            for _ in range(200):
+                lo = randint(0, 1100)
+                queries.append(Interval(lo, lo + randint(0, 30)))
+            expected = [[x for x in sorted_intervals if Interval.are_overlapped(x, query)] for query in queries]
+            for query, overlaps in zip(queries, expected):
+                self.assertListEqual(overlaps, index.search(query))
+                self.assertListEqual([x for x in sorted_intervals if x.lo <= query.lo <= x.hi], index.stab(query.lo))
+            self.assertListEqual(expected, index.search_batch(queries))
+            self.assertListEqual(expected[:3], index.search_batch(queries[:3]))
+            self.assertListEqual([index.stab(query.lo) for query in queries],
+                                 index.stab_batch(query.lo for query in queries))
+            self.assertTrue(all(any(x is y for y in intervals) for overlaps in expected for x in overlaps))
+
+    def test_files(self):
+        # Endpoints beyond 32 bits.
+        intervals = [Interval(lo, lo + randint(0, 20)) for lo in range(-(1 << 40), -(1 << 40) + 30, 3)]
+        intervals += [Interval(lo, lo + randint(0, 20)) for lo in range(0, 3000, 3)]
+        index = StaticIntervalIndex.build(intervals)
+        queries = [Interval(lo, lo + 5) for lo in range(0, 3100, 7)] + [Interval(-(1 << 40) + 4, -(1 << 40) + 6)]
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'intervals.bin')
+            index.save(path)
+            loaded = StaticIntervalIndex.load(path)
+            self.assertEqual(len(intervals), len(loaded))
+            self.assertListEqual(index.search_batch(queries), loaded.search_batch(queries))
+            self.assertListEqual(index.stab(100), loaded.stab(100))
+            loaded.close()
+            with open(path, 'r+b') as f:
+                f.truncate(100)
+            self.assertRaises(ValueError, lambda: StaticIntervalIndex.load(path))
+
+
+def _main():
+    n = 200000
+    intervals = sorted((Interval(lo, lo + randint(0, 30)) for lo in (randint(0, 60000) for _ in range(n))),
+                       key=interval_default_key)
+    queries = [Interval(lo, lo + randint(0, 10)) for lo in (randint(0, 60000) for _ in range(n))]
+    for desc, build in (('Interval tree', interval_tree_from_sorted),
+                        ('StaticIntervalIndex', StaticIntervalIndex.build)):
+        tracemalloc.start()
+        structure = build(intervals)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start_time = time.time()
+        if isinstance(structure, StaticIntervalIndex):
+            k = sum(len(overlaps) for overlaps in structure.search_batch(queries))
+        else:
+            k = sum(len(interval_search_all(structure, query)) for query in queries)
+        print('%s: %.1f bytes/interval, %d queries in %.2fs, %d overlaps.' %
+              (desc, memory / n, len(queries), time.time() - start_time, k))
+
+
+if __name__ == '__main__':
+    _main()
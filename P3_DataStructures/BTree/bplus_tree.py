@@ -0,0 +1,585 @@
+from Common.map import Map
+from bisect import bisect_left, bisect_right
+from unittest import TestCase
+from random import randint, shuffle
+import time
+import tracemalloc
+
+
+DEFAULT_FAN_OUT = 64
+
+
+class _Leaf(object):
+    """Up to fan_out sorted keys with their values in parallel lists, linked to the neighbouring leaves."""
+    __slots__ = ('keys', 'values', 'prev', 'next')
+
+    def __init__(self, keys: list, values: list):
+        self.keys = keys
+        self.values = values
+        self.prev = self.next = None
+
+
+class _Internal(object):
+    """
+    Up to fan_out separator keys and one more child. The keys in children[i] are no less than keys[i - 1] and less
+    than keys[i], and counts[i] is the number of entries under children[i].
+    """
+    __slots__ = ('keys', 'children', 'counts')
+
+    def __init__(self, keys: list, children: list, counts: list):
+        self.keys = keys
+        self.children = children
+        self.counts = counts
+
+
+def _size(node) -> int:
+    return len(node.keys) if type(node) is _Leaf else sum(node.counts)
+
+
+class BPlusTreeMap(Map):
+    """
+    Sorted map in a B+-tree. Each node keeps its keys, and its values or children, in flat lists searched with bisect,
+    so a lookup visits about log_{fan_out / 2} n nodes instead of lg n. All entries live in the leaves, which are
+    doubly linked for range scans. Every node except the root holds at least fan_out // 2 keys. Internal nodes count
+    the entries under each child, for rank queries.
+
+    It has the same API as SortedMap, so either one can back a Graph.
+    """
+    def __init__(self, fan_out: int = DEFAULT_FAN_OUT):
+        """
+        :param fan_out: The maximum number of keys per node, at least 3.
+        """
+        super().__init__()
+        assert fan_out >= 3
+        self._fan_out = fan_out
+        self._min_keys = fan_out // 2
+        self._root = _Leaf([], [])
+        self._len = 0
+
+    @staticmethod
+    def from_sorted(items, fan_out: int = DEFAULT_FAN_OUT) -> 'BPlusTreeMap':
+        """
+        Bulk-loads (key, value) pairs in strictly increasing key order in O(n) time. Entries are spread evenly over
+        as few leaves as possible, and the internal levels are built bottom-up the same way.
+        """
+        bpt = BPlusTreeMap(fan_out)
+        bpt._build_sorted(items)
+        return bpt
+
+    def update_sorted(self, items):
+        """
+        Merges (key, value) pairs in strictly increasing key order into this map, overwriting the values of existing
+        keys. A batch that's small against the map is inserted key by key, otherwise the map is bulk-loaded again
+        from the merge of both sorted sequences.
+        """
+        items = list(items)
+        if len(items) * self._len.bit_length() < self._len:
+            for k, v in items:
+                self[k] = v
+            return
+        merged = []
+        old_items = self.items()
+        old_item = next(old_items, None)
+        for new_item in items:
+            while old_item is not None and old_item[0] < new_item[0]:
+                merged.append(old_item)
+                old_item = next(old_items, None)
+            if old_item is not None and old_item[0] == new_item[0]:
+                old_item = next(old_items, None)
+            merged.append(new_item)
+        while old_item is not None:
+            merged.append(old_item)
+            old_item = next(old_items, None)
+        self._build_sorted(merged)
+
+    def _build_sorted(self, items):
+        keys, values = [], []
+        for k, v in items:
+            assert not keys or keys[-1] < k, 'Keys are not strictly increasing'
+            keys.append(k)
+            values.append(v)
+        self._len = len(keys)
+        if not keys:
+            self._root = _Leaf([], [])
+            return
+
+        nodes = []
+        low_keys = []  # The smallest key under each node.
+        sizes = []  # The number of entries under each node.
+        for lo, hi in _even_ranges(len(keys), self._fan_out):
+            leaf = _Leaf(keys[lo:hi], values[lo:hi])
+            if nodes:
+                nodes[-1].next = leaf
+                leaf.prev = nodes[-1]
+            nodes.append(leaf)
+            low_keys.append(keys[lo])
+            sizes.append(hi - lo)
+        while len(nodes) > 1:
+            parents, parent_low_keys, parent_sizes = [], [], []
+            for lo, hi in _even_ranges(len(nodes), self._fan_out + 1):
+                parents.append(_Internal(low_keys[lo + 1:hi], nodes[lo:hi], sizes[lo:hi]))
+                parent_low_keys.append(low_keys[lo])
+                parent_sizes.append(sum(sizes[lo:hi]))
+            nodes, low_keys, sizes = parents, parent_low_keys, parent_sizes
+        self._root = nodes[0]
+
+    def _find_leaf(self, k) -> _Leaf:
+        node = self._root
+        while type(node) is _Internal:
+            node = node.children[bisect_right(node.keys, k)]
+        return node
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, k):
+        leaf = self._find_leaf(k)
+        i = bisect_left(leaf.keys, k)
+        return i < len(leaf.keys) and leaf.keys[i] == k
+
+    def __getitem__(self, k):
+        leaf = self._find_leaf(k)
+        i = bisect_left(leaf.keys, k)
+        if i < len(leaf.keys) and leaf.keys[i] == k:
+            return leaf.values[i]
+        raise KeyError(str(k))
+
+    def __setitem__(self, k, v):
+        path = []
+        node = self._root
+        while type(node) is _Internal:
+            i = bisect_right(node.keys, k)
+            path.append((node, i))
+            node = node.children[i]
+        keys = node.keys
+        i = bisect_left(keys, k)
+        if i < len(keys) and keys[i] == k:
+            node.values[i] = v
+            return
+        keys.insert(i, k)
+        node.values.insert(i, v)
+        self._len += 1
+        for parent, i in path:
+            parent.counts[i] += 1
+        if len(keys) <= self._fan_out:
+            return
+
+        # Split overflowing nodes bottom-up.
+        while len(node.keys) > self._fan_out:
+            mid = len(node.keys) // 2
+            if type(node) is _Leaf:
+                right = _Leaf(node.keys[mid:], node.values[mid:])
+                del node.keys[mid:], node.values[mid:]
+                right.prev, right.next = node, node.next
+                if node.next:
+                    node.next.prev = right
+                node.next = right
+                separator = right.keys[0]
+            else:
+                separator = node.keys[mid]
+                right = _Internal(node.keys[mid + 1:], node.children[mid + 1:], node.counts[mid + 1:])
+                del node.keys[mid:], node.children[mid + 1:], node.counts[mid + 1:]
+            if not path:
+                self._root = _Internal([separator], [node, right], [_size(node), _size(right)])
+                return
+            parent, i = path.pop()
+            parent.keys.insert(i, separator)
+            parent.children.insert(i + 1, right)
+            right_size = _size(right)
+            parent.counts[i] -= right_size
+            parent.counts.insert(i + 1, right_size)
+            node = parent
+
+    def pop(self, k):
+        path = []
+        node = self._root
+        while type(node) is _Internal:
+            i = bisect_right(node.keys, k)
+            path.append((node, i))
+            node = node.children[i]
+        i = bisect_left(node.keys, k)
+        if i >= len(node.keys) or node.keys[i] != k:
+            raise KeyError(str(k))
+        del node.keys[i], node.values[i]
+        self._len -= 1
+        for parent, i in path:
+            parent.counts[i] -= 1
+
+        # Rebalance underflowing nodes bottom-up, borrowing from a sibling if it can spare a key and merging otherwise.
+        min_keys = self._min_keys
+        while path and len(node.keys) < min_keys:
+            parent, i = path.pop()
+            left = parent.children[i - 1] if i > 0 else None
+            right = parent.children[i + 1] if i + 1 < len(parent.children) else None
+            if type(node) is _Leaf:
+                if left and len(left.keys) > min_keys:
+                    node.keys.insert(0, left.keys.pop())
+                    node.values.insert(0, left.values.pop())
+                    parent.keys[i - 1] = node.keys[0]
+                    parent.counts[i - 1] -= 1
+                    parent.counts[i] += 1
+                elif right and len(right.keys) > min_keys:
+                    node.keys.append(right.keys.pop(0))
+                    node.values.append(right.values.pop(0))
+                    parent.keys[i] = right.keys[0]
+                    parent.counts[i + 1] -= 1
+                    parent.counts[i] += 1
+                else:
+                    if not left:
+                        node, right, i = right, None, i + 1
+                        left = parent.children[i - 1]
+                    left.keys.extend(node.keys)
+                    left.values.extend(node.values)
+                    left.next = node.next
+                    if node.next:
+                        node.next.prev = left
+                    parent.counts[i - 1] += parent.counts[i]
+                    del parent.keys[i - 1], parent.children[i], parent.counts[i]
+            else:
+                if left and len(left.keys) > min_keys:
+                    node.keys.insert(0, parent.keys[i - 1])
+                    parent.keys[i - 1] = left.keys.pop()
+                    node.children.insert(0, left.children.pop())
+                    count = left.counts.pop()
+                    node.counts.insert(0, count)
+                    parent.counts[i - 1] -= count
+                    parent.counts[i] += count
+                elif right and len(right.keys) > min_keys:
+                    node.keys.append(parent.keys[i])
+                    parent.keys[i] = right.keys.pop(0)
+                    node.children.append(right.children.pop(0))
+                    count = right.counts.pop(0)
+                    node.counts.append(count)
+                    parent.counts[i + 1] -= count
+                    parent.counts[i] += count
+                else:
+                    if not left:
+                        node, right, i = right, None, i + 1
+                        left = parent.children[i - 1]
+                    left.keys.append(parent.keys[i - 1])
+                    left.keys.extend(node.keys)
+                    left.children.extend(node.children)
+                    left.counts.extend(node.counts)
+                    parent.counts[i - 1] += parent.counts[i]
+                    del parent.keys[i - 1], parent.children[i], parent.counts[i]
+            node = parent
+        if type(self._root) is _Internal and not self._root.keys:
+            self._root = self._root.children[0]
+
+    def _first_leaf(self) -> _Leaf:
+        node = self._root
+        while type(node) is _Internal:
+            node = node.children[0]
+        return node
+
+    def _last_leaf(self) -> _Leaf:
+        node = self._root
+        while type(node) is _Internal:
+            node = node.children[-1]
+        return node
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Iterates over the (key, value) pairs with keys between lo and hi lazily, after an O(log n) seek, by walking
+        the leaf chain. The map must not be modified during the iteration.
+        :param lo: The lower bound, None for no bound.
+        :param hi: The upper bound, None for no bound.
+        :param inclusive: Whether lo and hi themselves are included.
+        :param reverse: Whether to go from hi down to lo.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        if not reverse:
+            if lo is None:
+                leaf, i = self._first_leaf(), 0
+            else:
+                leaf = self._find_leaf(lo)
+                i = (bisect_left if lo_inclusive else bisect_right)(leaf.keys, lo)
+            while leaf:
+                keys, values = leaf.keys, leaf.values
+                end = len(keys)
+                if hi is not None and keys and (keys[-1] > hi or (not hi_inclusive and keys[-1] == hi)):
+                    end = (bisect_right if hi_inclusive else bisect_left)(keys, hi, i)
+                    for j in range(i, end):
+                        yield keys[j], values[j]
+                    return
+                for j in range(i, end):
+                    yield keys[j], values[j]
+                leaf, i = leaf.next, 0
+        else:
+            if hi is None:
+                leaf = self._last_leaf()
+                i = len(leaf.keys)
+            else:
+                leaf = self._find_leaf(hi)
+                i = (bisect_right if hi_inclusive else bisect_left)(leaf.keys, hi)
+            while leaf:
+                keys, values = leaf.keys, leaf.values
+                if lo is not None and keys and (keys[0] < lo or (not lo_inclusive and keys[0] == lo)):
+                    start = (bisect_left if lo_inclusive else bisect_right)(keys, lo, 0, i)
+                    for j in range(i - 1, start - 1, -1):
+                        yield keys[j], values[j]
+                    return
+                for j in range(i - 1, -1, -1):
+                    yield keys[j], values[j]
+                leaf = leaf.prev
+                if leaf:
+                    i = len(leaf.keys)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """The same as irange_items, with keys only."""
+        for k, _ in self.irange_items(lo, hi, inclusive, reverse):
+            yield k
+
+    def items(self):
+        leaf = self._first_leaf()
+        while leaf:
+            yield from zip(leaf.keys, leaf.values)
+            leaf = leaf.next
+
+    def keys(self):
+        leaf = self._first_leaf()
+        while leaf:
+            yield from leaf.keys
+            leaf = leaf.next
+
+    def values(self):
+        leaf = self._first_leaf()
+        while leaf:
+            yield from leaf.values
+            leaf = leaf.next
+
+    def __iter__(self):
+        return self.keys()
+
+    def __reversed__(self):
+        return self.irange(reverse=True)
+
+    def floor(self, k):
+        """The (key, value) pair with the largest key no greater than k. Raises a KeyError if there's none."""
+        leaf = self._find_leaf(k)
+        i = bisect_right(leaf.keys, k) - 1
+        if i < 0:
+            leaf = leaf.prev
+            if not leaf:
+                raise KeyError(str(k))
+            i = len(leaf.keys) - 1
+        return leaf.keys[i], leaf.values[i]
+
+    def ceiling(self, k):
+        """The (key, value) pair with the smallest key no less than k. Raises a KeyError if there's none."""
+        leaf = self._find_leaf(k)
+        i = bisect_left(leaf.keys, k)
+        if i >= len(leaf.keys):
+            leaf = leaf.next
+            if not leaf:
+                raise KeyError(str(k))
+            i = 0
+        return leaf.keys[i], leaf.values[i]
+
+    def bisect_left(self, k) -> int:
+        """The number of keys less than k, in O(log n) node visits by adding up the entry counts left of the path."""
+        return self._count_below(k, bisect_left)
+
+    def bisect_right(self, k) -> int:
+        """The number of keys no greater than k, see bisect_left."""
+        return self._count_below(k, bisect_right)
+
+    def _count_below(self, k, bisect_func) -> int:
+        count, node = 0, self._root
+        while type(node) is _Internal:
+            i = bisect_right(node.keys, k)
+            count += sum(node.counts[:i])
+            node = node.children[i]
+        return count + bisect_func(node.keys, k)
+
+    @property
+    def height(self) -> int:
+        """The number of levels, 1 for a lone leaf."""
+        h, node = 1, self._root
+        while type(node) is _Internal:
+            node = node.children[0]
+            h += 1
+        return h
+
+
+def _even_ranges(n: int, max_size: int):
+    """Splits range(n) into as few consecutive ranges of at most max_size as possible, with sizes differing by <= 1."""
+    count = -(-n // max_size)
+    size, extra = divmod(n, count)
+    lo = 0
+    for i in range(count):
+        hi = lo + size + (1 if i < extra else 0)
+        yield lo, hi
+        lo = hi
+
+
+def _check_node(test: TestCase, bpt: BPlusTreeMap, node, lo, hi, depth: int, leaf_depths: set, is_root: bool) -> int:
+    """
+    Checks key order, separator bounds, fill factors and entry counts, and collects the depth of every leaf.
+    :return: The number of entries under the node.
+    """
+    keys = node.keys
+    test.assertTrue(all(keys[i] < keys[i + 1] for i in range(len(keys) - 1)))
+    test.assertTrue(all((lo is None or lo <= k) and (hi is None or k < hi) for k in keys))
+    test.assertLessEqual(len(keys), bpt._fan_out)
+    if not is_root:
+        test.assertGreaterEqual(len(keys), bpt._min_keys)
+    if type(node) is _Leaf:
+        test.assertEqual(len(keys), len(node.values))
+        leaf_depths.add(depth)
+        return len(keys)
+    test.assertTrue(keys)
+    test.assertEqual(len(keys) + 1, len(node.children))
+    test.assertEqual(len(node.children), len(node.counts))
+    bounds = [lo] + keys + [hi]
+    for i, child in enumerate(node.children):
+        test.assertEqual(node.counts[i],
+                         _check_node(test, bpt, child, bounds[i], bounds[i + 1], depth + 1, leaf_depths, False))
+    return sum(node.counts)
+
+
+class TestBPlusTreeMap(TestCase):
+    def _assert_properties(self, bpt: BPlusTreeMap):
+        leaf_depths = set()
+        self.assertEqual(len(bpt), _check_node(self, bpt, bpt._root, None, None, 0, leaf_depths, True))
+        self.assertEqual(1, len(leaf_depths))
+        forward = list(bpt.keys())
+        self.assertEqual(len(bpt), len(forward))
+        self.assertSequenceEqual(forward[::-1], list(reversed(bpt)))
+
+    def test_random_ops(self):
+        for fan_out in (3, 4, 7, 32):
+            bpt = BPlusTreeMap(fan_out)
+            my_dict = {}
+            for _ in range(1500):
+                k = randint(0, 300)
+                if randint(0, 2) == 0 and my_dict:
+                    k = list(my_dict.keys())[randint(0, len(my_dict) - 1)]
+                    self.assertEqual(my_dict.pop(k), bpt[k])
+                    bpt.pop(k)
+                    self.assertFalse(k in bpt)
+                else:
+                    my_dict[k] = randint(0, 100)
+                    bpt[k] = my_dict[k]
+                    self.assertEqual(my_dict[k], bpt[k])
+                self.assertEqual(len(my_dict), len(bpt))
+            self._assert_properties(bpt)
+            self.assertSequenceEqual(sorted(my_dict.items()), list(bpt.items()))
+            for k in range(-1, 302, 7):
+                self.assertEqual(sum(1 for x in my_dict if x < k), bpt.bisect_left(k))
+                self.assertEqual(sum(1 for x in my_dict if x <= k), bpt.bisect_right(k))
+            self.assertRaises(KeyError, lambda: bpt.pop(-1))
+            self.assertRaises(KeyError, lambda: bpt[-1])
+            for k in list(my_dict):
+                bpt.pop(k)
+            self._assert_properties(bpt)
+            self.assertEqual(0, len(bpt))
+            self.assertEqual(1, bpt.height)
+
+    def test_range_queries(self):
+        keys = sorted({randint(0, 1000) for _ in range(300)})
+        for bpt in (BPlusTreeMap.from_sorted(((k, -k) for k in keys), 5), BPlusTreeMap(4)):
+            if not len(bpt):
+                for k in reversed(keys):
+                    bpt[k] = -k
+            self._assert_properties(bpt)
+            self.assertSequenceEqual(keys, list(bpt))
+            for _ in range(100):
+                lo, hi = sorted((randint(-10, 1010), randint(-10, 1010)))
+                for inclusive in ((True, True), (True, False), (False, True), (False, False)):
+                    expected = [k for k in keys if (lo <= k if inclusive[0] else lo < k) and
+                                (k <= hi if inclusive[1] else k < hi)]
+                    self.assertSequenceEqual(expected, list(bpt.irange(lo, hi, inclusive)))
+                    self.assertSequenceEqual(expected[::-1], list(bpt.irange(lo, hi, inclusive, True)))
+                self.assertSequenceEqual([(k, -k) for k in keys if k >= lo], list(bpt.irange_items(lo)))
+                self.assertSequenceEqual([k for k in keys if k <= hi][::-1], list(bpt.irange(hi=hi, reverse=True)))
+                floor_keys = [k for k in keys if k <= lo]
+                if floor_keys:
+                    self.assertEqual((floor_keys[-1], -floor_keys[-1]), bpt.floor(lo))
+                else:
+                    self.assertRaises(KeyError, lambda: bpt.floor(lo))
+                ceiling_keys = [k for k in keys if k >= lo]
+                if ceiling_keys:
+                    self.assertEqual((ceiling_keys[0], -ceiling_keys[0]), bpt.ceiling(lo))
+                else:
+                    self.assertRaises(KeyError, lambda: bpt.ceiling(lo))
+                self.assertEqual(len([k for k in keys if k < lo]), bpt.bisect_left(lo))
+                self.assertEqual(len([k for k in keys if k <= lo]), bpt.bisect_right(lo))
+
+    def test_from_sorted(self):
+        for fan_out in (3, 4, 64):
+            for n in (0, 1, 3, 4, 5, 17, 100, 1000):
+                bpt = BPlusTreeMap.from_sorted(((i, i * i) for i in range(n)), fan_out)
+                self._assert_properties(bpt)
+                self.assertSequenceEqual([(i, i * i) for i in range(n)], list(bpt.items()))
+                expected = dict(bpt.items())
+                batch = sorted({randint(-10, n + 10): 0 for _ in range(n // 2 + 1)}.items())
+                bpt.update_sorted(batch)
+                expected.update(batch)
+                self._assert_properties(bpt)
+                self.assertSequenceEqual(sorted(expected.items()), list(bpt.items()))
+                for k in range(0, n, 2):
+                    bpt.pop(k)
+                self._assert_properties(bpt)
+        self.assertRaises(AssertionError, lambda: BPlusTreeMap.from_sorted([(1, 1), (1, 2)]))
+
+
+def _main():
+    from P3_DataStructures.RBTree.sorted_map import SortedMap
+    from P3_DataStructures.RBTree.problem_13_3 import AVLTree, avl_insert
+    from P3_DataStructures.BST.basic_ops import bst_search, bst_iter
+
+    n = 1000000
+    keys = list(range(n))
+    shuffle(keys)
+    lo, hi = n // 2, n // 2 + 10000
+
+    def avl_set(avl, k, _v):
+        avl_insert(avl, k)
+
+    def avl_range(avl):
+        for k in bst_iter(avl):
+            if k > hi:
+                break
+
+    cases = (
+        ('AVLTree', AVLTree, avl_set, bst_search, avl_range),
+        ('SortedMap', SortedMap, SortedMap.__setitem__, SortedMap.__getitem__, lambda m: list(m.irange(lo, hi))),
+    ) + tuple(('BPlusTreeMap(%d)' % fan_out, lambda _f=fan_out: BPlusTreeMap(_f), BPlusTreeMap.__setitem__,
+               BPlusTreeMap.__getitem__, lambda m: list(m.irange(lo, hi))) for fan_out in (16, 64, 256))
+    for desc, create, insert, search, range_scan in cases:
+        tracemalloc.start()
+        container = create()
+        for k in keys:
+            insert(container, k, k)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del container
+
+        container = create()
+        start_time = time.time()
+        for k in keys:
+            insert(container, k, k)
+        insert_time = time.time() - start_time
+        start_time = time.time()
+        for k in keys:
+            search(container, k)
+        search_time = time.time() - start_time
+        start_time = time.time()
+        range_scan(container)
+        range_time = time.time() - start_time
+        print('%s: %.1f bytes/entry, %.0f inserts/s, %.0f searches/s, '
+              'scan of %d keys in the middle %.4fs.' % (desc, memory / n, n / insert_time, n / search_time,
+                                                       hi - lo + 1, range_time))
+        del container
+
+    start_time = time.time()
+    BPlusTreeMap.from_sorted((k, k) for k in range(n))
+    print('BPlusTreeMap.from_sorted: %.2fs.' % (time.time() - start_time))
+    start_time = time.time()
+    SortedMap.from_sorted((k, k) for k in range(n))
+    print('SortedMap.from_sorted: %.2fs.' % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,163 @@
+from .hash_table_common import FIBONACCI_MULTIPLIER, MASK_64
+from .hash_table import HashMap
+from Common.map import Map
+from random import randint
+from threading import Lock, Thread
+import time
+
+
+DEFAULT_SHARD_COUNT = 16
+_MISSING = object()
+
+
+class ConcurrentHashMap(Map):
+    """
+    Thread-safe hash map, which partitions the keys across shards, each a chaining HashMap with its own lock, so that
+    threads working on different shards don't wait for each other. The shards resize on their own and incrementally,
+    which holds a shard's lock for a few buckets at a time, and never locks the others.
+
+    Each operation on a single key is atomic, including the read-modify-write ones get_or_set, compute and pop.
+    len and iteration are weakly consistent: they see each shard as it was at some point during the call, without
+    blocking writers for longer than copying one shard, and never fail because of concurrent modifications.
+    """
+
+    def __init__(self, shard_count: int = DEFAULT_SHARD_COUNT, incremental: bool = True):
+        """
+        :param shard_count: The number of independently locked shards.
+        :param incremental: Whether the shards resize incrementally, see HashMap.
+        """
+        assert shard_count > 0
+        self._shards = [HashMap(incremental=incremental) for _ in range(shard_count)]
+        self._locks = [Lock() for _ in range(shard_count)]
+
+    def _shard_index(self, k) -> int:
+        # The top bits of the scrambled hash, as the shards' buckets are picked by its bottom bits.
+        return ((hash(k) * FIBONACCI_MULTIPLIER) & MASK_64) * len(self._shards) >> 64
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def __getitem__(self, k):
+        i = self._shard_index(k)
+        with self._locks[i]:
+            return self._shards[i][k]
+
+    def get(self, k, default=None):
+        i = self._shard_index(k)
+        with self._locks[i]:
+            return self._shards[i].get(k, default)
+
+    def __setitem__(self, k, v):
+        i = self._shard_index(k)
+        with self._locks[i]:
+            self._shards[i][k] = v
+
+    def __contains__(self, k):
+        i = self._shard_index(k)
+        with self._locks[i]:
+            return k in self._shards[i]
+
+    def get_or_set(self, k, v):
+        """:return: The value of k, after setting it to v if k wasn't in the map."""
+        i = self._shard_index(k)
+        with self._locks[i]:
+            shard = self._shards[i]
+            old_v = shard.get(k, _MISSING)
+            if old_v is not _MISSING:
+                return old_v
+            shard[k] = v
+            return v
+
+    def compute(self, k, func):
+        """
+        Atomically replaces the value of k with func(k, its value), or func(k, None) if k isn't in the map. func runs
+        under the shard's lock, so it must be quick and must not access the map.
+        :return: The new value, or None if func returned None, which removes k.
+        """
+        i = self._shard_index(k)
+        with self._locks[i]:
+            shard = self._shards[i]
+            old_v = shard.get(k, _MISSING)
+            v = func(k, None if old_v is _MISSING else old_v)
+            if v is not None:
+                shard[k] = v
+            elif old_v is not _MISSING:
+                shard.pop(k)
+            return v
+
+    def pop(self, k, default=_MISSING):
+        """:return: The value of the removed k, or default if given and k isn't in the map."""
+        i = self._shard_index(k)
+        with self._locks[i]:
+            try:
+                return self._shards[i].pop(k)
+            except KeyError:
+                if default is _MISSING:
+                    raise
+                return default
+
+    def __iter__(self):
+        return self.items()
+
+    def items(self):
+        for i, shard in enumerate(self._shards):
+            with self._locks[i]:
+                items = list(shard)
+            yield from items
+
+    def keys(self):
+        for k, _ in self.items():
+            yield k
+
+    def values(self):
+        for _, v in self.items():
+            yield v
+
+
+class _GlobalLockHashMap(object):
+    """The chaining HashMap behind a single lock, to compare with."""
+
+    def __init__(self):
+        self._hash_map = HashMap()
+        self._lock = Lock()
+
+    def get(self, k, default=None):
+        with self._lock:
+            return self._hash_map.get(k, default)
+
+    def __setitem__(self, k, v):
+        with self._lock:
+            self._hash_map[k] = v
+
+
+def _main():
+    key_count = 100000
+    op_count = 400000
+    for desc, create in (('HashMap with a global lock', _GlobalLockHashMap), ('ConcurrentHashMap', ConcurrentHashMap)):
+        for thread_count in (1, 2, 4, 8):
+            hash_map = create()
+
+            def run():
+                for _ in range(op_count // thread_count):
+                    k = randint(0, key_count)
+                    if randint(0, 9):
+                        hash_map.get(k)
+                    else:
+                        hash_map[k] = k
+
+            threads = [Thread(target=run) for _ in range(thread_count)]
+            start_time = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            total_time = time.time() - start_time
+            print('%s, %d threads, 90%% reads: %.0f ops/s.' % (desc, thread_count, op_count / total_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -1,5 +1,12 @@
 from .hash_table_common import DEFAULT_CAPACITY_ANTILOG
 from Common.map import Map
+from math import ceil
+import gc
+import time
+
+
+# The minimum number of old buckets moved to the new table per operation while resizing incrementally.
+DEFAULT_REHASH_STEP = 4
 
 
 class _HashMapBucketNode(object):
@@ -10,53 +17,93 @@ class _HashMapBucketNode(object):
 
 
 class HashMap(Map):
-    """Simple hash dictionary implementation using chaining to resolve collisions."""
-
-    def __init__(self):
+    """
+    Simple hash dictionary implementation using chaining to resolve collisions. The table doubles when it's full and
+    halves when it's less than a quarter full.
+
+    In the incremental mode, like in Redis, a resize only allocates the new table. Both tables are in use until each
+    following insertion, lookup or deletion has moved a few old buckets into the new one, so that no single operation
+    rehashes the whole map.
+    """
+
+    def __init__(self, incremental: bool = False, rehash_step: int = DEFAULT_REHASH_STEP,
+                 record_insert_latency: bool = False):
+        """
+        :param incremental: Whether to resize incrementally.
+        :param rehash_step: The minimum number of old buckets to move per operation in the incremental mode.
+        :param record_insert_latency: Whether to time every insertion, see insert_latency_percentiles.
+        """
+        assert rehash_step > 0
         self._buckets = [None] * (1 << DEFAULT_CAPACITY_ANTILOG)
         self._len = 0
+        self._incremental = incremental
+        self._rehash_step = rehash_step
+        # The table being moved into _buckets, whose buckets below _rehash_index are moved already.
+        self._old_buckets = None
+        self._rehash_index = 0
+        # The number of old buckets moved per operation during the current resize.
+        self._resize_step = rehash_step
+        # Moving buckets is paused while iterating, so that no entry is missed or seen twice.
+        self._iterator_count = 0
+        self._insert_latencies = [] if record_insert_latency else None
 
     def __len__(self):
         return self._len
 
     def __getitem__(self, k):
-        i = self._get_bucket_index(k)
-        head = self._buckets[i]
+        self._rehash()
+        buckets, i = self._get_bucket(k)
+        head = buckets[i]
         while head is not None:
             if head.key == k:
                 return head.val
             head = head.next
         raise KeyError(str(k))
 
+    def get(self, k, default=None):
+        """:return: The value of k, or default if k isn't in the map."""
+        self._rehash()
+        buckets, i = self._get_bucket(k)
+        head = buckets[i]
+        while head is not None:
+            if head.key == k:
+                return head.val
+            head = head.next
+        return default
+
     def __setitem__(self, k, v):
-        bucket_index = self._get_bucket_index(k)
-        head = self._buckets[bucket_index]
-        override = False
+        if self._insert_latencies is None:
+            self._set(k, v)
+        else:
+            start_time = time.perf_counter()
+            self._set(k, v)
+            self._insert_latencies.append(time.perf_counter() - start_time)
+
+    def _set(self, k, v):
+        self._rehash()
+        buckets, bucket_index = self._get_bucket(k)
+        head = buckets[bucket_index]
         while head is not None:
             if head.key == k:
                 head.val = v
-                override = True
-                break
+                return
             head = head.next
 
-        if override:
-            return
-
         if self._len == len(self._buckets):
-            self._table_doubling()
-            bucket_index = self._get_bucket_index(k)
+            self._resize(len(self._buckets) * 2)
+            buckets, bucket_index = self._get_bucket(k)
 
-        head = self._buckets[bucket_index]
         new_head = _HashMapBucketNode()
         new_head.key = k
         new_head.val = v
-        new_head.next = head
-        self._buckets[bucket_index] = new_head
+        new_head.next = buckets[bucket_index]
+        buckets[bucket_index] = new_head
         self._len += 1
 
     def __contains__(self, k):
-        bucket_index = self._get_bucket_index(k)
-        head = self._buckets[bucket_index]
+        self._rehash()
+        buckets, bucket_index = self._get_bucket(k)
+        head = buckets[bucket_index]
         while head is not None:
             if head.key == k:
                 return True
@@ -64,57 +111,143 @@ class HashMap(Map):
         return False
 
     def __iter__(self):
-        for bucket in self._buckets:
-            head = bucket
-            while head:
-                yield (head.key, head.value)
-                head = head.next
+        for node in self._iter_nodes():
+            yield (node.key, node.val)
 
     @property
     def capacity(self):
         return len(self._buckets)
 
+    @property
+    def rehashing(self) -> bool:
+        """Whether an incremental resize is in progress."""
+        return self._old_buckets is not None
+
     def pop(self, k):
-        bucket_index = self._get_bucket_index(k)
-        head = self._buckets[bucket_index]
+        """:return: The value of the removed k."""
+        self._rehash()
+        buckets, bucket_index = self._get_bucket(k)
+        head = buckets[bucket_index]
         prev = None
         while head is not None:
             if head.key == k:
                 if prev is not None:
                     prev.next = head.next
                 else:
-                    self._buckets[bucket_index] = head.next
+                    buckets[bucket_index] = head.next
                 self._len -= 1
-                return
+                if self._len < len(self._buckets) // 4 and len(self._buckets) > 1 << DEFAULT_CAPACITY_ANTILOG:
+                    self._resize(len(self._buckets) // 2)
+                return head.val
             prev = head
             head = head.next
         raise KeyError(str(k))
 
     def keys(self):
-        for bucket in self._buckets:
-            head = bucket
-            while head:
-                yield head.key
-                head = head.next
+        for node in self._iter_nodes():
+            yield node.key
 
     def values(self):
-        for bucket in self._buckets:
-            head = bucket
-            while head:
-                yield head.val
-                head = head.next
+        for node in self._iter_nodes():
+            yield node.val
+
+    def insert_latency_percentiles(self, percentiles=(50, 99)) -> list:
+        """
+        :param percentiles: Percentiles between 0 and 100.
+        :return: The insertion latency at each percentile in seconds, by the nearest-rank method, over all insertions
+        since the map was created with record_insert_latency.
+        """
+        latencies = sorted(self._insert_latencies)
+        if not latencies:
+            return [0.0] * len(percentiles)
+        return [latencies[max(0, ceil(p / 100 * len(latencies)) - 1)] for p in percentiles]
+
+    def _iter_nodes(self):
+        self._iterator_count += 1
+        try:
+            if self._old_buckets is not None:
+                old_buckets = self._old_buckets
+                for i in range(self._rehash_index, len(old_buckets)):
+                    head = old_buckets[i]
+                    while head:
+                        yield head
+                        head = head.next
+            for bucket in self._buckets:
+                head = bucket
+                while head:
+                    yield head
+                    head = head.next
+        finally:
+            self._iterator_count -= 1
+
+    def _get_bucket(self, k) -> tuple:
+        """:return: (the table, the bucket index) where k is or would be inserted."""
+        h = hash(k)
+        if self._old_buckets is not None:
+            i = h % len(self._old_buckets)
+            if i >= self._rehash_index:
+                return self._old_buckets, i
+        return self._buckets, h % len(self._buckets)
 
     def _get_bucket_index(self, k):
         return hash(k) % len(self._buckets)
 
-    def _table_doubling(self):
-        old_buckets = self._buckets
-        self._buckets = [None] * (len(old_buckets) * 2)
-        for bucket in old_buckets:
-            head = bucket
+    def _rehash(self, step: int = None):
+        """Moves step old buckets into the new table, unless an iteration is going on."""
+        if self._old_buckets is None or self._iterator_count:
+            return
+        self._move_old_buckets(min(len(self._old_buckets), self._rehash_index + (step or self._resize_step)))
+
+    def _move_old_buckets(self, end: int):
+        """Moves the old buckets below end into the new table."""
+        old_buckets, buckets = self._old_buckets, self._buckets
+        for i in range(self._rehash_index, end):
+            head = old_buckets[i]
+            old_buckets[i] = None
             while head is not None:
                 _next = head.next
                 new_bucket_index = self._get_bucket_index(head.key)
-                head.next = self._buckets[new_bucket_index]
-                self._buckets[new_bucket_index] = head
+                head.next = buckets[new_bucket_index]
+                buckets[new_bucket_index] = head
                 head = _next
+        self._rehash_index = end
+        if end == len(old_buckets):
+            self._old_buckets = None
+
+    def _resize(self, capacity: int):
+        # A pending resize is only left when iterating paused it, and it is completed even then, since only one old
+        # table is kept. Like inserting into a dict, inserting or deleting while iterating may then make the iteration
+        # miss entries, but loses none.
+        if self._old_buckets is not None:
+            self._move_old_buckets(len(self._old_buckets))
+        self._old_buckets = self._buckets
+        self._rehash_index = 0
+        self._buckets = [None] * capacity
+        if not self._incremental:
+            self._move_old_buckets(len(self._old_buckets))
+            return
+        # Operations until the next doubling or halving is due, counting the one that triggers it. After a halving,
+        # the next one is due after an eighth of the old bucket count of deletions, so the step is scaled to complete
+        # the resize by then, up to 8 buckets per operation.
+        budget = min(capacity - self._len, self._len - capacity // 4) + 1
+        self._resize_step = max(self._rehash_step, ceil(len(self._old_buckets) / max(budget, 1)))
+
+
+def _main():
+    n = 2000000
+    for incremental in (False, True):
+        hash_map = HashMap(incremental=incremental, record_insert_latency=True)
+        # Cyclic garbage collections over millions of nodes would otherwise dominate the tail latencies of both modes.
+        gc.disable()
+        start_time = time.time()
+        for k in range(n):
+            hash_map[k] = k
+        total_time = time.time() - start_time
+        gc.enable()
+        p50, p99, p9999, p100 = hash_map.insert_latency_percentiles((50, 99, 99.99, 100))
+        print('%d inserts, incremental=%r: %.2fs, p50 %.1fus, p99 %.1fus, p99.99 %.1fus, max %.1fms.' %
+              (n, incremental, total_time, p50 * 1e6, p99 * 1e6, p9999 * 1e6, p100 * 1e3))
+
+
+if __name__ == '__main__':
+    _main()
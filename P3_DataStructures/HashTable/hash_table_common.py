@@ -1 +1,3 @@
-DEFAULT_CAPACITY_ANTILOG = 3
\ No newline at end of file
+DEFAULT_CAPACITY_ANTILOG = 3
+FIBONACCI_MULTIPLIER = 11400714819323198485  # 2^64 / golden ratio, odd.
+MASK_64 = (1 << 64) - 1
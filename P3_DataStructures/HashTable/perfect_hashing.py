@@ -2,15 +2,32 @@ from random import randint
 from typing import List, Callable
 
 
+_MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)  # Deterministic for n < 3.3 * 10^24.
+
+
 def _is_prime(n):
+    """Miller-Rabin test, in O(log(n)^3) time instead of the O(sqrt(n)) of trial division."""
     assert isinstance(n, int) and n > 0
     if n == 1:
         return False
-    i = 2
-    while i * i <= n:
-        if n % i == 0:
+    for p in _MILLER_RABIN_BASES:
+        if n % p == 0:
+            return n == p
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in _MILLER_RABIN_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
             return False
-        i += 1
     return True
 
 
@@ -40,10 +57,17 @@ class PerfectHashingParams(object):
         self.ai = None
         self.bi = None
         self.mi = None
+        # Only set for hash-and-displace tables, see static_perfect_hash.
+        self.slot_count = None
+        self.bucket_count = None
+        self.displacements = None
 
     def __str__(self):
-        return 'try_count=%d, prime=%d, a=%d, b=%d, ai=%r, bi=%r, mi=%r' %\
-               (self.try_count, self.prime, self.a, self.b, self.ai, self.bi, self.mi)
+        ret = 'try_count=%d, prime=%d, a=%d, b=%d, ai=%r, bi=%r, mi=%r' %\
+              (self.try_count, self.prime, self.a, self.b, self.ai, self.bi, self.mi)
+        if self.slot_count is not None:
+            ret += ', slot_count=%d, bucket_count=%d' % (self.slot_count, self.bucket_count)
+        return ret
 
 
 def find_perfect_hashing(key_set):
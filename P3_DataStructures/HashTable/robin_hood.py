@@ -0,0 +1,242 @@
+from .hash_table_common import DEFAULT_CAPACITY_ANTILOG, FIBONACCI_MULTIPLIER, MASK_64
+from .hash_table import HashMap as HashMapChaining
+from .open_addressing import HashMap as HashMapOpenAddressing
+from Common.map import Map
+from array import array
+from random import shuffle
+import time
+import tracemalloc
+
+
+_OCCUPIED = 1  # Set in every cached hash, which leaves 0 for empty slots.
+DEFAULT_MAX_LOAD_FACTOR = 0.8
+
+
+class RobinHoodHashMap(Map):
+    """
+    Hash map with open addressing, linear probing and Robin Hood displacement: an insertion takes the slot of any
+    entry that is closer to its home slot than the new one would be, and carries that entry on instead. This keeps
+    probe sequences short and uniform, and lets a missing key be rejected as soon as the probe is longer than that of
+    the entry at hand. Deletion shifts the following entries of the cluster back by one slot, so there are no
+    tombstones.
+
+    Instead of a bucket object per slot, the keys and values live in two parallel lists, next to a flat array of the
+    cached 64-bit hashes, where 0 marks an empty slot. The hashes are Fibonacci-scrambled so that their top bits give
+    a good home slot even for sequential ints, and caching them spares rehashing the keys on resizing and on the
+    probe distance calculations.
+    """
+
+    def __init__(self, max_load_factor: float = DEFAULT_MAX_LOAD_FACTOR):
+        """
+        :param max_load_factor: The table doubles when an insertion would go above this load factor, and halves when
+        deletions bring the load factor below a quarter of it.
+        """
+        assert 0 < max_load_factor < 1
+        self._max_load_factor = max_load_factor
+        self._len = 0
+        self._allocate(DEFAULT_CAPACITY_ANTILOG)
+
+    def _allocate(self, capacity_antilog: int):
+        capacity = 1 << capacity_antilog
+        self._capacity_antilog = capacity_antilog
+        self._shift = 64 - capacity_antilog
+        self._mask = capacity - 1
+        self._hashes = array('Q', bytes(8 * capacity))
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._grow_at = int(capacity * self._max_load_factor)
+        self._shrink_at = int(capacity * self._max_load_factor / 4) if capacity_antilog > DEFAULT_CAPACITY_ANTILOG \
+            else -1
+
+    def _find(self, k) -> int:
+        """:return: The slot of k, or -1 if k isn't in the map."""
+        h = (hash(k) * FIBONACCI_MULTIPLIER) & MASK_64 | _OCCUPIED
+        hashes, keys, mask, shift = self._hashes, self._keys, self._mask, self._shift
+        i = h >> shift
+        distance = 0
+        while True:
+            slot_hash = hashes[i]
+            if not slot_hash:
+                return -1
+            if slot_hash == h:
+                slot_key = keys[i]
+                if slot_key is k or slot_key == k:
+                    return i
+            if (i - (slot_hash >> shift)) & mask < distance:
+                return -1
+            i = (i + 1) & mask
+            distance += 1
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, k):
+        i = self._find(k)
+        if i < 0:
+            raise KeyError(str(k))
+        return self._values[i]
+
+    def __contains__(self, k):
+        return self._find(k) >= 0
+
+    def __setitem__(self, k, v):
+        h = (hash(k) * FIBONACCI_MULTIPLIER) & MASK_64 | _OCCUPIED
+        hashes, keys, values = self._hashes, self._keys, self._values
+        mask, shift = self._mask, self._shift
+        i = h >> shift
+        distance = 0
+        while True:
+            slot_hash = hashes[i]
+            if not slot_hash:
+                break
+            if slot_hash == h:
+                slot_key = keys[i]
+                if slot_key is k or slot_key == k:
+                    values[i] = v
+                    return
+            if (i - (slot_hash >> shift)) & mask < distance:
+                break
+            i = (i + 1) & mask
+            distance += 1
+
+        # k is a new key, which belongs at i.
+        if self._len >= self._grow_at:
+            self._resize(self._capacity_antilog + 1)
+            self._insert_new(h, k, v)
+        else:
+            self._insert_new(h, k, v, i, distance)
+        self._len += 1
+
+    def _insert_new(self, h: int, k, v, i: int = None, distance: int = 0):
+        """Places a key that isn't in the map, starting at slot i with the given probe distance."""
+        hashes, keys, values = self._hashes, self._keys, self._values
+        mask, shift = self._mask, self._shift
+        if i is None:
+            i = h >> shift
+        while True:
+            slot_hash = hashes[i]
+            if not slot_hash:
+                hashes[i], keys[i], values[i] = h, k, v
+                return
+            slot_distance = (i - (slot_hash >> shift)) & mask
+            if slot_distance < distance:
+                # Rob the richer entry of its slot and carry it on.
+                hashes[i], h = h, slot_hash
+                keys[i], k = k, keys[i]
+                values[i], v = v, values[i]
+                distance = slot_distance
+            i = (i + 1) & mask
+            distance += 1
+
+    def pop(self, k):
+        i = self._find(k)
+        if i < 0:
+            raise KeyError(str(k))
+        hashes, keys, values = self._hashes, self._keys, self._values
+        mask, shift = self._mask, self._shift
+        # Backward shift: move the following entries that aren't at their home slots one slot back.
+        j = (i + 1) & mask
+        while True:
+            slot_hash = hashes[j]
+            if not slot_hash or slot_hash >> shift == j:
+                break
+            hashes[i], keys[i], values[i] = slot_hash, keys[j], values[j]
+            i, j = j, (j + 1) & mask
+        hashes[i] = 0
+        keys[i] = values[i] = None
+        self._len -= 1
+        if self._len < self._shrink_at:
+            self._resize(self._capacity_antilog - 1)
+
+    def _resize(self, capacity_antilog: int):
+        old_hashes, old_keys, old_values = self._hashes, self._keys, self._values
+        self._allocate(capacity_antilog)
+        for i, h in enumerate(old_hashes):
+            if h:
+                self._insert_new(h, old_keys[i], old_values[i])
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        keys = self._keys
+        for i, h in enumerate(self._hashes):
+            if h:
+                yield keys[i]
+
+    def values(self):
+        values = self._values
+        for i, h in enumerate(self._hashes):
+            if h:
+                yield values[i]
+
+    def items(self):
+        keys, values = self._keys, self._values
+        for i, h in enumerate(self._hashes):
+            if h:
+                yield keys[i], values[i]
+
+    @property
+    def capacity(self):
+        return 1 << self._capacity_antilog
+
+    @property
+    def max_load_factor(self):
+        return self._max_load_factor
+
+    def max_probe_distance(self) -> int:
+        """The longest distance of an entry from its home slot, in O(capacity) time."""
+        mask, shift = self._mask, self._shift
+        return max(((i - (h >> shift)) & mask for i, h in enumerate(self._hashes) if h), default=0)
+
+
+def _second_hash(k, capacity_antilog):
+    return ((2654435769 * k) % 4294967296) >> (32 - capacity_antilog)
+
+
+def _main():
+    cases = (
+        ('dict', dict),
+        ('RobinHoodHashMap', RobinHoodHashMap),
+        ('HashMap, chaining', HashMapChaining),
+        ('HashMap, open addressing', lambda: HashMapOpenAddressing(_second_hash)),
+    )
+    # The table size of the chaining HashMap is a power of 2, so that multiples of a large power of 2 land in few
+    # buckets.
+    for keys_desc, n, stride in (('shuffled multiples of 8', 100000, 8), ('shuffled multiples of 1024', 20000, 1024)):
+        print('%d %s:' % (n, keys_desc))
+        keys = list(range(0, n * stride, stride))
+        shuffle(keys)
+        missing_keys = [k + 1 for k in keys]
+        for desc, create in cases:
+            tracemalloc.start()
+            hash_map = create()
+            for k in keys:
+                hash_map[k] = k
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del hash_map
+
+            hash_map = create()
+            start_time = time.time()
+            for k in keys:
+                hash_map[k] = k
+            insert_time = time.time() - start_time
+            start_time = time.time()
+            for k in keys:
+                hash_map[k]
+            hit_time = time.time() - start_time
+            start_time = time.time()
+            for k in missing_keys:
+                k in hash_map
+            miss_time = time.time() - start_time
+            start_time = time.time()
+            for k in keys:
+                hash_map.pop(k)
+            pop_time = time.time() - start_time
+            print('%s: %.1f bytes/entry, %.0f inserts/s, %.0f hits/s, %.0f misses/s, %.0f pops/s.' %
+                  (desc, memory / n, n / insert_time, n / hit_time, n / miss_time, n / pop_time))
+
+
+if __name__ == '__main__':
+    _main()
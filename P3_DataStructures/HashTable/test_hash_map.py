@@ -2,7 +2,14 @@ from unittest import TestCase
 from .hash_table_common import DEFAULT_CAPACITY_ANTILOG
 from .hash_table import HashMap as HashMapChaining
 from .open_addressing import HashMap as HashMapOpenAddressing
+from .robin_hood import RobinHoodHashMap
+from .perfect_hashing import _is_prime
+from .static_perfect_hash import StaticPerfectHashMap, _mix, _PRIME
+from .concurrent_hash_map import ConcurrentHashMap
 from random import randint
+from threading import Thread
+import os
+import tempfile
 
 
 def _second_hash(k, capacity_antilog):
@@ -11,7 +18,8 @@ def _second_hash(k, capacity_antilog):
 
 class TestHashMap(TestCase):
     def test_basic_use(self):
-        for hash_map in (HashMapChaining(), HashMapOpenAddressing(_second_hash),):
+        for hash_map in (HashMapChaining(), HashMapChaining(incremental=True, rehash_step=1),
+                         HashMapOpenAddressing(_second_hash),):
             # print(type(hash_map))
             hash_map[1] = 3
             hash_map[2] = 4
@@ -47,11 +55,14 @@ class TestHashMap(TestCase):
                 hash_map.pop(k)
             self.assertDictEqual({}, dict(hash_map))
             self.assertEqual(0, len(hash_map))
-            self.assertEqual(1 << (DEFAULT_CAPACITY_ANTILOG + 3), hash_map.capacity)
+            # The chaining HashMap shrinks as it empties.
+            shrinks = isinstance(hash_map, HashMapChaining)
+            self.assertEqual(1 << (DEFAULT_CAPACITY_ANTILOG + (0 if shrinks else 3)), hash_map.capacity)
 
     def test_random_ops(self):
         self.maxDiff = 4096
-        for hash_map in (HashMapChaining(), HashMapOpenAddressing(_second_hash),):
+        for hash_map in (HashMapChaining(), HashMapChaining(incremental=True, rehash_step=1),
+                         HashMapOpenAddressing(_second_hash), RobinHoodHashMap(), ConcurrentHashMap(4)):
             # print(type(hash_map))
             my_dict = dict()
             for i in range(0, 400):
@@ -79,3 +90,274 @@ class TestHashMap(TestCase):
                 self.assertSetEqual(set(my_dict.values()), set(hash_map.values()))
                 self.assertEqual(len(my_dict), len(hash_map))
                 # print(my_dict)
+
+
+class TestIncrementalHashMap(TestCase):
+    def test_rehashing(self):
+        hash_map = HashMapChaining(incremental=True, rehash_step=1)
+        capacity = hash_map.capacity
+        for k in range(capacity + 1):
+            hash_map[k] = k
+        # The last insertion started the doubling, after its own rehash step, so no old bucket has moved yet.
+        self.assertTrue(hash_map.rehashing)
+        self.assertEqual(capacity * 2, hash_map.capacity)
+        for k in range(capacity + 1):
+            self.assertEqual(k, hash_map[k])
+        self.assertFalse(hash_map.rehashing)
+
+        # Sustained deletes halve the table, which is rehashed by the following operations.
+        n = len(hash_map)
+        for k in range(n - capacity // 4 - 1):
+            self.assertEqual(k, hash_map.pop(k))
+            self.assertIsNone(hash_map.get(k))
+        self.assertEqual(capacity, hash_map.capacity)
+        self.assertDictEqual({k: k for k in range(n - capacity // 4 - 1, n)}, dict(hash_map))
+
+    def test_iteration_during_rehashing(self):
+        hash_map = HashMapChaining(incremental=True, rehash_step=1)
+        n = hash_map.capacity * 4 + 1
+        for k in range(n):
+            hash_map[k] = -k
+        self.assertTrue(hash_map.rehashing)
+        keys = []
+        for k, v in hash_map:
+            keys.append(k)
+            # Lookups don't move buckets while an iteration is going on.
+            self.assertEqual(v, hash_map[k])
+        self.assertListEqual(list(range(n)), sorted(keys))
+        self.assertTrue(hash_map.rehashing)
+        self.assertListEqual(sorted(keys), sorted(hash_map.keys()))
+        self.assertListEqual(sorted(-k for k in keys), sorted(hash_map.values()))
+
+    def test_resizing_during_iteration(self):
+        for incremental in (False, True):
+            hash_map = HashMapChaining(incremental=incremental, rehash_step=1)
+            hash_map[0] = 0
+            it = iter(hash_map)
+            next(it)
+            # Two doublings while the iterator is open, the second one before the first one is complete.
+            n = hash_map.capacity * 4 - 1
+            for k in range(1, n):
+                hash_map[k] = k
+            del it
+            self.assertEqual(n, len(hash_map))
+            for k in range(n):
+                self.assertEqual(k, hash_map[k])
+            self.assertDictEqual({k: k for k in range(n)}, dict(hash_map))
+
+    def test_resize_steps(self):
+        resizes = []
+
+        class CheckedHashMap(HashMapChaining):
+            def _resize(self, capacity: int):
+                # Each resize is complete before the next one is due, without draining it synchronously.
+                resizes.append(self.rehashing)
+                super()._resize(capacity)
+
+        hash_map = CheckedHashMap(incremental=True, rehash_step=1)
+        n = hash_map.capacity * 64
+        for k in range(n):
+            hash_map[k] = k
+        for k in range(n):
+            self.assertEqual(k, hash_map.pop(k))
+        self.assertGreater(len(resizes), 10)
+        self.assertFalse(any(resizes))
+
+    def test_random_keys(self):
+        hash_map = HashMapChaining(incremental=True, rehash_step=1)
+        my_dict = dict()
+        for _ in range(3000):
+            k = randint(-500, 500) if randint(0, 1) else str(randint(0, 500))
+            if k in my_dict and randint(0, 2):
+                my_dict.pop(k)
+                hash_map.pop(k)
+            else:
+                my_dict[k] = randint(0, 9)
+                hash_map[k] = my_dict[k]
+            self.assertEqual(len(my_dict), len(hash_map))
+            self.assertEqual(k in my_dict, k in hash_map)
+        self.assertDictEqual(my_dict, dict(hash_map))
+
+    def test_insert_latency_percentiles(self):
+        hash_map = HashMapChaining(record_insert_latency=True)
+        self.assertListEqual([0.0, 0.0], hash_map.insert_latency_percentiles())
+        for k in range(100):
+            hash_map[k] = k
+        p0, p50, p99, p100 = hash_map.insert_latency_percentiles((0, 50, 99, 100))
+        self.assertTrue(0 <= p0 <= p50 <= p99 <= p100)
+        hash_map._insert_latencies = [float(i) for i in range(100, 0, -1)]
+        self.assertListEqual([1.0, 50.0, 99.0, 100.0], hash_map.insert_latency_percentiles((0, 50, 99, 100)))
+
+
+class TestRobinHoodHashMap(TestCase):
+    def _assert_robin_hood_invariant(self, hash_map: RobinHoodHashMap):
+        # Every slot between an entry and its home slot is taken by an entry at least as far from its own home.
+        capacity = hash_map.capacity
+        for i, h in enumerate(hash_map._hashes):
+            if not h:
+                continue
+            home = h >> hash_map._shift
+            distance = (i - home) % capacity
+            for d in range(distance):
+                j = (home + d) % capacity
+                self.assertTrue(hash_map._hashes[j])
+                self.assertGreaterEqual((j - (hash_map._hashes[j] >> hash_map._shift)) % capacity, d)
+
+    def test_resizing(self):
+        hash_map = RobinHoodHashMap(max_load_factor=0.5)
+        self.assertEqual(0.5, hash_map.max_load_factor)
+        self.assertEqual(1 << DEFAULT_CAPACITY_ANTILOG, hash_map.capacity)
+        n = 1000
+        for k in range(n):
+            hash_map[k * 1024] = k
+            self.assertLessEqual(len(hash_map), hash_map.capacity * 0.5)
+        self._assert_robin_hood_invariant(hash_map)
+        self.assertEqual(2048, hash_map.capacity)
+        self.assertDictEqual({k * 1024: k for k in range(n)}, dict(hash_map.items()))
+        for k in range(n - 10):
+            hash_map.pop(k * 1024)
+        self._assert_robin_hood_invariant(hash_map)
+        self.assertLessEqual(hash_map.capacity, 64)
+        self.assertDictEqual({k * 1024: k for k in range(n - 10, n)}, dict(hash_map.items()))
+        self.assertNotIn(0, hash_map)
+        self.assertRaises(KeyError, lambda: hash_map[0])
+        self.assertRaises(KeyError, lambda: hash_map.pop(0))
+
+    def test_random_keys(self):
+        hash_map = RobinHoodHashMap()
+        my_dict = dict()
+        for _ in range(3000):
+            k = randint(-500, 500) if randint(0, 1) else str(randint(0, 500))
+            if k in my_dict and randint(0, 1):
+                my_dict.pop(k)
+                hash_map.pop(k)
+            else:
+                my_dict[k] = randint(0, 9)
+                hash_map[k] = my_dict[k]
+            self.assertEqual(len(my_dict), len(hash_map))
+        self._assert_robin_hood_invariant(hash_map)
+        self.assertDictEqual(my_dict, dict(hash_map.items()))
+        self.assertSetEqual(set(my_dict), set(hash_map))
+        self.assertLess(hash_map.max_probe_distance(), 32)
+
+
+class TestConcurrentHashMap(TestCase):
+    def test_atomic_ops(self):
+        hash_map = ConcurrentHashMap()
+        self.assertEqual(1, hash_map.get_or_set('a', 1))
+        self.assertEqual(1, hash_map.get_or_set('a', 2))
+        self.assertEqual(2, hash_map.compute('a', lambda k, v: v + 1))
+        self.assertEqual(5, hash_map.compute('b', lambda k, v: 5 if v is None else v))
+        self.assertIsNone(hash_map.compute('b', lambda k, v: None))
+        self.assertIsNone(hash_map.compute('c', lambda k, v: None))
+        self.assertDictEqual({'a': 2}, dict(hash_map))
+        self.assertEqual(2, hash_map.pop('a'))
+        self.assertEqual(0, hash_map.pop('a', 0))
+        self.assertRaises(KeyError, lambda: hash_map.pop('a'))
+        self.assertIsNone(hash_map.get('a'))
+        self.assertEqual(0, len(hash_map))
+
+    def test_threads(self):
+        hash_map = ConcurrentHashMap(4)
+        thread_count = 4
+        n = 2000
+
+        def increment():
+            for k in range(n):
+                hash_map.compute(k % 100, lambda _, v: 1 if v is None else v + 1)
+                hash_map.get_or_set(n + k, k)
+
+        # Assertions would only fail the thread.
+        bad_items = []
+
+        def iterate():
+            for _ in range(20):
+                bad_items.extend((k, v) for k, v in hash_map if not (v > 0 if k < 100 else v == k - n))
+
+        threads = [Thread(target=increment) for _ in range(thread_count)] + [Thread(target=iterate)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual([], bad_items)
+        expected = {k: thread_count * n // 100 for k in range(100)}
+        expected.update((n + k, k) for k in range(n))
+        self.assertDictEqual(expected, dict(hash_map))
+        self.assertEqual(len(expected), len(hash_map))
+
+
+class TestStaticPerfectHashMap(TestCase):
+    def test_is_prime(self):
+        primes = [n for n in range(2, 1000) if all(n % d for d in range(2, n))]
+        self.assertListEqual(primes, [n for n in range(1, 1000) if _is_prime(n)])
+        self.assertTrue(_is_prime((1 << 61) - 1))
+        self.assertFalse(_is_prime(3215031751))  # Strong pseudoprime to the bases 2, 3, 5 and 7.
+
+    def test_int_keys(self):
+        keys = list({randint(-10 ** 20, 10 ** 20) for _ in range(3000)} - set(range(0, 3000 * 64))) + \
+            list(range(0, 3000 * 64, 64))
+        hash_map = StaticPerfectHashMap.build(keys, values=range(len(keys)), seed=0)
+        self.assertEqual(len(keys), len(hash_map))
+        for i, k in enumerate(keys):
+            self.assertEqual(i, hash_map[k])
+        for k in range(1, 3000 * 64, 64):
+            self.assertNotIn(k, hash_map)
+        self.assertRaises(KeyError, lambda: hash_map[1])
+
+        slot_map = StaticPerfectHashMap.build(keys)
+        slots = [slot_map[k] for k in keys]
+        self.assertEqual(len(keys), len(set(slots)))
+        self.assertTrue(all(0 <= i < slot_map.slot_count for i in slots))
+        self.assertEqual(-1, slot_map.index(-1))
+
+    def test_str_keys_and_files(self):
+        keys = ['key-%d' % k for k in range(2000)]
+        hash_map = StaticPerfectHashMap.build(keys, values=(k * k for k in range(2000)))
+        with tempfile.TemporaryDirectory() as dir_path:
+            path = os.path.join(dir_path, 'perfect_hash.bin')
+            hash_map.save(path)
+            loaded = StaticPerfectHashMap.load(path)
+            self.assertEqual(2000, len(loaded))
+            self.assertEqual(str(hash_map.params), str(loaded.params))
+            for k in range(2000):
+                self.assertEqual(k * k, loaded['key-%d' % k])
+                self.assertNotIn('key-%d' % (k + 2000), loaded)
+            params = str(loaded.params)
+            loaded.close()
+            self.assertEqual(params, str(loaded.params))
+
+            StaticPerfectHashMap.build([]).save(path)
+            loaded = StaticPerfectHashMap.load(path)
+            self.assertEqual(0, len(loaded))
+            self.assertNotIn(0, loaded)
+            loaded.close()
+
+            with open(path, 'wb') as f:
+                f.write(bytes(100))
+            self.assertRaises(ValueError, lambda: StaticPerfectHashMap.load(path))
+            hash_map.save(path)
+            with open(path, 'r+b') as f:
+                f.truncate(1000)
+            self.assertRaises(ValueError, lambda: StaticPerfectHashMap.load(path))
+
+    def test_duplicate_keys(self):
+        with self.assertRaises(ValueError) as context:
+            StaticPerfectHashMap.build([3, 1, 4, 1, 5])
+        self.assertIn('Duplicate', str(context.exception))
+
+        # Distinct fingerprints whose mixed values are the same modulo the prime, which no try can separate.
+        k1, k2 = 2213671369136483647, 1699851159931085648
+        self.assertEqual(_mix(k1) % _PRIME, _mix(k2) % _PRIME)
+        with self.assertRaises(ValueError) as context:
+            StaticPerfectHashMap.build(k for k in list(range(100)) + [k1, k2])
+        self.assertNotIn('Duplicate', str(context.exception))
+
+    def test_key_types(self):
+        int_map, str_map = StaticPerfectHashMap.build(range(100)), StaticPerfectHashMap.build(['a', 'b'])
+        for hash_map, k in ((int_map, 'a'), (int_map, 1.0), (str_map, 3), (str_map, b'a')):
+            self.assertNotIn(k, hash_map)
+            self.assertEqual(-1, hash_map.index(k))
+            self.assertRaises(KeyError, lambda: hash_map[k])
+        self.assertRaises(ValueError, lambda: StaticPerfectHashMap.build([1, 'a']))
+        self.assertRaises(ValueError, lambda: StaticPerfectHashMap.build(['a', 1]))
+        self.assertRaises(ValueError, lambda: StaticPerfectHashMap.build([1.5]))
@@ -18,10 +18,34 @@ class RBTreeNode(BinaryTreeNode):
         self.aug = None
 
 
+class CompactRBTreeNode(object):
+    """
+    A drop-in replacement for RBTreeNode with its attributes in __slots__: no child list, no per-node dict, and plain
+    attribute access for left and right. The extra value slot lets a map keep the key in data and the value next to
+    it, instead of wrapping each entry in another object.
+    """
+    __slots__ = ('data', 'value', 'left', 'right', 'parent', 'color', 'aug')
+
+    def __init__(self, data, color: bool):
+        self.data = data
+        self.value = None
+        self.left = self.right = self.parent = None
+        self.color = color
+        self.aug = None
+
+
 class RBTree(object):
-    def __init__(self, key=None):
-        nil = self.nil = RBTreeNode(None, RB_BLACK)
-        nil.left = nil.right = nil.parent = nil
+    def __init__(self, key=None, node_class=RBTreeNode, nil=None):
+        """
+        :param key: The key getter of node data, the data itself by default.
+        :param node_class: RBTreeNode or CompactRBTreeNode.
+        :param nil: The sentinel of another tree to share, so that subtrees can move between the two in O(1) time.
+        """
+        self.node_class = node_class
+        if nil is None:
+            nil = node_class(None, RB_BLACK)
+            nil.left = nil.right = nil.parent = nil
+        self.nil = nil
         self.key = key or default_key
         self.root = nil
         # Problem 13-2(a)
@@ -64,35 +88,116 @@ def rb_predecessor(rbt: RBTree, node: RBTreeNode):
     return rbt.nil
 
 
+def rb_iter_nodes(rbt: RBTree, lo=None, hi=None, inclusive=(True, True), reverse=False):
+    """
+    In-order traversal with an explicit stack of the pending ancestors. Seeking to the first node takes O(lg n) time
+    and each following step O(1) amortized, with no parent chain walks. The tree must not be modified during the
+    traversal.
+    :param rbt:
+    :param lo: The lower bound of the keys, None for no bound.
+    :param hi: The upper bound of the keys, None for no bound.
+    :param inclusive: Whether lo and hi themselves are included.
+    :param reverse: Whether to go from the largest key down.
+    :return: A generator of the nodes.
+    """
+    nil = rbt.nil
+    key = rbt.key
+    lo_inclusive, hi_inclusive = inclusive
+    stack = []
+    node = rbt.root
+    if not reverse:
+        while node is not nil:
+            k = key(node.data)
+            if lo is None or k > lo or (lo_inclusive and k == lo):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            if hi is not None:
+                k = key(node.data)
+                if k > hi or (not hi_inclusive and k == hi):
+                    return
+            yield node
+            node = node.right
+            while node is not nil:
+                stack.append(node)
+                node = node.left
+    else:
+        while node is not nil:
+            k = key(node.data)
+            if hi is None or k < hi or (hi_inclusive and k == hi):
+                stack.append(node)
+                node = node.right
+            else:
+                node = node.left
+        while stack:
+            node = stack.pop()
+            if lo is not None:
+                k = key(node.data)
+                if k < lo or (not lo_inclusive and k == lo):
+                    return
+            yield node
+            node = node.left
+            while node is not nil:
+                stack.append(node)
+                node = node.right
+
+
 def rb_iter(rbt: RBTree):
-    if rbt.root == rbt.nil:
-        return
-    node = rb_min(rbt, rbt.root)
-    while node != rbt.nil:
-        yield(node.data)
-        node = rb_successor(rbt, node)
+    for node in rb_iter_nodes(rbt):
+        yield node.data
 
 
 def rb_iter_reversed(rbt: RBTree):
-    if rbt.root == rbt.nil:
-        return
-    node = rb_max(rbt, rbt.root)
-    while node != rbt.nil:
-        yield(node.data)
-        node = rb_predecessor(rbt, node)
+    for node in rb_iter_nodes(rbt, reverse=True):
+        yield node.data
 
 
-def rb_search(rbt: RBTree, k):
-    node = rbt.root
+def rb_floor(rbt: RBTree, k):
+    """The node with the largest key no greater than k, or rbt.nil if there's none."""
+    node, result = rbt.root, rbt.nil
     key = rbt.key
-    while node != rbt.nil:
-        if k == key(node.data):
-            return node
-        if k < key(node.data):
+    while node is not rbt.nil:
+        if key(node.data) <= k:
+            result = node
+            node = node.right
+        else:
+            node = node.left
+    return result
+
+
+def rb_ceiling(rbt: RBTree, k):
+    """The node with the smallest key no less than k, or rbt.nil if there's none."""
+    node, result = rbt.root, rbt.nil
+    key = rbt.key
+    while node is not rbt.nil:
+        if key(node.data) >= k:
+            result = node
             node = node.left
         else:
             node = node.right
-    return rbt.nil
+    return result
+
+
+def rb_search(rbt: RBTree, k):
+    node = rbt.root
+    nil = rbt.nil
+    key = rbt.key
+    if key is default_key:
+        while node is not nil:
+            node_key = node.data
+            if k == node_key:
+                return node
+            node = node.left if k < node_key else node.right
+        return nil
+    while node is not nil:
+        node_key = key(node.data)
+        if k == node_key:
+            return node
+        node = node.left if k < node_key else node.right
+    return nil
 
 
 def rb_left_rotate(rbt, node, on_complete):
@@ -210,22 +315,21 @@ def rb_insert(rbt: RBTree, data) -> RBTreeNode:
 
 
 def rb_insert_raw(rbt: RBTree, data) -> RBTreeNode:
-    new_node = RBTreeNode(data, RB_RED)
+    new_node = rbt.node_class(data, RB_RED)
     node = rbt.root
+    nil = rbt.nil
     key = rbt.key
-    p = rbt.nil
+    p = nil
     k = key(data)
-    while node != rbt.nil:
+    go_left = True
+    while node is not nil:
         p = node
-        node_key = key(node.data)
-        if k <= node_key:
-            node = node.left
-        elif k > node_key:
-            node = node.right
-    new_node.left = new_node.right = new_node.parent = rbt.nil
-    if p == rbt.nil:
+        go_left = k <= (node.data if key is default_key else key(node.data))
+        node = node.left if go_left else node.right
+    new_node.left = new_node.right = new_node.parent = nil
+    if p is nil:
         rbt.root = new_node
-    elif k <= key(p.data):
+    elif go_left:
         p.left = new_node
     else:
         p.right = new_node
@@ -233,6 +337,43 @@ def rb_insert_raw(rbt: RBTree, data) -> RBTreeNode:
     return new_node
 
 
+def rb_build_sorted(rbt: RBTree, sorted_data,
+                    on_subtree_built: Optional[Callable[[RBTreeNode], None]]=None) -> list:
+    """
+    Replaces the contents of rbt with a perfectly balanced tree of sorted_data in O(n) time, without any search,
+    rotation or fixup. Every level is full except maybe the deepest one, whose nodes are colored red and all others
+    black, so that all paths have the same black height.
+    :param rbt:
+    :param sorted_data: The data, sorted by key.
+    :param on_subtree_built: Called on each node once both of its subtrees are built, to fill in the augmented data.
+    :return: The new nodes in key order.
+    """
+    nil = rbt.nil
+    node_class = rbt.node_class
+    nodes = [node_class(data, RB_BLACK) for data in sorted_data]
+    n = len(nodes)
+    # Levels 0 .. red_depth - 1 are full.
+    red_depth = (n + 1).bit_length() - 1
+
+    def build(lo, hi, depth, parent):
+        if lo >= hi:
+            return nil
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        node.parent = parent
+        if depth == red_depth:
+            node.color = RB_RED
+        node.left = build(lo, mid, depth + 1, node)
+        node.right = build(mid + 1, hi, depth + 1, node)
+        if on_subtree_built:
+            on_subtree_built(node)
+        return node
+
+    rbt.root = build(0, n, 0, nil)
+    rbt.bh = red_depth
+    return nodes
+
+
 def rb_transplant(rbt: RBTree, u: RBTreeNode, v: RBTreeNode):
     """
     The red-black tree version of transplant operation. Replacing the subtree rooted at u with that rooted at v.
@@ -403,6 +544,20 @@ def rb_node_count(rbt: RBTree, node: RBTreeNode):
 
 
 class TestRBTreeBasicOps(TestCase):
+    def test_build_sorted(self):
+        for node_class in (RBTreeNode, CompactRBTreeNode):
+            for n in list(range(20)) + [100, 127, 128, 1000]:
+                rbt = RBTree(node_class=node_class)
+                nodes = rb_build_sorted(rbt, range(n))
+                rb_assert_properties(rbt)
+                self.assertEqual(n, rb_node_count(rbt, rbt.root))
+                self.assertSequenceEqual(list(range(n)), list(rb_iter(rbt)))
+                self.assertSequenceEqual(list(range(n)), [node.data for node in nodes])
+                for k in range(0, n, 7):
+                    rb_pop(rbt, rb_search(rbt, k))
+                    rb_insert(rbt, k + 0.5)
+                    rb_assert_properties(rbt)
+
     def test_basic(self):
         rbt = RBTree()
         insertion_seq = (41, 38, 31, 12, 19, 8)
@@ -419,7 +574,10 @@ class TestRBTreeBasicOps(TestCase):
         self.assertSequenceEqual((), list(rb_iter(rbt)))
 
     def test_rand_insert_delete(self):
-        rbt = RBTree()
+        for node_class in (RBTreeNode, CompactRBTreeNode):
+            self._test_rand_insert_delete(RBTree(node_class=node_class))
+
+    def _test_rand_insert_delete(self, rbt: RBTree):
         insertion_seq = list(range(1000))
         rand_permutate(insertion_seq)
         values = []
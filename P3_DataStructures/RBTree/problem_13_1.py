@@ -0,0 +1,420 @@
+from Common.map import Map
+from P3_DataStructures.RBTree.sorted_map import SortedMap
+from typing import Optional
+from unittest import TestCase
+from random import randint, shuffle
+import time
+
+
+class PersistentTreeNode(object):
+    """
+    Node of a persistent tree. Nodes are never modified once they are reachable from a root, so they can be shared
+    between versions. There's no parent pointer, see Problem 13-1(b).
+    """
+    __slots__ = ('data', 'value', 'left', 'right', 'height')
+
+    def __init__(self, data, value, left, right):
+        self.data = data
+        self.value = value
+        self.left = left
+        self.right = right
+        self.height = max(left.height if left else -1, right.height if right else -1) + 1
+
+
+def _height(node: Optional[PersistentTreeNode]) -> int:
+    return node.height if node else -1
+
+
+def _balanced(data, value, left, right) -> PersistentTreeNode:
+    """
+    Makes a node from two subtrees whose heights differ by at most 2, rotating as in avl_balance. Rotations allocate
+    new nodes instead of relinking the old ones, at most 3 of them.
+    """
+    lh, rh = _height(left), _height(right)
+    if lh > rh + 1:
+        if _height(left.right) > _height(left.left):
+            lr = left.right
+            return PersistentTreeNode(lr.data, lr.value, PersistentTreeNode(left.data, left.value, left.left, lr.left),
+                                      PersistentTreeNode(data, value, lr.right, right))
+        return PersistentTreeNode(left.data, left.value, left.left,
+                                  PersistentTreeNode(data, value, left.right, right))
+    if rh > lh + 1:
+        if _height(right.left) > _height(right.right):
+            rl = right.left
+            return PersistentTreeNode(rl.data, rl.value, PersistentTreeNode(data, value, left, rl.left),
+                                      PersistentTreeNode(right.data, right.value, rl.right, right.right))
+        return PersistentTreeNode(right.data, right.value, PersistentTreeNode(data, value, left, right.left),
+                                  right.right)
+    return PersistentTreeNode(data, value, left, right)
+
+
+def persistent_insert(root: Optional[PersistentTreeNode], k, v) -> tuple:
+    """
+    Problem 13-1(c) with the AVL balancing of Problem 13-3. Only the nodes on the path from the root to k are copied,
+    plus O(1) more per rotation, so O(lg n) nodes are allocated and the old root is still a valid tree.
+    :return: (new root, whether k is a new key).
+    """
+    if not root:
+        return PersistentTreeNode(k, v, None, None), True
+    if k < root.data:
+        left, added = persistent_insert(root.left, k, v)
+        return _balanced(root.data, root.value, left, root.right), added
+    if root.data < k:
+        right, added = persistent_insert(root.right, k, v)
+        return _balanced(root.data, root.value, root.left, right), added
+    return PersistentTreeNode(k, v, root.left, root.right), False
+
+
+def _pop_min(root: PersistentTreeNode) -> tuple:
+    """:return: (root of the subtree without its minimum, the minimum node)."""
+    if not root.left:
+        return root.right, root
+    left, min_node = _pop_min(root.left)
+    return _balanced(root.data, root.value, left, root.right), min_node
+
+
+def persistent_pop(root: Optional[PersistentTreeNode], k) -> Optional[PersistentTreeNode]:
+    """
+    Deletes k by path copying in O(lg n) time and new nodes. Raises a KeyError if k isn't in the tree.
+    :return: The new root.
+    """
+    if not root:
+        raise KeyError(str(k))
+    if k < root.data:
+        return _balanced(root.data, root.value, persistent_pop(root.left, k), root.right)
+    if root.data < k:
+        return _balanced(root.data, root.value, root.left, persistent_pop(root.right, k))
+    if not root.left:
+        return root.right
+    if not root.right:
+        return root.left
+    right, successor = _pop_min(root.right)
+    return _balanced(successor.data, successor.value, root.left, right)
+
+
+def persistent_search(root: Optional[PersistentTreeNode], k) -> Optional[PersistentTreeNode]:
+    node = root
+    while node:
+        if k < node.data:
+            node = node.left
+        elif node.data < k:
+            node = node.right
+        else:
+            return node
+    return None
+
+
+def persistent_build_sorted(items, lo: int = 0, hi: int = None) -> Optional[PersistentTreeNode]:
+    """Builds a tree of minimum height from (key, value) pairs in increasing key order in O(n) time."""
+    if hi is None:
+        hi = len(items)
+    if lo >= hi:
+        return None
+    mid = (lo + hi) // 2
+    k, v = items[mid]
+    left = persistent_build_sorted(items, lo, mid)
+    return PersistentTreeNode(k, v, left, persistent_build_sorted(items, mid + 1, hi))
+
+
+def persistent_iter_nodes(root: Optional[PersistentTreeNode], lo=None, hi=None, inclusive=(True, True),
+                          reverse=False):
+    """
+    The same in-order traversal as rb_iter_nodes. Since the nodes of a version never change, the tree may be modified
+    during the traversal, which keeps going over the version it started from.
+    """
+    lo_inclusive, hi_inclusive = inclusive
+    stack = []
+    node = root
+    if not reverse:
+        while node:
+            k = node.data
+            if lo is None or k > lo or (lo_inclusive and k == lo):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            if hi is not None:
+                k = node.data
+                if k > hi or (not hi_inclusive and k == hi):
+                    return
+            yield node
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+    else:
+        while node:
+            k = node.data
+            if hi is None or k < hi or (hi_inclusive and k == hi):
+                stack.append(node)
+                node = node.right
+            else:
+                node = node.left
+        while stack:
+            node = stack.pop()
+            if lo is not None:
+                k = node.data
+                if k < lo or (not lo_inclusive and k == lo):
+                    return
+            yield node
+            node = node.left
+            while node:
+                stack.append(node)
+                node = node.right
+
+
+class PersistentSortedMap(Map):
+    """
+    Sorted map whose versions share structure, with the same API as SortedMap. snapshot() takes O(1) time, and each
+    insertion or deletion copies O(lg n) nodes into a new version instead of modifying the current one.
+
+    A version is immutable, so any number of threads can read a snapshot, or iterate over the map itself, without
+    locks while one writer keeps modifying the map. Concurrent writers of the same map still need to be serialized.
+    """
+    def __init__(self):
+        super().__init__()
+        # The current version, (root, length), replaced by a single assignment so that readers never see the root of
+        # one version with the length of another.
+        self._version = (None, 0)
+
+    @staticmethod
+    def from_sorted(items) -> 'PersistentSortedMap':
+        """Builds a map from (key, value) pairs in strictly increasing key order in O(n) time."""
+        items = list(items)
+        for i in range(1, len(items)):
+            assert items[i - 1][0] < items[i][0], 'Keys are not strictly increasing'
+        persistent_map = PersistentSortedMap()
+        persistent_map._version = (persistent_build_sorted(items), len(items))
+        return persistent_map
+
+    def snapshot(self) -> 'PersistentSortedMap':
+        """
+        A point-in-time view of this map in O(1) time. The snapshot and this map can both be modified afterwards
+        without affecting each other.
+        """
+        snapshot = PersistentSortedMap()
+        snapshot._version = self._version
+        return snapshot
+
+    def pop(self, k):
+        root, length = self._version
+        self._version = (persistent_pop(root, k), length - 1)
+
+    def items(self):
+        for node in persistent_iter_nodes(self._version[0]):
+            yield node.data, node.value
+
+    def __contains__(self, k):
+        return persistent_search(self._version[0], k) is not None
+
+    def __setitem__(self, k, v):
+        root, length = self._version
+        root, added = persistent_insert(root, k, v)
+        self._version = (root, length + 1 if added else length)
+
+    def __len__(self):
+        return self._version[1]
+
+    def __iter__(self):
+        return self.keys()
+
+    def __reversed__(self):
+        for node in persistent_iter_nodes(self._version[0], reverse=True):
+            yield node.data
+
+    def __getitem__(self, k):
+        node = persistent_search(self._version[0], k)
+        if node is None:
+            raise KeyError(str(k))
+        return node.value
+
+    def values(self):
+        for node in persistent_iter_nodes(self._version[0]):
+            yield node.value
+
+    def keys(self):
+        for node in persistent_iter_nodes(self._version[0]):
+            yield node.data
+
+    def irange(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """Iterates over the keys between lo and hi of the current version lazily, see SortedMap.irange."""
+        for node in persistent_iter_nodes(self._version[0], lo, hi, inclusive, reverse):
+            yield node.data
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """The same as irange, with (key, value) pairs."""
+        for node in persistent_iter_nodes(self._version[0], lo, hi, inclusive, reverse):
+            yield node.data, node.value
+
+    def floor(self, k):
+        """The (key, value) pair with the largest key no greater than k. Raises a KeyError if there's none."""
+        node, result = self._version[0], None
+        while node:
+            if node.data <= k:
+                result = node
+                node = node.right
+            else:
+                node = node.left
+        if result is None:
+            raise KeyError(str(k))
+        return result.data, result.value
+
+    def ceiling(self, k):
+        """The (key, value) pair with the smallest key no less than k. Raises a KeyError if there's none."""
+        node, result = self._version[0], None
+        while node:
+            if node.data >= k:
+                result = node
+                node = node.left
+            else:
+                node = node.right
+        if result is None:
+            raise KeyError(str(k))
+        return result.data, result.value
+
+    def bisect_left(self, k) -> int:
+        """The number of keys less than k, in O(n) time."""
+        return sum(1 for _ in persistent_iter_nodes(self._version[0], hi=k, inclusive=(True, False)))
+
+    def bisect_right(self, k) -> int:
+        """The number of keys no greater than k, in O(n) time."""
+        return sum(1 for _ in persistent_iter_nodes(self._version[0], hi=k))
+
+
+def _all_nodes(root: Optional[PersistentTreeNode]) -> list:
+    return list(persistent_iter_nodes(root))
+
+
+class TestPersistentSortedMap(TestCase):
+    def _assert_avl_properties(self, root: Optional[PersistentTreeNode]):
+        if not root:
+            return
+        lh, rh = _height(root.left), _height(root.right)
+        self.assertLessEqual(abs(lh - rh), 1)
+        self.assertEqual(max(lh, rh) + 1, root.height)
+        if root.left:
+            self.assertLess(root.left.data, root.data)
+            self._assert_avl_properties(root.left)
+        if root.right:
+            self.assertLess(root.data, root.right.data)
+            self._assert_avl_properties(root.right)
+
+    def test_basic(self):
+        persistent_map = PersistentSortedMap()
+        for k in (41, 38, 31, 12, 19, 8):
+            persistent_map[k] = str(k)
+        self.assertEqual(6, len(persistent_map))
+        self.assertEqual('19', persistent_map[19])
+        self.assertNotIn(20, persistent_map)
+        self.assertRaises(KeyError, persistent_map.__getitem__, 20)
+        self.assertRaises(KeyError, persistent_map.pop, 20)
+        self.assertListEqual([8, 12, 19, 31, 38, 41], list(persistent_map))
+        self.assertListEqual([41, 38, 31, 19, 12, 8], list(reversed(persistent_map)))
+        self.assertListEqual([12, 19, 31], list(persistent_map.irange(10, 31)))
+        self.assertEqual((19, '19'), persistent_map.floor(30))
+        self.assertEqual((31, '31'), persistent_map.ceiling(30))
+        self.assertRaises(KeyError, persistent_map.floor, 7)
+        self.assertEqual(2, persistent_map.bisect_left(19))
+        self.assertEqual(3, persistent_map.bisect_right(19))
+
+    def test_snapshots(self):
+        persistent_map = PersistentSortedMap()
+        expected = {}
+        versions = []
+        for _ in range(2000):
+            k = randint(0, 300)
+            if k in expected and randint(0, 1):
+                persistent_map.pop(k)
+                expected.pop(k)
+            else:
+                persistent_map[k] = k * 2
+                expected[k] = k * 2
+            self._assert_avl_properties(persistent_map._version[0])
+            if randint(0, 9) == 0:
+                versions.append((persistent_map.snapshot(), sorted(expected.items())))
+        self.assertListEqual(sorted(expected.items()), list(persistent_map.items()))
+        for snapshot, snapshot_items in versions:
+            self.assertEqual(len(snapshot_items), len(snapshot))
+            self.assertListEqual(snapshot_items, list(snapshot.items()))
+
+        # A snapshot can be modified independently too.
+        if versions:
+            snapshot, snapshot_items = versions[0]
+            snapshot[1000] = 0
+            self.assertNotIn(1000, persistent_map)
+
+    def test_path_copying(self):
+        n = 1000
+        keys = list(range(n))
+        shuffle(keys)
+        persistent_map = PersistentSortedMap()
+        for k in keys:
+            persistent_map[k] = k
+        max_new_nodes = 0
+        for _ in range(200):
+            before = {id(node) for node in _all_nodes(persistent_map._version[0])}
+            snapshot = persistent_map.snapshot()
+            if randint(0, 1):
+                persistent_map[randint(0, 2 * n)] = 0
+            else:
+                k = randint(0, 2 * n)
+                if k in persistent_map:
+                    persistent_map.pop(k)
+            new_nodes = sum(id(node) not in before for node in _all_nodes(persistent_map._version[0]))
+            max_new_nodes = max(max_new_nodes, new_nodes)
+            del snapshot
+        # 1.44 lg n levels, each copied along with at most 2 rotated nodes.
+        self.assertLessEqual(max_new_nodes, 3 * 1.44 * n.bit_length())
+
+    def test_iteration_during_modification(self):
+        persistent_map = PersistentSortedMap.from_sorted((k, k) for k in range(100))
+        self._assert_avl_properties(persistent_map._version[0])
+        seen = []
+        for k in persistent_map.irange(10, 20):
+            seen.append(k)
+            persistent_map.pop(k)
+            persistent_map[k + 1000] = k
+        self.assertListEqual(list(range(10, 21)), seen)
+        self.assertEqual(100, len(persistent_map))
+        self.assertNotIn(15, persistent_map)
+
+
+def _main():
+    n = 1000000
+    keys = list(range(n))
+    shuffle(keys)
+    persistent_map = PersistentSortedMap()
+    start_time = time.time()
+    for k in keys:
+        persistent_map[k] = k
+    print('PersistentSortedMap: %.0f inserts/s.' % (n / (time.time() - start_time)))
+    sorted_map = SortedMap()
+    start_time = time.time()
+    for k in keys:
+        sorted_map[k] = k
+    print('SortedMap: %.0f inserts/s.' % (n / (time.time() - start_time)))
+
+    start_time = time.time()
+    for k in keys:
+        persistent_map[k]
+    print('PersistentSortedMap: %.0f searches/s.' % (n / (time.time() - start_time)))
+
+    # Without persistence, a consistent view for a reader means copying the whole map.
+    m = 3
+    start_time = time.time()
+    for _ in range(m):
+        SortedMap.from_sorted(sorted_map.items())
+    print('SortedMap copy: %.3fs per snapshot.' % ((time.time() - start_time) / m))
+    m = 10000
+    snapshots = []
+    start_time = time.time()
+    for i in range(m):
+        snapshots.append(persistent_map.snapshot())
+        persistent_map[n + i] = i
+    print('PersistentSortedMap snapshot and insert: %.6fs per snapshot.' % ((time.time() - start_time) / m))
+
+
+if __name__ == '__main__':
+    _main()
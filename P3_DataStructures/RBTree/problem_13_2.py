@@ -0,0 +1,464 @@
+from P3_DataStructures.RBTree.basic_ops import RBTree, RBTreeNode, CompactRBTreeNode, RB_BLACK, RB_RED, rb_insert, \
+    rb_insert_fixup, rb_pop, rb_min, rb_iter, rb_iter_nodes, rb_build_sorted, rb_assert_properties
+from abc import ABC, abstractmethod
+from multiprocessing import Pool
+from unittest import TestCase
+from random import sample
+import pickle
+import time
+
+
+class JoinBasedSetOps(ABC):
+    """
+    Split and set operations on balanced binary search trees written with join alone, after Blelloch, Ferizovic and
+    Sun, "Just Join for Parallel Ordered Sets". Subclasses supply the primitives that depend on the balancing scheme,
+    on handles of subtrees of the same tree type: is_empty, key_of, empty, expose, join and pop_min, and to_list and
+    from_list for the optional worker processes.
+
+    The union, intersection or difference of trees of sizes m <= n takes O(m lg(n / m + 1)) time. The trees must
+    have unique keys. All operations are destructive: the nodes of the input trees are relinked into the results,
+    so the inputs can't be used afterwards.
+    """
+    @abstractmethod
+    def is_empty(self, t) -> bool:
+        pass
+
+    @abstractmethod
+    def key_of(self, node):
+        pass
+
+    @abstractmethod
+    def empty(self):
+        """The handle of an empty tree."""
+        pass
+
+    @abstractmethod
+    def expose(self, t) -> tuple:
+        """
+        Takes a non-empty tree apart in O(1) time.
+        :return: (the left subtree, the detached root, the right subtree).
+        """
+        pass
+
+    @abstractmethod
+    def join(self, t1, node, t2):
+        """
+        :param t1: A tree whose keys are all less than that of node.
+        :param node: A detached node.
+        :param t2: A tree whose keys are all greater than that of node.
+        :return: The tree of t1, node and t2.
+        """
+        pass
+
+    @abstractmethod
+    def pop_min(self, t) -> tuple:
+        """:return: (t without its minimum, the detached minimum node)."""
+        pass
+
+    @abstractmethod
+    def to_list(self, t) -> list:
+        """The contents of the nodes of t in key order, as plain data to send to another process."""
+        pass
+
+    @abstractmethod
+    def from_list(self, contents: list):
+        """A tree of new nodes from the result of to_list, in O(n) time."""
+        pass
+
+    def join2(self, t1, t2):
+        """Join without a middle node, in O(lg n) time."""
+        if self.is_empty(t2):
+            return t1
+        t2, node = self.pop_min(t2)
+        return self.join(t1, node, t2)
+
+    def split(self, t, k) -> tuple:
+        """
+        Splits t by k in O(lg n) time.
+        :return: (the tree of the keys less than k, the detached node of k or None, the tree of the keys greater
+        than k).
+        """
+        if self.is_empty(t):
+            return t, None, self.empty()
+        left, node, right = self.expose(t)
+        node_key = self.key_of(node)
+        if k < node_key:
+            left_left, found, left_right = self.split(left, k)
+            return left_left, found, self.join(left_right, node, right)
+        if node_key < k:
+            right_left, found, right_right = self.split(right, k)
+            return self.join(left, node, right_left), found, right_right
+        return left, node, right
+
+    def union(self, t1, t2, workers: int = None) -> tuple:
+        """
+        :param workers: Opt-in: the number of worker processes to farm independent pairs of subtrees out to, None to
+        run in this process. The subtrees are sent to the workers and back as lists, see to_list, and the results of
+        the workers get new nodes. Rebuilding them takes about as long as the operation itself with plain keys, so
+        this only pays off for large trees on several cores when comparing keys is expensive. Trees whose key getter
+        or data can't be pickled, like a lambda key, are always processed in this process.
+        :return: (the tree of the keys in either tree, the number of keys in both). The nodes of t1 are kept for
+        the keys in both.
+        """
+        return self._run_top_level('union', t1, t2, workers)
+
+    def intersection(self, t1, t2, workers: int = None) -> tuple:
+        """
+        See union.
+        :return: (the tree of the keys in both trees, with the nodes of t1, the number of such keys).
+        """
+        return self._run_top_level('intersection', t1, t2, workers)
+
+    def difference(self, t1, t2, workers: int = None) -> tuple:
+        """
+        See union.
+        :return: (the tree of the keys in t1 but not in t2, the number of keys in both).
+        """
+        return self._run_top_level('difference', t1, t2, workers)
+
+    def _base_case(self, operation: str, t1, t2):
+        """The result if either tree is empty."""
+        if operation == 'union':
+            return t2 if self.is_empty(t1) else t1
+        if operation == 'intersection':
+            return t1 if self.is_empty(t1) else t2
+        return t1
+
+    def _divide(self, operation: str, t1, t2) -> tuple:
+        """
+        Splits the operation on two non-empty trees into two independent ones.
+        :return: ((t1 left, t2 left), (t1 right, t2 right), the node to join both results with or None, whether the
+        splitting key is in both trees).
+        """
+        if operation == 'difference':
+            left2, node, right2 = self.expose(t2)
+            left1, found, right1 = self.split(t1, self.key_of(node))
+            return (left1, left2), (right1, right2), None, found is not None
+        left1, node, right1 = self.expose(t1)
+        left2, found, right2 = self.split(t2, self.key_of(node))
+        if operation == 'intersection' and found is None:
+            node = None
+        return (left1, left2), (right1, right2), node, found is not None
+
+    def _combine(self, left, node, right):
+        return self.join(left, node, right) if node is not None else self.join2(left, right)
+
+    def _run(self, operation: str, t1, t2) -> tuple:
+        if self.is_empty(t1) or self.is_empty(t2):
+            return self._base_case(operation, t1, t2), 0
+        (left1, left2), (right1, right2), node, found = self._divide(operation, t1, t2)
+        left, left_matches = self._run(operation, left1, left2)
+        right, right_matches = self._run(operation, right1, right2)
+        return self._combine(left, node, right), left_matches + right_matches + found
+
+    def _run_top_level(self, operation: str, t1, t2, workers: int = None) -> tuple:
+        if not workers or not self._picklable():
+            return self._run(operation, t1, t2)
+
+        # Divide sequentially for a few levels, for about twice as many tasks as workers, then join the results of
+        # the tasks back up in the same shape.
+        tasks = []
+
+        def divide(_t1, _t2, depth):
+            if self.is_empty(_t1) or self.is_empty(_t2):
+                return self._base_case(operation, _t1, _t2), 0
+            if depth == 0:
+                tasks.append((self, operation, self.to_list(_t1), self.to_list(_t2)))
+                return len(tasks) - 1
+            _left_operands, _right_operands, _node, _found = self._divide(operation, _t1, _t2)
+            return divide(*_left_operands, depth - 1), _node, divide(*_right_operands, depth - 1), _found
+
+        plan = divide(t1, t2, workers.bit_length() + 1)
+        with Pool(workers) as pool:
+            task_results = pool.starmap(_run_task, tasks)
+
+        def conquer(_plan):
+            if isinstance(_plan, int):
+                _contents, _matches = task_results[_plan]
+                return self.from_list(_contents), _matches
+            if len(_plan) == 2:
+                return _plan
+            _left_plan, _node, _right_plan, _found = _plan
+            _left, _left_matches = conquer(_left_plan)
+            _right, _right_matches = conquer(_right_plan)
+            return self._combine(_left, _node, _right), _left_matches + _right_matches + _found
+
+        return conquer(plan)
+
+    def _picklable(self) -> bool:
+        """Whether this object, with the key getter of its trees, can be sent to a worker process."""
+        try:
+            pickle.dumps(self)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return False
+        return True
+
+
+def _run_task(ops: JoinBasedSetOps, operation: str, contents1: list, contents2: list) -> tuple:
+    result, matches = ops._run(operation, ops.from_list(contents1), ops.from_list(contents2))
+    return ops.to_list(result), matches
+
+
+def rb_adopt_nodes(rbt: RBTree, other: RBTree):
+    """
+    Moves the nodes of other onto the sentinel of rbt in O(|other|) time, so that the two trees can be joined.
+    """
+    old_nil, nil = other.nil, rbt.nil
+    if old_nil is nil:
+        return
+    stack = [other.root] if other.root is not old_nil else []
+    while stack:
+        node = stack.pop()
+        if node.left is old_nil:
+            node.left = nil
+        else:
+            stack.append(node.left)
+        if node.right is old_nil:
+            node.right = nil
+        else:
+            stack.append(node.right)
+    other.nil = nil
+    if other.root is old_nil:
+        other.root = nil
+    else:
+        other.root.parent = nil
+
+
+class RBJoinOps(JoinBasedSetOps):
+    """
+    The join primitives of red-black trees sharing the sentinel of a given tree. A subtree is handled as a
+    (root, black height) pair, with a black root.
+    """
+    def __init__(self, rbt: RBTree):
+        self.nil = rbt.nil
+        self.key = rbt.key
+        # Lets the fixups of basic_ops work on subtrees.
+        self._rbt = RBTree(rbt.key, rbt.node_class, rbt.nil)
+
+    def is_empty(self, t: tuple) -> bool:
+        return t[0] is self.nil
+
+    def key_of(self, node):
+        return self.key(node.data)
+
+    def empty(self) -> tuple:
+        return self.nil, 0
+
+    def expose(self, t: tuple) -> tuple:
+        root, bh = t
+        nil = self.nil
+        left, right = root.left, root.right
+        # A black child is one black node lower, and a red one can simply be recolored.
+        left_bh = bh - 1 if left.color == RB_BLACK else bh
+        right_bh = bh - 1 if right.color == RB_BLACK else bh
+        left.color = right.color = RB_BLACK
+        left.parent = right.parent = nil
+        root.left = root.right = root.parent = nil
+        return (left, left_bh), root, (right, right_bh)
+
+    def join(self, t1: tuple, x, t2: tuple) -> tuple:
+        """
+        Problem 13-2(b-f). x replaces the black node on the spine of the taller tree whose black height equals that of
+        the shorter tree, with that node and the shorter tree as its children, and is fixed up as a newly inserted red
+        node, in O(|bh1 - bh2| + 1) time.
+        """
+        (root1, bh1), (root2, bh2) = t1, t2
+        nil = self.nil
+        x.color = RB_RED
+        if bh1 >= bh2:
+            p, y, bh = nil, root1, bh1
+            while y.color == RB_RED or bh > bh2:
+                p, y = y, y.right
+                if y.color == RB_BLACK:
+                    bh -= 1
+            x.left, x.right, x.parent = y, root2, p
+            root, result_bh = root1, bh1
+            if p is not nil:
+                p.right = x
+        else:
+            p, y, bh = nil, root2, bh2
+            while y.color == RB_RED or bh > bh1:
+                p, y = y, y.left
+                if y.color == RB_BLACK:
+                    bh -= 1
+            x.left, x.right, x.parent = root1, y, p
+            root, result_bh = root2, bh2
+            p.left = x
+        x.left.parent = x.right.parent = x
+        if p is nil:
+            # Both trees had the same black height.
+            x.color = RB_BLACK
+            nil.parent = nil
+            return x, bh + 1
+        rbt = self._rbt
+        rbt.root, rbt.bh = root, result_bh
+        rb_insert_fixup(rbt, x)
+        result = rbt.root, rbt.bh
+        rbt.root = nil.parent = nil
+        return result
+
+    def pop_min(self, t: tuple) -> tuple:
+        rbt = self._rbt
+        nil = self.nil
+        rbt.root, rbt.bh = t
+        node = rb_min(rbt, rbt.root)
+        rb_pop(rbt, node)
+        result = rbt.root, rbt.bh
+        node.left = node.right = node.parent = rbt.root = nil.parent = nil
+        return result, node
+
+    def to_list(self, t: tuple) -> list:
+        rbt = self._rbt
+        rbt.root = t[0]
+        # A map keeps a value in each node too.
+        result = [(node.data, getattr(node, 'value', None)) for node in rb_iter_nodes(rbt)]
+        rbt.root = self.nil
+        return result
+
+    def from_list(self, contents: list) -> tuple:
+        rbt = self._rbt
+        nodes = rb_build_sorted(rbt, [data for data, _ in contents])
+        for node, (_, value) in zip(nodes, contents):
+            node.value = value
+        result = rbt.root, rbt.bh
+        rbt.root = self.nil
+        return result
+
+
+def rb_join(rbt1: RBTree, x, rbt2: RBTree) -> RBTree:
+    """
+    Problem 13-2. Joins the trees through x in O(|rbt1.bh - rbt2.bh| + 1) time, see RBJoinOps.join.
+    :param rbt1: A tree whose keys are all less than that of x.
+    :param x: A detached node.
+    :param rbt2: A tree whose keys are all greater than that of x, sharing the sentinel of rbt1.
+    :return: rbt1, which now holds the joined tree. rbt2 is left empty.
+    """
+    assert rbt1.nil is rbt2.nil
+    rbt1.root, rbt1.bh = RBJoinOps(rbt1).join((rbt1.root, rbt1.bh), x, (rbt2.root, rbt2.bh))
+    rbt2.root, rbt2.bh = rbt2.nil, 0
+    return rbt1
+
+
+def rb_split(rbt: RBTree, k) -> tuple:
+    """
+    Splits rbt by k in O(lg n) time.
+    :return: (rbt, which now holds the keys less than k, the detached node of k or None, a new tree sharing the
+    sentinel of rbt with the keys greater than k).
+    """
+    (rbt.root, rbt.bh), node, (right_root, right_bh) = RBJoinOps(rbt).split((rbt.root, rbt.bh), k)
+    right = RBTree(rbt.key, rbt.node_class, rbt.nil)
+    right.root, right.bh = right_root, right_bh
+    return rbt, node, right
+
+
+def _rb_set_operation(operation: str, rbt1: RBTree, rbt2: RBTree, workers: int = None) -> int:
+    assert rbt1.nil is rbt2.nil
+    ops = RBJoinOps(rbt1)
+    (rbt1.root, rbt1.bh), matches = ops._run_top_level(operation, (rbt1.root, rbt1.bh), (rbt2.root, rbt2.bh),
+                                                       workers)
+    rbt2.root, rbt2.bh = rbt2.nil, 0
+    return matches
+
+
+def rb_union(rbt1: RBTree, rbt2: RBTree, workers: int = None) -> int:
+    """
+    Replaces rbt1 with the union of both trees in O(m lg(n / m + 1)) time, keeping the nodes of rbt1 for the keys in
+    both, and leaves rbt2 empty. The trees must have unique keys and share a sentinel, see rb_adopt_nodes.
+    :param workers: See JoinBasedSetOps.union.
+    :return: The number of keys in both trees.
+    """
+    return _rb_set_operation('union', rbt1, rbt2, workers)
+
+
+def rb_intersection(rbt1: RBTree, rbt2: RBTree, workers: int = None) -> int:
+    """Replaces rbt1 with the intersection of both trees, see rb_union."""
+    return _rb_set_operation('intersection', rbt1, rbt2, workers)
+
+
+def rb_difference(rbt1: RBTree, rbt2: RBTree, workers: int = None) -> int:
+    """Removes the keys of rbt2 from rbt1, see rb_union."""
+    return _rb_set_operation('difference', rbt1, rbt2, workers)
+
+
+def _rb_tree_of(keys, nil=None, node_class=RBTreeNode) -> RBTree:
+    rbt = RBTree(node_class=node_class, nil=nil)
+    for k in keys:
+        rb_insert(rbt, k)
+    return rbt
+
+
+class TestJoin(TestCase):
+    def test_join(self):
+        for n1, n2 in ((0, 0), (0, 1), (1, 0), (1, 1), (3, 100), (100, 3), (50, 60), (1000, 10)):
+            rbt1 = _rb_tree_of(sample(range(n1), n1))
+            rbt2 = _rb_tree_of(sample(range(n1 + 1, n1 + 1 + n2), n2), rbt1.nil)
+            x = rbt1.node_class(n1, RB_RED)
+            rbt = rb_join(rbt1, x, rbt2)
+            rb_assert_properties(rbt)
+            self.assertIs(rbt2.nil, rbt2.root)
+            self.assertListEqual(list(range(n1 + n2 + 1)), list(rb_iter(rbt)))
+
+    def test_split(self):
+        n = 200
+        for k in (-1, 0, 50, 51, 199, 200):
+            rbt = _rb_tree_of(sample(range(0, 2 * n, 2), n))
+            left, node, right = rb_split(rbt, k)
+            rb_assert_properties(left)
+            rb_assert_properties(right)
+            self.assertListEqual([i for i in range(0, 2 * n, 2) if i < k], list(rb_iter(left)))
+            self.assertListEqual([i for i in range(0, 2 * n, 2) if i > k], list(rb_iter(right)))
+            self.assertEqual(k if k % 2 == 0 and 0 <= k < 2 * n else None, node.data if node else None)
+
+    def test_set_ops(self):
+        for n1, n2 in ((0, 0), (0, 10), (10, 0), (5, 500), (500, 5), (300, 300)):
+            for operation, method, expected in (
+                    ('union', rb_union, lambda s1, s2: s1 | s2),
+                    ('intersection', rb_intersection, lambda s1, s2: s1 & s2),
+                    ('difference', rb_difference, lambda s1, s2: s1 - s2)):
+                for workers in (None, 2) if n1 == n2 else (None,):
+                    keys1 = set(sample(range(2 * (n1 + n2) + 1), n1))
+                    keys2 = set(sample(range(2 * (n1 + n2) + 1), n2))
+                    rbt1 = _rb_tree_of(keys1)
+                    rbt2 = _rb_tree_of(keys2)
+                    rb_adopt_nodes(rbt1, rbt2)
+                    matches = method(rbt1, rbt2, workers)
+                    rb_assert_properties(rbt1)
+                    self.assertListEqual(sorted(expected(keys1, keys2)), list(rb_iter(rbt1)), msg=operation)
+                    self.assertListEqual([], list(rb_iter(rbt2)))
+                    self.assertEqual(len(keys1 & keys2), matches)
+
+    def test_unpicklable_key(self):
+        # A lambda key can't be sent to the workers, so the union runs in this process.
+        rbt1 = RBTree(key=lambda data: -data)
+        for k in range(0, 300, 2):
+            rb_insert(rbt1, k)
+        rbt2 = RBTree(key=rbt1.key, nil=rbt1.nil)
+        for k in range(0, 300, 3):
+            rb_insert(rbt2, k)
+        self.assertFalse(RBJoinOps(rbt1)._picklable())
+        self.assertEqual(50, rb_union(rbt1, rbt2, 2))
+        rb_assert_properties(rbt1)
+        self.assertListEqual(sorted({*range(0, 300, 2), *range(0, 300, 3)}, reverse=True), list(rb_iter(rbt1)))
+
+
+def _main():
+    n = 200000
+    for m in (n, n // 4):
+        keys1 = sample(range(4 * n), n)
+        keys2 = sample(range(4 * n), m)
+        rbt1 = _rb_tree_of(keys1, node_class=CompactRBTreeNode)
+        start_time = time.time()
+        for k in keys2:
+            rb_insert(rbt1, k)
+        print('%d inserts into a tree of %d keys: %.2fs.' % (m, n, time.time() - start_time))
+
+        for workers in (None, 2) if m == n else (None,):
+            rbt1 = _rb_tree_of(keys1, node_class=CompactRBTreeNode)
+            rbt2 = _rb_tree_of(keys2, rbt1.nil, CompactRBTreeNode)
+            start_time = time.time()
+            rb_union(rbt1, rbt2, workers)
+            print('rb_union of %d and %d keys, %s workers: %.2fs.' % (n, m, workers, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -3,7 +3,8 @@ from Common.common import default_key, rand_permutate
 from typing import Optional
 from unittest import TestCase
 from P3_DataStructures.BST.basic_ops import bst_iter, bst_search, bst_transplant, bst_min
-from random import uniform, randint
+from P3_DataStructures.RBTree.problem_13_2 import JoinBasedSetOps
+from random import uniform, randint, sample
 
 
 class AVLTreeNode(BinaryTreeNode):
@@ -168,6 +169,164 @@ def avl_pop(avl: AVLTree, k):
         fix_from = p
 
 
+def _avl_rebalance_up(avl: AVLTree, node: Optional[AVLTreeNode]):
+    """Rebalances from node up, stopping as soon as a subtree is as high as before."""
+    while node:
+        p = node.parent
+        is_left = p is not None and p.left == node
+        old_height = node.height
+        avl_balance(avl, node)
+        top = avl.root if not p else (p.left if is_left else p.right)
+        if top.height == old_height:
+            return
+        node = p
+
+
+def avl_join(avl1: AVLTree, x: AVLTreeNode, avl2: AVLTree) -> AVLTree:
+    """
+    Joins the trees through x in O(|h1 - h2| + 1) time: x replaces the node on the spine of the taller tree whose
+    height is about that of the shorter tree, with that node and the shorter tree as its children, and the
+    ancestors are rebalanced as after an insertion.
+    :param avl1: A tree whose keys are all less than that of x.
+    :param x: A detached node.
+    :param avl2: A tree whose keys are all greater than that of x.
+    :return: avl1, which now holds the joined tree. avl2 is left empty.
+    """
+    h1, h2 = avl_node_height(avl1.root), avl_node_height(avl2.root)
+    p = None
+    if h1 > h2 + 1:
+        c = avl1.root
+        while avl_node_height(c) > h2 + 1:
+            p, c = c, c.right
+        x.left, x.right = c, avl2.root
+        p.right = x
+    elif h2 > h1 + 1:
+        c = avl2.root
+        while avl_node_height(c) > h1 + 1:
+            p, c = c, c.left
+        x.left, x.right = avl1.root, c
+        p.left = x
+        avl1.root = avl2.root
+    else:
+        x.left, x.right = avl1.root, avl2.root
+        avl1.root = x
+    x.parent = p
+    if x.left:
+        x.left.parent = x
+    if x.right:
+        x.right.parent = x
+    avl_update_node_height(x)
+    _avl_rebalance_up(avl1, p)
+    avl2.root = None
+    return avl1
+
+
+class AVLJoinOps(JoinBasedSetOps):
+    """The join primitives of AVL trees with the key getter of a given tree. A subtree is handled as its root."""
+    def __init__(self, avl: AVLTree):
+        self.key = avl.key
+        # Let avl_join and avl_pop work on subtrees.
+        self._avl1 = AVLTree(avl.key)
+        self._avl2 = AVLTree(avl.key)
+
+    def is_empty(self, t: Optional[AVLTreeNode]) -> bool:
+        return t is None
+
+    def key_of(self, node: AVLTreeNode):
+        return self.key(node.data)
+
+    def empty(self):
+        return None
+
+    def expose(self, t: AVLTreeNode) -> tuple:
+        left, right = t.left, t.right
+        if left:
+            left.parent = None
+        if right:
+            right.parent = None
+        t.left = t.right = None
+        t.height = 0
+        return left, t, right
+
+    def join(self, t1: Optional[AVLTreeNode], x: AVLTreeNode, t2: Optional[AVLTreeNode]) -> AVLTreeNode:
+        avl1, avl2 = self._avl1, self._avl2
+        avl1.root, avl2.root = t1, t2
+        avl_join(avl1, x, avl2)
+        result, avl1.root = avl1.root, None
+        return result
+
+    def pop_min(self, t: AVLTreeNode) -> tuple:
+        avl = self._avl1
+        avl.root = t
+        node = bst_min(t)
+        avl_pop(avl, self.key(node.data))
+        result, avl.root = avl.root, None
+        node.left = node.right = node.parent = None
+        node.height = 0
+        return result, node
+
+    def to_list(self, t: Optional[AVLTreeNode]) -> list:
+        avl = self._avl1
+        avl.root = t
+        result = list(bst_iter(avl))
+        avl.root = None
+        return result
+
+    def from_list(self, contents: list) -> Optional[AVLTreeNode]:
+        def build(lo, hi):
+            if lo >= hi:
+                return None
+            mid = (lo + hi) // 2
+            node = AVLTreeNode(contents[mid])
+            node.left = build(lo, mid)
+            node.right = build(mid + 1, hi)
+            for child in (node.left, node.right):
+                if child:
+                    child.parent = node
+            avl_update_node_height(node)
+            return node
+
+        return build(0, len(contents))
+
+
+def avl_split(avl: AVLTree, k) -> tuple:
+    """
+    Splits avl by k in O(lg n) time.
+    :return: (avl, which now holds the keys less than k, the detached node of k or None, a new tree with the keys
+    greater than k).
+    """
+    avl.root, node, right_root = AVLJoinOps(avl).split(avl.root, k)
+    right = AVLTree(avl.key)
+    right.root = right_root
+    return avl, node, right
+
+
+def _avl_set_operation(operation: str, avl1: AVLTree, avl2: AVLTree, workers: int = None) -> int:
+    avl1.root, matches = AVLJoinOps(avl1)._run_top_level(operation, avl1.root, avl2.root, workers)
+    avl2.root = None
+    return matches
+
+
+def avl_union(avl1: AVLTree, avl2: AVLTree, workers: int = None) -> int:
+    """
+    Replaces avl1 with the union of both trees in O(m lg(n / m + 1)) time, keeping the nodes of avl1 for the keys in
+    both, and leaves avl2 empty. The trees must have unique keys.
+    :param workers: See JoinBasedSetOps.union.
+    :return: The number of keys in both trees.
+    """
+    return _avl_set_operation('union', avl1, avl2, workers)
+
+
+def avl_intersection(avl1: AVLTree, avl2: AVLTree, workers: int = None) -> int:
+    """Replaces avl1 with the intersection of both trees, see avl_union."""
+    return _avl_set_operation('intersection', avl1, avl2, workers)
+
+
+def avl_difference(avl1: AVLTree, avl2: AVLTree, workers: int = None) -> int:
+    """Removes the keys of avl2 from avl1, see avl_union."""
+    return _avl_set_operation('difference', avl1, avl2, workers)
+
+
 class TestAVLTree(TestCase):
     def _assert_avl_properties_internal(self, root: AVLTreeNode, key):
         lh = avl_node_height(root.left)
@@ -259,3 +418,50 @@ class TestAVLTree(TestCase):
             self._assert_avl_properties(avl)
             # print(len(values))
             self.assertSequenceEqual(values, list(bst_iter(avl)))
+
+    def _avl_tree_of(self, keys) -> AVLTree:
+        avl = AVLTree()
+        for k in keys:
+            avl_insert(avl, k)
+        return avl
+
+    def _assert_strictly_balanced(self, root: Optional[AVLTreeNode]):
+        if not root:
+            return
+        self.assertLessEqual(abs(avl_node_height(root.left) - avl_node_height(root.right)), 1)
+        self._assert_strictly_balanced(root.left)
+        self._assert_strictly_balanced(root.right)
+
+    def test_join_split(self):
+        for n1, n2 in ((0, 0), (0, 1), (1, 0), (3, 100), (100, 3), (50, 60)):
+            avl1 = self._avl_tree_of(sample(range(n1), n1))
+            avl2 = self._avl_tree_of(sample(range(n1 + 1, n1 + 1 + n2), n2))
+            avl = avl_join(avl1, AVLTreeNode(n1), avl2)
+            self._assert_avl_properties(avl)
+            self._assert_strictly_balanced(avl.root)
+            self.assertSequenceEqual(list(range(n1 + n2 + 1)), list(bst_iter(avl)))
+
+            k = randint(-1, n1 + n2 + 1)
+            left, node, right = avl_split(avl, k)
+            for t in (left, right):
+                self._assert_avl_properties(t)
+                self._assert_strictly_balanced(t.root)
+            self.assertSequenceEqual(list(range(min(k, n1 + n2 + 1))) if k >= 0 else [], list(bst_iter(left)))
+            self.assertSequenceEqual(list(range(max(k + 1, 0), n1 + n2 + 1)), list(bst_iter(right)))
+            self.assertEqual(k if 0 <= k <= n1 + n2 else None, node.data if node else None)
+
+    def test_set_ops(self):
+        for n1, n2 in ((0, 10), (10, 0), (5, 500), (500, 5), (300, 300)):
+            for method, expected in ((avl_union, lambda s1, s2: s1 | s2),
+                                     (avl_intersection, lambda s1, s2: s1 & s2),
+                                     (avl_difference, lambda s1, s2: s1 - s2)):
+                for workers in (None, 2) if n1 == n2 else (None,):
+                    keys1 = set(sample(range(2 * (n1 + n2)), n1))
+                    keys2 = set(sample(range(2 * (n1 + n2)), n2))
+                    avl, avl2 = self._avl_tree_of(keys1), self._avl_tree_of(keys2)
+                    matches = method(avl, avl2, workers)
+                    self.assertIsNone(avl2.root)
+                    self._assert_avl_properties(avl)
+                    self._assert_strictly_balanced(avl.root)
+                    self.assertSequenceEqual(sorted(expected(keys1, keys2)), list(bst_iter(avl)))
+                    self.assertEqual(len(keys1 & keys2), matches)
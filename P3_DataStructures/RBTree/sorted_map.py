@@ -1,66 +1,266 @@
 from Common.map import Map
-from P3_DataStructures.RBTree.basic_ops import RBTree, rb_insert, rb_pop, rb_search, rb_iter
+from P3_DataStructures.RBTree.basic_ops import RBTree, RBTreeNode, CompactRBTreeNode, rb_insert, rb_pop, rb_search, \
+    rb_iter_nodes, rb_floor, rb_ceiling, rb_min, rb_successor, rb_build_sorted, rb_assert_properties
+from P3_DataStructures.Augment.dynamic_order_statistics import os_tree_create, os_insert, os_pop, os_count_below, \
+    os_on_subtree_built
+from P3_DataStructures.RBTree.problem_13_2 import rb_adopt_nodes, rb_union, rb_intersection, rb_difference
 from unittest import TestCase
-from random import randint
+from random import randint, shuffle
+import time
+import tracemalloc
 
-
-class _KeyValuePair(object):
-    def __init__(self, k, v):
-        self.k = k
-        self.v = v
+# The least size of the smaller map for which union_update and friends hand work to worker processes at all. Below it
+# sending the trees to the workers and back costs more than the operation.
+WORKERS_MIN_LEN = 1 << 16
 
 
 class SortedMap(Map):
-    """Simple implementation of a sorted map with a red-black tree."""
-    def __init__(self):
+    """
+    Simple implementation of a sorted map with a red-black tree. Each node keeps a key in data and its value in
+    value.
+    """
+    def __init__(self, node_class=CompactRBTreeNode, order_statistics: bool = False):
+        """
+        :param node_class: RBTreeNode or CompactRBTreeNode.
+        :param order_statistics: Whether to keep subtree sizes, which bisect_left and bisect_right need to seek a rank
+        in O(lg n) time, at the cost of slower insertions and deletions.
+        """
         super().__init__()
         self._len = 0
-        self._rbt = RBTree(key=lambda kv: kv.k)
+        self._order_statistics = order_statistics
+        self._rbt = os_tree_create(node_class=node_class) if order_statistics else RBTree(node_class=node_class)
+
+    @staticmethod
+    def from_sorted(items, node_class=CompactRBTreeNode, order_statistics: bool = False) -> 'SortedMap':
+        """
+        Builds a sorted map from (key, value) pairs in strictly increasing key order in O(n) time, see
+        rb_build_sorted.
+        """
+        sorted_map = SortedMap(node_class, order_statistics)
+        sorted_map._build_sorted(items)
+        return sorted_map
+
+    def update_sorted(self, items):
+        """
+        Merges (key, value) pairs in strictly increasing key order into this map, overwriting the values of existing
+        keys. A batch that's small against the map is inserted key by key, in O(m lg n) time. Otherwise the map is
+        rebuilt from the merge of both sorted sequences in O(n + m) time.
+        """
+        items = list(items)
+        if len(items) * self._len.bit_length() < self._len:
+            for k, v in items:
+                self[k] = v
+            return
+
+        def merge(_old_items, _new_items):
+            _old_item = next(_old_items, None)
+            for _new_item in _new_items:
+                while _old_item is not None and _old_item[0] < _new_item[0]:
+                    yield _old_item
+                    _old_item = next(_old_items, None)
+                if _old_item is not None and _old_item[0] == _new_item[0]:
+                    _old_item = next(_old_items, None)
+                yield _new_item
+            while _old_item is not None:
+                yield _old_item
+                _old_item = next(_old_items, None)
+
+        self._build_sorted(list(merge(self.items(), iter(items))))
+
+    def _build_sorted(self, items):
+        keys, values = [], []
+        for k, v in items:
+            assert not keys or keys[-1] < k, 'Keys are not strictly increasing'
+            keys.append(k)
+            values.append(v)
+        nodes = rb_build_sorted(self._rbt, keys, os_on_subtree_built if self._order_statistics else None)
+        for node, v in zip(nodes, values):
+            node.value = v
+        self._len = len(nodes)
 
     def pop(self, k):
         rbt = self._rbt
         node = rb_search(rbt, k)
-        if node == rbt.nil:
+        if node is rbt.nil:
             raise KeyError(str(k))
-        rb_pop(rbt, node)
+        if self._order_statistics:
+            os_pop(rbt, node)
+        else:
+            rb_pop(rbt, node)
         self._len -= 1
 
     def items(self):
-        for kv in rb_iter(self._rbt):
-            yield (kv.k, kv.v)
+        for node in rb_iter_nodes(self._rbt):
+            yield node.data, node.value
 
     def __contains__(self, k):
         rbt = self._rbt
-        return rb_search(rbt, k) != rbt.nil
+        return rb_search(rbt, k) is not rbt.nil
 
     def __setitem__(self, k, v):
         already = rb_search(self._rbt, k)
-        if already != self._rbt.nil:
-            already.data.v = v
+        if already is not self._rbt.nil:
+            already.value = v
         else:
-            rb_insert(self._rbt, _KeyValuePair(k, v))
+            node = os_insert(self._rbt, k) if self._order_statistics else rb_insert(self._rbt, k)
+            node.value = v
             self._len += 1
 
     def __len__(self):
         return self._len
 
     def __iter__(self):
-        yield self.keys()
+        return self.keys()
+
+    def __reversed__(self):
+        for node in rb_iter_nodes(self._rbt, reverse=True):
+            yield node.data
 
     def __getitem__(self, k):
         rbt = self._rbt
         node = rb_search(self._rbt, k)
-        if node == rbt.nil:
+        if node is rbt.nil:
             raise KeyError(str(k))
-        return node.data.v
+        return node.value
 
     def values(self):
-        for kv in rb_iter(self._rbt):
-            yield kv.v
+        for node in rb_iter_nodes(self._rbt):
+            yield node.value
 
     def keys(self):
-        for kv in rb_iter(self._rbt):
-            yield kv.k
+        for node in rb_iter_nodes(self._rbt):
+            yield node.data
+
+    def irange(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Iterates over the keys between lo and hi lazily, after an O(lg n) seek. The map must not be modified during
+        the iteration.
+        :param lo: The lower bound, None for no bound.
+        :param hi: The upper bound, None for no bound.
+        :param inclusive: Whether lo and hi themselves are included.
+        :param reverse: Whether to go from hi down to lo.
+        :return: A generator of the keys.
+        """
+        for node in rb_iter_nodes(self._rbt, lo, hi, inclusive, reverse):
+            yield node.data
+
+    def irange_items(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """The same as irange, with (key, value) pairs."""
+        for node in rb_iter_nodes(self._rbt, lo, hi, inclusive, reverse):
+            yield node.data, node.value
+
+    def floor(self, k):
+        """The (key, value) pair with the largest key no greater than k. Raises a KeyError if there's none."""
+        node = rb_floor(self._rbt, k)
+        if node is self._rbt.nil:
+            raise KeyError(str(k))
+        return node.data, node.value
+
+    def ceiling(self, k):
+        """The (key, value) pair with the smallest key no less than k. Raises a KeyError if there's none."""
+        node = rb_ceiling(self._rbt, k)
+        if node is self._rbt.nil:
+            raise KeyError(str(k))
+        return node.data, node.value
+
+    def bisect_left(self, k) -> int:
+        """
+        The number of keys less than k, in O(lg n) time. Raises a ValueError unless the map keeps order statistics.
+        """
+        self._check_order_statistics()
+        return os_count_below(self._rbt, k)
+
+    def bisect_right(self, k) -> int:
+        """The number of keys no greater than k, see bisect_left."""
+        self._check_order_statistics()
+        return os_count_below(self._rbt, k, inclusive=True)
+
+    def _check_order_statistics(self):
+        if not self._order_statistics:
+            raise ValueError('Rank queries need a map created with order_statistics=True')
+
+    def union_update(self, other: 'SortedMap', workers: int = None):
+        """
+        Adds the entries of other to this map, overwriting the values of the keys in both like dict.update. Maps of
+        similar sizes are joined in O(m lg(n / m + 1)) time for sizes m <= n, see rb_union, and a much smaller other
+        is inserted key by key. other is left empty, since its nodes move into this map.
+        :param workers: Opt-in: the number of worker processes for joining maps of at least WORKERS_MIN_LEN entries
+        each, see JoinBasedSetOps.union. None to always run in this process.
+        """
+        self._set_operation('union', other, workers)
+
+    def intersection_update(self, other: 'SortedMap', workers: int = None):
+        """Keeps only the keys that are in other too, see union_update. other is left empty."""
+        self._set_operation('intersection', other, workers)
+
+    def difference_update(self, other: 'SortedMap', workers: int = None):
+        """Removes the keys that are in other, see union_update. other is left empty."""
+        self._set_operation('difference', other, workers)
+
+    def _set_operation(self, operation: str, other: 'SortedMap', workers: int = None):
+        rbt, other_rbt = self._rbt, other._rbt
+        if other._len * 3 < self._len:
+            # Going over the keys of a much smaller other one by one, in O(m lg n) time, beats the larger constant
+            # factor of the joins.
+            if operation == 'union':
+                for k, v in other.items():
+                    self[k] = v
+            elif operation == 'intersection':
+                self._build_sorted([(k, self[k]) for k in other.keys() if k in self])
+            else:
+                for k in other.keys():
+                    if k in self:
+                        self.pop(k)
+        elif self._order_statistics or other._order_statistics or rbt.node_class is not other_rbt.node_class:
+            # Joins don't maintain subtree sizes, so these maps are merged in O(n + m) time instead.
+            self._build_sorted(_merged_items(operation, list(self.items()), list(other.items())))
+        else:
+            # Only the nodes of the smaller tree are moved onto the sentinel of the larger one.
+            if self._len >= other._len:
+                rb_adopt_nodes(rbt, other_rbt)
+            else:
+                rb_adopt_nodes(other_rbt, rbt)
+            if min(self._len, other._len) < WORKERS_MIN_LEN:
+                workers = None
+            if operation == 'union':
+                # The nodes of the first tree are kept, so that the values of other win.
+                matches = rb_union(other_rbt, rbt, workers)
+                rbt.nil, rbt.root, rbt.bh = other_rbt.nil, other_rbt.root, other_rbt.bh
+                self._len += other._len - matches
+            elif operation == 'intersection':
+                self._len = rb_intersection(rbt, other_rbt, workers)
+            else:
+                self._len -= rb_difference(rbt, other_rbt, workers)
+        other._rbt = os_tree_create(node_class=other_rbt.node_class) if other._order_statistics else \
+            RBTree(node_class=other_rbt.node_class)
+        other._len = 0
+
+
+def _merged_items(operation: str, items1: list, items2: list) -> list:
+    """
+    The entries of a set operation on two lists of (key, value) pairs sorted by key. The values of items2 win in a
+    union and those of items1 otherwise.
+    """
+    result = []
+    i = j = 0
+    while i < len(items1) or j < len(items2):
+        if j == len(items2) or (i < len(items1) and items1[i][0] < items2[j][0]):
+            if operation != 'intersection':
+                result.append(items1[i])
+            i += 1
+        elif i == len(items1) or items2[j][0] < items1[i][0]:
+            if operation == 'union':
+                result.append(items2[j])
+            j += 1
+        else:
+            if operation == 'union':
+                result.append(items2[j])
+            elif operation == 'intersection':
+                result.append(items1[i])
+            i += 1
+            j += 1
+    return result
+
 
 class TestSortedMap(TestCase):
     def test_basic(self):
@@ -85,8 +285,11 @@ class TestSortedMap(TestCase):
             self.assertEqual(insert_count - i - 1, len(sorted_map))
 
     def test_random_ops(self):
+        for node_class in (CompactRBTreeNode, RBTreeNode):
+            self._test_random_ops(SortedMap(node_class))
+
+    def _test_random_ops(self, sorted_map: SortedMap):
         self.maxDiff = 4096
-        sorted_map = SortedMap()
         my_dict = dict()
         for i in range(0, 400):
             op = randint(0, 2)  # 0: del, not 0: set item
@@ -109,3 +312,190 @@ class TestSortedMap(TestCase):
             self.assertSequenceEqual(sorted(my_dict.keys()), list(sorted_map.keys()))
             self.assertEqual(len(my_dict), len(sorted_map))
             # print(my_dict)
+
+    def test_from_sorted(self):
+        for order_statistics in (False, True):
+            for n in (0, 1, 5, 100):
+                sorted_map = SortedMap.from_sorted(((i * 2, i) for i in range(n)), order_statistics=order_statistics)
+                rb_assert_properties(sorted_map._rbt)
+                self.assertEqual(n, len(sorted_map))
+                self.assertSequenceEqual([(i * 2, i) for i in range(n)], list(sorted_map.items()))
+                if order_statistics:
+                    self.assertEqual((n + 1) // 2, sorted_map.bisect_left(n))
+                else:
+                    self.assertRaises(ValueError, lambda: sorted_map.bisect_left(n))
+
+                expected = dict(sorted_map)
+                for batch_size in (1, 3, 50, 200):
+                    batch = sorted({randint(-10, 300): randint(0, 9) for _ in range(batch_size)}.items())
+                    sorted_map.update_sorted(batch)
+                    expected.update(batch)
+                    rb_assert_properties(sorted_map._rbt)
+                    self.assertSequenceEqual(sorted(expected.items()), list(sorted_map.items()))
+                    self.assertEqual(len(expected), len(sorted_map))
+                    if order_statistics:
+                        self.assertEqual(len([k for k in expected if k < 100]), sorted_map.bisect_left(100))
+                    sorted_map[-20] = 0
+                    sorted_map.pop(-20)
+        self.assertRaises(AssertionError, lambda: SortedMap.from_sorted([(1, 1), (1, 2)]))
+
+    def test_range_queries(self):
+        for order_statistics in (False, True):
+            sorted_map = SortedMap(order_statistics=order_statistics)
+            keys = sorted({randint(0, 1000) for _ in range(300)})
+            shuffled_keys = list(keys)
+            shuffle(shuffled_keys)
+            for k in shuffled_keys:
+                sorted_map[k] = -k
+            for k in shuffled_keys[:100]:
+                sorted_map.pop(k)
+                keys.remove(k)
+            self.assertSequenceEqual(keys, list(sorted_map))
+            self.assertSequenceEqual(keys[::-1], list(reversed(sorted_map)))
+            self.assertSequenceEqual(keys, list(sorted_map.irange()))
+            for _ in range(100):
+                lo, hi = sorted((randint(-10, 1010), randint(-10, 1010)))
+                for inclusive in ((True, True), (True, False), (False, True), (False, False)):
+                    expected = [k for k in keys if (lo <= k if inclusive[0] else lo < k) and
+                                (k <= hi if inclusive[1] else k < hi)]
+                    self.assertSequenceEqual(expected, list(sorted_map.irange(lo, hi, inclusive)))
+                    self.assertSequenceEqual(expected[::-1], list(sorted_map.irange(lo, hi, inclusive, True)))
+                self.assertSequenceEqual([(k, -k) for k in keys if k >= lo], list(sorted_map.irange_items(lo)))
+                self.assertSequenceEqual([k for k in keys if k <= hi], list(sorted_map.irange(hi=hi)))
+
+                floor_keys = [k for k in keys if k <= lo]
+                if floor_keys:
+                    self.assertEqual((floor_keys[-1], -floor_keys[-1]), sorted_map.floor(lo))
+                else:
+                    self.assertRaises(KeyError, lambda: sorted_map.floor(lo))
+                ceiling_keys = [k for k in keys if k >= lo]
+                if ceiling_keys:
+                    self.assertEqual((ceiling_keys[0], -ceiling_keys[0]), sorted_map.ceiling(lo))
+                else:
+                    self.assertRaises(KeyError, lambda: sorted_map.ceiling(lo))
+                if order_statistics:
+                    self.assertEqual(len([k for k in keys if k < lo]), sorted_map.bisect_left(lo))
+                    self.assertEqual(len([k for k in keys if k <= lo]), sorted_map.bisect_right(lo))
+                else:
+                    self.assertRaises(ValueError, lambda: sorted_map.bisect_right(lo))
+
+    def test_set_operations(self):
+        for n1, n2 in ((0, 20), (20, 0), (5, 300), (300, 5), (200, 100), (200, 200)):
+            for node_classes, order_statistics in (((CompactRBTreeNode, CompactRBTreeNode), False),
+                                                   ((RBTreeNode, RBTreeNode), False),
+                                                   ((CompactRBTreeNode, RBTreeNode), False),
+                                                   ((CompactRBTreeNode, CompactRBTreeNode), True)):
+                for operation in ('union', 'intersection', 'difference'):
+                    dict1 = {randint(0, 2 * (n1 + n2)): randint(0, 9) for _ in range(n1)}
+                    dict2 = {randint(0, 2 * (n1 + n2)): randint(0, 9) for _ in range(n2)}
+                    sorted_map1 = SortedMap(node_classes[0], order_statistics)
+                    sorted_map2 = SortedMap(node_classes[1], order_statistics)
+                    for k, v in dict1.items():
+                        sorted_map1[k] = v
+                    for k, v in dict2.items():
+                        sorted_map2[k] = v
+                    if operation == 'union':
+                        sorted_map1.union_update(sorted_map2)
+                        expected = dict(dict1)
+                        expected.update(dict2)
+                    elif operation == 'intersection':
+                        sorted_map1.intersection_update(sorted_map2)
+                        expected = {k: v for k, v in dict1.items() if k in dict2}
+                    else:
+                        sorted_map1.difference_update(sorted_map2)
+                        expected = {k: v for k, v in dict1.items() if k not in dict2}
+                    rb_assert_properties(sorted_map1._rbt)
+                    self.assertSequenceEqual(sorted(expected.items()), list(sorted_map1.items()))
+                    self.assertEqual(len(expected), len(sorted_map1))
+                    self.assertEqual(0, len(sorted_map2))
+                    self.assertSequenceEqual([], list(sorted_map2.items()))
+
+                    # Both maps stay usable.
+                    for sorted_map in (sorted_map1, sorted_map2):
+                        sorted_map[-1] = 0
+                        sorted_map.pop(-1)
+                        rb_assert_properties(sorted_map._rbt)
+
+
+class _KeyValuePair(object):
+    """The entry wrapper SortedMap used before nodes kept the value themselves, kept for the benchmark."""
+    def __init__(self, k, v):
+        self.k = k
+        self.v = v
+
+
+def _wrapped_entry_insert(rbt: RBTree, k, v):
+    already = rb_search(rbt, k)
+    if already is not rbt.nil:
+        already.data.v = v
+    else:
+        rb_insert(rbt, _KeyValuePair(k, v))
+
+
+def _main():
+    n = 1000000
+    keys = list(range(n))
+    shuffle(keys)
+    cases = (
+        ('RBTreeNode + _KeyValuePair', lambda: RBTree(key=lambda kv: kv.k), _wrapped_entry_insert,
+         lambda rbt, k: rb_search(rbt, k).data.v),
+        ('SortedMap, RBTreeNode', lambda: SortedMap(RBTreeNode), SortedMap.__setitem__, SortedMap.__getitem__),
+        ('SortedMap, CompactRBTreeNode', lambda: SortedMap(CompactRBTreeNode), SortedMap.__setitem__,
+         SortedMap.__getitem__),
+    )
+    for desc, create, insert, search in cases:
+        tracemalloc.start()
+        container = create()
+        for k in keys:
+            insert(container, k, k)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del container
+
+        container = create()
+        start_time = time.time()
+        for k in keys:
+            insert(container, k, k)
+        insert_time = time.time() - start_time
+        start_time = time.time()
+        for k in keys:
+            search(container, k)
+        search_time = time.time() - start_time
+        print('%s: %.1f bytes/entry, %.0f inserts/s, %.0f searches/s.' %
+              (desc, memory / n, n / insert_time, n / search_time))
+        del container
+
+    start_time = time.time()
+    sorted_map = SortedMap()
+    for k in range(n):
+        sorted_map[k] = k
+    print('%d sorted keys inserted one by one: %.2fs.' % (n, time.time() - start_time))
+    start_time = time.time()
+    sorted_map = SortedMap.from_sorted((k, k) for k in range(n))
+    print('%d sorted keys with from_sorted: %.2fs.' % (n, time.time() - start_time))
+    rbt = sorted_map._rbt
+    start_time = time.time()
+    node = rb_min(rbt, rbt.root)
+    while node is not rbt.nil:
+        node = rb_successor(rbt, node)
+    print('Full scan with rb_successor: %.2fs.' % (time.time() - start_time))
+    start_time = time.time()
+    for _ in sorted_map.items():
+        pass
+    print('Full scan with the stack cursor: %.2fs.' % (time.time() - start_time))
+    lo, hi = n // 2, n // 2 + 1000
+    start_time = time.time()
+    for _ in range(100):
+        for k in sorted_map.keys():
+            if k > hi:
+                break
+    print('100 range scans of 1000 keys from the minimum: %.3fs.' % (time.time() - start_time))
+    start_time = time.time()
+    for _ in range(100):
+        for _ in sorted_map.irange(lo, hi):
+            pass
+    print('100 range scans of 1000 keys with irange: %.3fs.' % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -43,7 +43,7 @@ def _check_connectivity(adj_matrix, vertex_a, vertex_b, vertex_count, edge_count
 def minimum_spanning_tree(adj_matrix):
     """
     A MST construction algorithm based on the concept of the matroid. Running time is O(|V|^2 + |E| log |E| + |V| |E|^2)
-    if the input graph is G = (V, E).
+    if the input graph is G = (V, E). P6_Graph.MinimumSpanningTrees has the O(|E| log |E|) Kruskal and Prim versions.
     :param adj_matrix: the weighted adjacent matrix of the input graph.
     :return: the MST edges.
     """
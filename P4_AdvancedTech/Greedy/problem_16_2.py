@@ -1,6 +1,6 @@
 from unittest import TestCase
 from collections import namedtuple
-from P2_Sorting.HeapSort.priority_queue import MaxPriorityQueue
+from P2_Sorting.HeapSort.indexed_heap import IndexedHeap
 from P2_Sorting.HeapSort.heap_sort import heap_sort
 from typing import Sequence
 
@@ -27,9 +27,9 @@ class Task(object):
         return self._processing_time
 
 
-def _populate_queue(tasks: Sequence[Task], index: int, q: MaxPriorityQueue, current_time: int) -> int:
+def _populate_queue(tasks: Sequence[Task], index: int, q: IndexedHeap, current_time: int) -> int:
     while index < len(tasks) and tasks[index].release_time == current_time:
-        q.insert(tasks[index])
+        q.push(tasks[index].task_id, tasks[index].processing_time)
         index += 1
     return index
 
@@ -38,7 +38,8 @@ def schedule_tasks(tasks: Sequence[Task]) -> tuple:
     """
     Problem 16-2(b). Simulates the procedure of processing all the tasks. Running time is O(N log n) where n is the
     number of input tasks and N is the completion time of the whole procedure. Moreover, N <= R + nP, where R is the
-    maximum release time of all the tasks and P is the maximum processing time.
+    maximum release time of all the tasks and P is the maximum processing time. The queue holds the task ids by
+    remaining processing time, which is updated in place while a task runs.
     :param tasks: the input tasks.
     :return: Average completion time and the execution order (-1 means idle).
     """
@@ -47,7 +48,7 @@ def schedule_tasks(tasks: Sequence[Task]) -> tuple:
 
     tasks = list(tasks)
     heap_sort(tasks, key=lambda t: t.release_time)
-    q = MaxPriorityQueue(key=lambda t: -t.processing_time)
+    q = IndexedHeap()
     current_time = 0
 
     index = _populate_queue(tasks, 0, q, current_time)
@@ -57,14 +58,12 @@ def schedule_tasks(tasks: Sequence[Task]) -> tuple:
         if len(q) <= 0:
             seq.append(-1)
         else:
-            current_task = q.extract_max()
-            seq.append(current_task.task_id)
-            if current_task.processing_time > 1:
-                remaining_task = Task(task_id=current_task.task_id,
-                                      release_time=current_task.release_time,
-                                      processing_time=current_task.processing_time - 1)
-                q.insert(remaining_task)
+            task_id, remaining_time = q.peek()
+            seq.append(task_id)
+            if remaining_time > 1:
+                q.update_key(task_id, remaining_time - 1)
             else:
+                q.pop()
                 complete_time += current_time + 1
 
         current_time += 1
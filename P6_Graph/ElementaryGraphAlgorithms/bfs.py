@@ -1,7 +1,17 @@
 from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.csr_graph import CSRGraph
 from typing import Callable, Tuple, Any
 from collections import deque
+from array import array
 from unittest import TestCase
+from random import randint
+import time
+
+
+# Switch to bottom-up once the frontier's out edges exceed 1 / TOP_DOWN_ALPHA of the unexplored vertices' edges, and
+# back to top-down once the frontier falls below 1 / BOTTOM_UP_BETA of all vertices (Beamer et al.).
+TOP_DOWN_ALPHA = 14
+BOTTOM_UP_BETA = 24
 
 
 def bfs(graph: Graph, visit_func: Callable[[Any], bool]=None) -> Tuple[dict, dict]:
@@ -31,6 +41,83 @@ def bfs_with_src(graph: Graph, src_key, visit_func: Callable[[Any], bool]=None)
     return came_from, depths
 
 
+def bfs_direction_optimizing(graph, src_key, reverse_graph: CSRGraph=None) -> Tuple[dict, dict]:
+    """
+    Level-synchronous BFS over the CSR layout, with visited and frontier state in bytearrays. Each level is expanded
+    either top-down, scanning the out edges of the frontier, or bottom-up, where every unvisited vertex scans its in
+    edges until it finds a parent in the frontier. Bottom-up steps skip most of the edges into visited vertices on low
+    diameter graphs, where the middle levels cover most of the graph.
+    :param graph: A Graph or CSRGraph. A Graph is converted to a CSRGraph first.
+    :param src_key:
+    :param reverse_graph: The transpose of graph as a CSRGraph, used by bottom-up steps. Pass graph itself for
+    undirected graphs; it's csr.transpose() otherwise, which a CSRGraph caches across calls.
+    :return: The same (came_from, depths) pair as bfs_with_src. Depths are equal; a vertex discovered by a bottom-up
+    step may get a different parent of the same depth.
+    """
+    csr = graph if isinstance(graph, CSRGraph) else CSRGraph.from_graph(graph)
+    if reverse_graph is None:
+        reverse_graph = csr.transpose()
+    n = csr.vertex_len
+    offsets, targets = csr.offsets, csr.targets
+    reverse_offsets, reverse_targets = reverse_graph.offsets, reverse_graph.targets
+    parents = array('q', [-1]) * n
+    visited = bytearray(n)
+    src = csr.index_of(src_key)
+    visited[src] = 1
+    levels = [[src]]
+    frontier = levels[0]
+    unexplored_edge_len = csr.edge_len - (offsets[src + 1] - offsets[src])
+    unvisited = None  # The unvisited vertices while in bottom-up mode.
+    bottom_up = False
+    while frontier:
+        if bottom_up:
+            bottom_up = len(frontier) * BOTTOM_UP_BETA >= n
+        else:
+            bottom_up = sum(offsets[u + 1] - offsets[u] for u in frontier) * TOP_DOWN_ALPHA > unexplored_edge_len
+        next_frontier = []
+        if bottom_up:
+            in_frontier = bytearray(n)
+            for u in frontier:
+                in_frontier[u] = 1
+            if unvisited is None:
+                unvisited = [v for v in range(n) if not visited[v]]
+            still_unvisited = []
+            for v in unvisited:
+                for i in range(reverse_offsets[v], reverse_offsets[v + 1]):
+                    u = reverse_targets[i]
+                    if in_frontier[u]:
+                        parents[v] = u
+                        next_frontier.append(v)
+                        break
+                else:
+                    still_unvisited.append(v)
+            for v in next_frontier:
+                visited[v] = 1
+            unvisited = still_unvisited
+        else:
+            for u in frontier:
+                for i in range(offsets[u], offsets[u + 1]):
+                    v = targets[i]
+                    if not visited[v]:
+                        visited[v] = 1
+                        parents[v] = u
+                        next_frontier.append(v)
+            unvisited = None
+        unexplored_edge_len -= sum(offsets[v + 1] - offsets[v] for v in next_frontier)
+        levels.append(next_frontier)
+        frontier = next_frontier
+
+    keys = list(csr.vertex_keys())
+    came_from = {}
+    depths = {}
+    for depth, level in enumerate(levels):
+        for v in level:
+            depths[keys[v]] = depth
+            if depth > 0:
+                came_from[keys[v]] = keys[parents[v]]
+    return came_from, depths
+
+
 def _bfs_internal(graph: Graph, src_key, visit_func: Callable[[Any], bool],
                   open_set: deque, came_from: dict, depths: dict, visited: set):
     open_set.appendleft(src_key)
@@ -87,9 +174,50 @@ def _tree_diameter_recur_internal(tree: Graph, root_key, parents: set) -> Tuple[
     return diameter, depth
 
 
+def tree_diameter_iter(tree: Graph, root_key) -> int:
+    """
+    Ex 22.2-8. The same dynamic programming as tree_diameter_recur, in post order with an explicit stack, so that deep
+    trees don't hit the recursion limit. Without support of empty tree.
+    """
+    visited = {root_key}
+    # Per vertex on the stack: [key, successor iterator, max sub diameter, max sub depth, second sub depth]
+    stack = [[root_key, tree.get_vertex(root_key).successors(), 0, -1, -1]]
+    default_next_item = object()
+    diameter, depth = 0, 0
+    while stack:
+        frame = stack[-1]
+        next_item = next(frame[1], default_next_item)
+        if next_item is not default_next_item:
+            v_key = next_item[0]
+            if v_key not in visited:
+                visited.add(v_key)
+                stack.append([v_key, tree.get_vertex(v_key).successors(), 0, -1, -1])
+            continue
+
+        stack.pop()
+        _, _, max_sub_diameter, max_sub_depth, second_sub_depth = frame
+        if max_sub_depth < 0:
+            diameter, depth = 0, 0
+        else:
+            depth = max_sub_depth + 1
+            diameter = max(max_sub_depth + 1 if second_sub_depth < 0 else max_sub_depth + second_sub_depth + 2,
+                           max_sub_diameter)
+        if stack:
+            parent = stack[-1]
+            parent[2] = max(parent[2], diameter)
+            if depth >= parent[3]:
+                parent[4] = parent[3]
+                parent[3] = depth
+            elif depth >= parent[4]:
+                parent[4] = depth
+    return diameter
+
+
 def tree_diameter_bfs(tree: Graph, root_key) -> int:
     """Ex 22.2-8. Use BFS twice. Without support of empty tree."""
-    _, depths = bfs_with_src(tree, root_key)
+    # Edges of a tree go both ways, so it is its own transpose.
+    csr = tree if isinstance(tree, CSRGraph) else CSRGraph.from_graph(tree)
+    _, depths = bfs_direction_optimizing(csr, root_key, csr)
     max_depth, max_depth_v_key = -1, None
     for v_key, depth in depths.items():
         if depth > max_depth:
@@ -97,7 +225,7 @@ def tree_diameter_bfs(tree: Graph, root_key) -> int:
             max_depth_v_key = v_key
     if max_depth_v_key is None:
         return 0
-    _, depths = bfs_with_src(tree, max_depth_v_key)
+    _, depths = bfs_direction_optimizing(csr, max_depth_v_key, csr)
     max_depth = -1
     for v_key, depth in depths.items():
         if depth > max_depth:
@@ -141,7 +269,7 @@ class TestBFS(TestCase):
         }, came_from)
 
     def test_tree_diameter(self):
-        methods = (tree_diameter_recur, tree_diameter_bfs)
+        methods = (tree_diameter_recur, tree_diameter_iter, tree_diameter_bfs)
         tree = Graph()
         for i in range(0, 16):
             tree.add_vertex(Vertex(i))
@@ -163,4 +291,78 @@ class TestBFS(TestCase):
         for tree_diameter_method in methods:
             for root in range(0, 16):
                 # print('root: %d' % root)
-                self.assertEqual(7, tree_diameter_method(tree, root))
\ No newline at end of file
+                self.assertEqual(7, tree_diameter_method(tree, root))
+
+    def test_tree_diameter_long_chain(self):
+        n = 5000
+        tree = Graph(ordered=False)
+        for i in range(n):
+            tree.add_vertex(Vertex(i, ordered=False))
+        for i in range(n - 1):
+            tree.add_2_edges(i, i + 1)
+        for root in (0, n // 3, n - 1):
+            self.assertEqual(n - 1, tree_diameter_iter(tree, root))
+            self.assertEqual(n - 1, tree_diameter_bfs(tree, root))
+
+    def test_bfs_direction_optimizing(self):
+        for n, m, undirected in ((10, 5, False), (200, 3000, False), (300, 2000, True), (1, 0, False)):
+            graph = Graph()
+            for i in range(n):
+                graph.add_vertex(Vertex(i * 2))
+            for _ in range(m):
+                u, v = randint(0, n - 1) * 2, randint(0, n - 1) * 2
+                if u != v and not graph.has_edge(u, v):
+                    if undirected:
+                        graph.add_2_edges(u, v)
+                    else:
+                        graph.add_edge(u, v)
+            csr = CSRGraph.from_graph(graph)
+            for src in (0, (n - 1) * 2):
+                expected_depths = bfs_with_src(graph, src)[1]
+                for came_from, depths in (bfs_direction_optimizing(graph, src),
+                                          bfs_direction_optimizing(csr, src, csr.transpose())):
+                    self.assertDictEqual(expected_depths, depths)
+                    self.assertEqual(len(depths) - 1, len(came_from))
+                    for v, u in came_from.items():
+                        self.assertTrue(graph.has_edge(u, v))
+                        self.assertEqual(depths[u] + 1, depths[v])
+
+
+def _main():
+    for n in (1000000, 100000):
+        chain = Graph(ordered=False)
+        for i in range(n):
+            chain.add_vertex(Vertex(i, ordered=False))
+        for i in range(n - 1):
+            chain.add_2_edges(i, i + 1)
+        random_tree = Graph(ordered=False)
+        for i in range(n):
+            random_tree.add_vertex(Vertex(i, ordered=False))
+        for i in range(1, n):
+            random_tree.add_2_edges(i, randint(0, i - 1))
+        for desc, tree in (('chain', chain), ('random tree', random_tree)):
+            for method in (tree_diameter_iter, tree_diameter_bfs):
+                start_time = time.time()
+                method(tree, 0)
+                print('%s on a %d-vertex %s: %.2fs.' % (method.__name__, n, desc, time.time() - start_time))
+
+    n, m = 100000, 1000000
+    graph = Graph(ordered=False)
+    for i in range(n):
+        graph.add_vertex(Vertex(i, ordered=False))
+    for _ in range(m):
+        u, v = randint(0, n - 1), randint(0, n - 1)
+        if u != v and not graph.has_edge(u, v):
+            graph.add_2_edges(u, v)
+    csr = CSRGraph.from_graph(graph)
+    start_time = time.time()
+    bfs_with_src(graph, 0)
+    print('bfs_with_src on a random graph with %d vertices, %d edges: %.2fs.' % (n, csr.edge_len,
+                                                                                time.time() - start_time))
+    start_time = time.time()
+    bfs_direction_optimizing(csr, 0, csr)
+    print('bfs_direction_optimizing on the same graph: %.2fs.' % (time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
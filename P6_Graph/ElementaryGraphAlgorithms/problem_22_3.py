@@ -1,40 +1,46 @@
 from P6_Graph.directed_graph import Graph, Vertex
-from typing import Tuple
 from unittest import TestCase
+from random import randint
+import time
 
 
 def euler_tour_undirected(graph: Graph) -> list:
-    ret = []
+    """
+    Hierholzer's algorithm. The tour is kept as a linked list of nodes in the arrays keys and nexts. A cursor walks the
+    list, and wherever the current vertex still has edges, a closed walk from it is spliced in right after the node,
+    so that the walk is expanded next. Edges are removed from the graph. O(E) list operations.
+    """
     if graph.vertex_len == 0:
-        return ret
-    for v_key in graph.vertex_keys():
-        ret.append(v_key)
+        return []
+    start_key = None
+    for start_key in graph.vertex_keys():
         break
-    ret, _ = _euler(graph, ret, 0)
-    return ret
-
+    keys = [start_key]
+    nexts = [-1]
+    node = 0
+    while node >= 0:
+        u = graph.get_vertex(keys[node])
+        after, last = nexts[node], node
+        while u.successor_len > 0:
+            v_key = None
+            for v_key, _ in u.successors():
+                break
+            graph.remove_edge(u.key, v_key)
+            graph.remove_edge(v_key, u.key)
+            keys.append(v_key)
+            nexts.append(-1)
+            nexts[last] = len(keys) - 1
+            last = len(keys) - 1
+            u = graph.get_vertex(v_key)
+        nexts[last] = after
+        node = nexts[node]
 
-def _euler(graph: Graph, path: list, src_index: int) -> Tuple[list, int]:
-    src_key = path[src_index]
-    src = graph.get_vertex(src_key)
-    u = src
-    sub_path = [src_key]
-    while u.successor_len > 0:
-        v = None
-        for v_key, _ in u.successors():
-            v = graph.get_vertex(v_key)
-            break
-        graph.remove_edge(u.key, v.key)
-        graph.remove_edge(v.key, u.key)
-        sub_path.append(v.key)
-        u = v
-    i = 1
-    while i < len(sub_path):
-        sub_path, delta_len = _euler(graph, sub_path, i)
-        i += delta_len
-
-    path = path[0:src_index] + sub_path + path[src_index + 1:]
-    return path, len(sub_path)
+    ret = []
+    node = 0
+    while node >= 0:
+        ret.append(keys[node])
+        node = nexts[node]
+    return ret
 
 
 class TestEuler(TestCase):
@@ -81,3 +87,48 @@ class TestEuler(TestCase):
                 (5, 6), (5, 8), (6, 7), (6, 10), (7, 8), (7, 9), (7, 10), (8, 9)):
             graph.add_2_edges(edge[0], edge[1])
         self.assertSequenceEqual([0, 1, 2, 3, 5, 4, 8, 7, 6, 10, 7, 9, 8, 5, 6, 3, 1, 4, 0], euler_tour_undirected(graph))
+
+    def test_long_cycle(self):
+        n = 5000
+        graph = Graph(ordered=False)
+        for i in range(n):
+            graph.add_vertex(Vertex(i, ordered=False))
+        for i in range(n):
+            graph.add_2_edges(i, (i + 1) % n)
+        self.assertSequenceEqual(list(range(n)) + [0], euler_tour_undirected(graph))
+
+
+def _main():
+    n = 1000000
+    cycle = Graph(ordered=False)
+    for i in range(n):
+        cycle.add_vertex(Vertex(i, ordered=False))
+    for i in range(n):
+        cycle.add_2_edges(i, (i + 1) % n)
+    start_time = time.time()
+    euler_tour_undirected(cycle)
+    print('euler_tour_undirected on a %d-vertex cycle: %.2fs.' % (n, time.time() - start_time))
+
+    # Random Eulerian graphs: unions of random closed walks without repeated edges.
+    for n, walk_count in ((10000, 300), (100000, 3000)):
+        graph = Graph(ordered=False)
+        for i in range(n):
+            graph.add_vertex(Vertex(i, ordered=False))
+        edge_count = 0
+        for _ in range(walk_count):
+            walk = [randint(0, n - 1) for _ in range(10)]
+            walk.append(walk[0])
+            edges = {(min(walk[i], walk[i + 1]), max(walk[i], walk[i + 1])) for i in range(len(walk) - 1)}
+            if len(edges) < len(walk) - 1 or any(u == v or graph.has_edge(u, v) for u, v in edges):
+                continue
+            for u, v in edges:
+                graph.add_2_edges(u, v)
+            edge_count += len(edges)
+        start_time = time.time()
+        euler_tour_undirected(graph)
+        print('euler_tour_undirected on a random graph with %d vertices, %d edges: %.2fs.' %
+              (n, edge_count, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -3,6 +3,8 @@ from P6_Graph.ElementaryGraphAlgorithms.dfs import dfs, dfs_internal, DFSResult,
 from P6_Graph.directed_graph import Graph, Vertex
 from unittest import TestCase
 from typing import List
+from random import randint
+import time
 
 
 def scc_dfs(graph: Graph) -> List[List]:
@@ -16,9 +18,10 @@ def scc_dfs(graph: Graph) -> List[List]:
 
     result = DFSResult()
     time = TimeCounter()
+    transpose = get_transpose(graph)
     for v_key in reversed(post_visit_array):
         if v_key not in result.discover_times:
-            dfs_internal(get_transpose(graph), v_key, lambda _: True, lambda _: True, result, time)
+            dfs_internal(transpose, v_key, lambda _: True, lambda _: True, result, time)
 
     return _retrieve_sccs(result)
 
@@ -58,26 +61,40 @@ class TarjanCache(object):
 
 
 def _tarjan_internal(graph: Graph, src_key, sccs: List[List], cache: TarjanCache, time: TimeCounter):
+    """Tarjan's algorithm from src_key with an explicit stack of successor iterators, like dfs_internal."""
     cache.in_stack.add(src_key)
     cache.stack.append(src_key)
     cache.discover_times[src_key] = cache.low[src_key] = time.next()
-    for v_key, _ in graph.get_vertex(src_key).successors():
-        if v_key not in cache.discover_times:
-            _tarjan_internal(graph, v_key, sccs, cache, time)
-            cache.low[src_key] = min(cache.low[src_key], cache.low[v_key])
-        elif v_key not in cache.finish_times:
-            cache.low[src_key] = min(cache.low[src_key], cache.discover_times[v_key])
-    cache.finish_times[src_key] = time.next()
-
-    if cache.low[src_key] == cache.discover_times[src_key]:
-        scc = []
-        while True:
-            v_key = cache.stack.pop()
-            cache.in_stack.remove(v_key)
-            scc.append(v_key)
-            if v_key == src_key:
-                break
-        sccs.append(scc)
+    stack = [(src_key, graph.get_vertex(src_key).successors())]
+    default_next_item = object()
+    while stack:
+        cur_key, iter = stack[-1]
+        next_item = next(iter, default_next_item)
+        if next_item is not default_next_item:
+            v_key = next_item[0]
+            if v_key not in cache.discover_times:
+                cache.in_stack.add(v_key)
+                cache.stack.append(v_key)
+                cache.discover_times[v_key] = cache.low[v_key] = time.next()
+                stack.append((v_key, graph.get_vertex(v_key).successors()))
+            elif v_key in cache.in_stack:
+                cache.low[cur_key] = min(cache.low[cur_key], cache.discover_times[v_key])
+            continue
+
+        stack.pop()
+        cache.finish_times[cur_key] = time.next()
+        if stack:
+            parent_key = stack[-1][0]
+            cache.low[parent_key] = min(cache.low[parent_key], cache.low[cur_key])
+        if cache.low[cur_key] == cache.discover_times[cur_key]:
+            scc = []
+            while True:
+                v_key = cache.stack.pop()
+                cache.in_stack.remove(v_key)
+                scc.append(v_key)
+                if v_key == cur_key:
+                    break
+            sccs.append(scc)
 
 
 def scc_tarjan(graph: Graph) -> List[List]:
@@ -99,6 +116,29 @@ class TestScc(TestCase):
             expected_result = self._expected_sccs_from_figure_22_9()
             self._check_scc_result(expected_result, result)
 
+    def test_scc_edge_to_finished_vertex(self):
+        graph = Graph()
+        for v_key in ('a', 'b', 'c', 'd'):
+            graph.add_vertex(Vertex(v_key))
+        graph.add_edge('a', 'b')
+        graph.add_edge('b', 'a')
+        graph.add_edge('a', 'c')
+        graph.add_edge('c', 'b')
+        graph.add_edge('c', 'd')
+        for method in (scc_dfs, scc_tarjan):
+            self._check_scc_result([['a', 'b', 'c'], ['d']], method(graph))
+
+    def test_scc_long_chain(self):
+        graph = Graph(ordered=False)
+        n = 5000
+        for i in range(n):
+            graph.add_vertex(Vertex(i, ordered=False))
+        for i in range(n - 1):
+            graph.add_edge(i, i + 1)
+        self.assertEqual(n, len(scc_tarjan(graph)))
+        graph.add_edge(n - 1, 0)
+        self.assertEqual(1, len(scc_tarjan(graph)))
+
     @staticmethod
     def _expected_sccs_from_figure_22_9() -> List[List]:
         return [
@@ -141,3 +181,33 @@ class TestScc(TestCase):
             scc.sort()
         result.sort(key=lambda _scc: _scc[0])
         self.assertListEqual(expected_result, result)
+
+
+def _main():
+    n = 1000000
+    chain = Graph(ordered=False)
+    for i in range(n):
+        chain.add_vertex(Vertex(i, ordered=False))
+    for i in range(n - 1):
+        chain.add_edge(i, i + 1)
+    start_time = time.time()
+    scc_tarjan(chain)
+    print('scc_tarjan on a %d-vertex chain: %.2fs.' % (n, time.time() - start_time))
+
+    for n, m in ((10000, 30000), (100000, 300000)):
+        graph = Graph(ordered=False)
+        for i in range(n):
+            graph.add_vertex(Vertex(i, ordered=False))
+        for _ in range(m):
+            u, v = randint(0, n - 1), randint(0, n - 1)
+            if not graph.has_edge(u, v):
+                graph.add_edge(u, v)
+        for method in (scc_dfs, scc_tarjan):
+            start_time = time.time()
+            method(graph)
+            print('%s on a random graph with %d vertices, %d edges: %.2fs.' %
+                  (method.__name__, n, m, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -63,8 +63,7 @@ def topological_sort_kahn(graph: Graph) -> list:
     while zero_in_degree_set:
         u_key = zero_in_degree_set.popleft()
         ret.append(u_key)
-        for v_key, _ in list(graph.get_vertex(u_key).successors()):
-            graph.remove_edge(u_key, v_key)
+        for v_key, _ in graph.get_vertex(u_key).successors():
             in_degrees[v_key] -= 1
             if in_degrees[v_key] == 0:
                 zero_in_degree_set.append(v_key)
@@ -0,0 +1,125 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.csr_graph import CSRGraph
+from typing import List, Tuple
+from unittest import TestCase
+
+
+class DisjointSet(object):
+    """
+    Disjoint-set forest over the elements 0 .. n - 1 with union by rank and path compression, so that m operations
+    take O(m alpha(n)) time.
+    """
+    def __init__(self, n: int):
+        self._parents = list(range(n))
+        self._ranks = bytearray(n)  # Ranks never exceed log2(n).
+
+    def __len__(self):
+        return len(self._parents)
+
+    def find(self, x: int) -> int:
+        """
+        :param x: The element.
+        :return: The representative of the set containing x.
+        """
+        parents = self._parents
+        root = x
+        while parents[root] != root:
+            root = parents[root]
+        while parents[x] != root:
+            parents[x], x = root, parents[x]
+        return root
+
+    def union(self, x: int, y: int) -> bool:
+        """
+        Merges the sets containing x and y.
+        :return: False if x and y were in the same set already.
+        """
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return False
+        ranks = self._ranks
+        if ranks[x] < ranks[y]:
+            x, y = y, x
+        self._parents[y] = x
+        if ranks[x] == ranks[y]:
+            ranks[x] += 1
+        return True
+
+
+def undirected_edges(graph) -> Tuple[int, list, list]:
+    """
+    Reads the input of the minimum spanning tree algorithms.
+    :param graph: Either a weighted adjacency matrix in the format of matroid.minimum_spanning_tree, where
+    graph[i][j] for j < i is the weight of the edge between j and i, or -1 if there's none, or a Graph or CSRGraph,
+    where every edge u -> v is taken as an undirected edge. Self loops are ignored.
+    :return: (n, edges, keys). The vertices are numbered 0 .. n - 1, edges is a list of (weight, a, b) by vertex
+    number, and keys[i] is the key of vertex i, or None for an adjacency matrix.
+    """
+    edges = []
+    if isinstance(graph, (Graph, CSRGraph)):
+        keys = list(graph.vertex_keys())
+        indices = {k: i for i, k in enumerate(keys)}
+        for a, u in enumerate(keys):
+            for v, w in graph.get_vertex(u).successors():
+                if v != u:
+                    edges.append((w, a, indices[v]))
+        return len(keys), edges, keys
+
+    for i in range(len(graph)):
+        row = graph[i]
+        for j in range(i):
+            if row[j] >= 0:
+                edges.append((row[j], j, i))
+    return len(graph), edges, None
+
+
+def tree_edge_keys(edges: list, keys: list, tree_edge_indices) -> tuple:
+    """Maps the indices of the chosen edges back to (a, b) vertex key pairs."""
+    if keys is None:
+        return tuple((edges[i][1], edges[i][2]) for i in tree_edge_indices)
+    return tuple((keys[edges[i][1]], keys[edges[i][2]]) for i in tree_edge_indices)
+
+
+def mst_basic_test_case() -> Tuple[Graph, int]:
+    """Figure 23.1, as an undirected Graph, and the weight of its minimum spanning trees."""
+    graph = Graph()
+    for k in 'abcdefghi':
+        graph.add_vertex(Vertex(k))
+    for u, v, w in (('a', 'b', 4), ('a', 'h', 8), ('b', 'c', 8), ('b', 'h', 11), ('c', 'd', 7), ('c', 'f', 4),
+                    ('c', 'i', 2), ('d', 'e', 9), ('d', 'f', 14), ('e', 'f', 10), ('f', 'g', 2), ('g', 'h', 1),
+                    ('g', 'i', 6), ('h', 'i', 7)):
+        graph.add_2_edges(u, v, w)
+    return graph, 37
+
+
+def mst_matrix_test_cases() -> List[Tuple[str, tuple, tuple]]:
+    """(description, adjacency matrix, all minimum spanning trees as edge sets) cases from TestMatroid."""
+    return [
+        ('Empty', (), ()),
+        ('Single node', ((-1,),), ()),
+        ('Two nodes connected', ((-1,), (10, -1)), ({(0, 1)},)),
+        ('5 nodes complete #0', ((-1,), (3, -1), (4, 3, -1), (10, 4, 3, -1), (10, 10, 4, 3, -1)),
+         ({(0, 1), (1, 2), (2, 3), (3, 4)},)),
+        ('5 nodes complete #1', ((-1,), (10, -1), (3, 3, -1), (10, 10, 10, -1), (10, 3, 10, 3, -1)),
+         ({(0, 2), (1, 2), (1, 4), (3, 4)},)),
+        ('5 nodes incomplete', ((-1,), (3, -1), (-1, 6, -1), (-1, -1, 4, -1), (1, 2, 3, 5, -1)),
+         ({(0, 4), (1, 4), (2, 4), (2, 3)},)),
+        ('Two components', ((-1,), (2, -1), (-1, -1, -1), (-1, -1, 5, -1)), ({(0, 1), (2, 3)},)),
+    ]
+
+
+class TestDisjointSet(TestCase):
+    def test_union_find(self):
+        n = 100
+        disjoint_set = DisjointSet(n)
+        self.assertEqual(n, len(disjoint_set))
+        for i in range(0, n - 2, 2):
+            self.assertTrue(disjoint_set.union(i, i + 2))
+        for i in range(1, n - 2, 2):
+            self.assertTrue(disjoint_set.union(i + 2, i))
+        self.assertFalse(disjoint_set.union(0, n - 2))
+        self.assertEqual(disjoint_set.find(0), disjoint_set.find(n - 2))
+        self.assertEqual(disjoint_set.find(1), disjoint_set.find(n - 1))
+        self.assertNotEqual(disjoint_set.find(0), disjoint_set.find(1))
+        self.assertTrue(disjoint_set.union(n - 1, 0))
+        self.assertEqual(1, len({disjoint_set.find(i) for i in range(n)}))
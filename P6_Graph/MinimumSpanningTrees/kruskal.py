@@ -0,0 +1,36 @@
+from P6_Graph.MinimumSpanningTrees.common import DisjointSet, undirected_edges, tree_edge_keys, \
+    mst_basic_test_case, mst_matrix_test_cases
+from operator import itemgetter
+from unittest import TestCase
+
+
+def kruskal(graph) -> tuple:
+    """
+    Kruskal's algorithm in O(E log E) time: scans the edges by weight and keeps each one that joins two different
+    trees of a disjoint-set forest. A disconnected graph gets a minimum spanning forest.
+    :param graph: A weighted adjacency matrix, Graph or CSRGraph, see undirected_edges.
+    :return: The tree edges as (a, b) vertex key pairs. For an adjacency matrix, a < b.
+    """
+    n, edges, keys = undirected_edges(graph)
+    edges.sort(key=itemgetter(0))
+    disjoint_set = DisjointSet(n)
+    tree_edge_indices = []
+    for i, (_, a, b) in enumerate(edges):
+        if len(tree_edge_indices) == n - 1:
+            break
+        if disjoint_set.union(a, b):
+            tree_edge_indices.append(i)
+    return tree_edge_keys(edges, keys, tree_edge_indices)
+
+
+class TestKruskal(TestCase):
+    def test_matrices(self):
+        for desc, adj_matrix, msts in mst_matrix_test_cases():
+            mst = kruskal(adj_matrix)
+            self.assertTrue(set(mst) in msts if msts else not mst, msg='%s, unexpected result %s' % (desc, mst))
+
+    def test_graph(self):
+        graph, expected_weight = mst_basic_test_case()
+        mst = kruskal(graph)
+        self.assertEqual(8, len(mst))
+        self.assertEqual(expected_weight, sum(graph.edge_weight(u, v) for u, v in mst))
@@ -0,0 +1,121 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.MinimumSpanningTrees.common import undirected_edges, tree_edge_keys, mst_basic_test_case, \
+    mst_matrix_test_cases
+from P6_Graph.MinimumSpanningTrees.kruskal import kruskal
+from P2_Sorting.HeapSort.indexed_heap import IndexedMinHeap
+from P4_AdvancedTech.Greedy.matroid import minimum_spanning_tree
+from unittest import TestCase
+from random import randint, random
+import time
+
+
+def prim(graph) -> tuple:
+    """
+    Prim's algorithm in O(E log V) time: grows a tree from a root, keeping each vertex outside of it in an indexed
+    min heap keyed by its lightest edge to the tree. A disconnected graph gets a minimum spanning forest.
+    :param graph: A weighted adjacency matrix, Graph or CSRGraph, see undirected_edges.
+    :return: The tree edges as (a, b) vertex key pairs. For an adjacency matrix, a < b.
+    """
+    n, edges, keys = undirected_edges(graph)
+    adjacency = [[] for _ in range(n)]
+    for i, (w, a, b) in enumerate(edges):
+        adjacency[a].append((b, w, i))
+        adjacency[b].append((a, w, i))
+
+    in_tree = bytearray(n)
+    light_edges = [-1] * n  # The edge index of the lightest known edge from each vertex to the tree.
+    heap = IndexedMinHeap()
+    tree_edge_indices = []
+    for root in range(n):
+        if in_tree[root]:
+            continue
+        heap.push(root, 0)
+        while heap:
+            u, _ = heap.pop()
+            in_tree[u] = 1
+            if light_edges[u] >= 0:
+                tree_edge_indices.append(light_edges[u])
+            for v, w, i in adjacency[u]:
+                if in_tree[v]:
+                    continue
+                if v not in heap:
+                    heap.push(v, w)
+                    light_edges[v] = i
+                elif w < heap.priority(v):
+                    heap.decrease_key(v, w)
+                    light_edges[v] = i
+    return tree_edge_keys(edges, keys, tree_edge_indices)
+
+
+def _rand_adj_matrix(n: int, edge_probability: float, max_weight: int = 100) -> list:
+    return [[randint(0, max_weight) if j < i and random() < edge_probability else -1
+             for j in range(i + 1)] for i in range(n)]
+
+
+def _matrix_tree_weight(adj_matrix, tree) -> int:
+    return sum(adj_matrix[b][a] for a, b in tree)
+
+
+class TestPrim(TestCase):
+    def test_matrices(self):
+        for desc, adj_matrix, msts in mst_matrix_test_cases():
+            mst = prim(adj_matrix)
+            self.assertTrue(set(mst) in msts if msts else not mst, msg='%s, unexpected result %s' % (desc, mst))
+
+    def test_graph(self):
+        graph, expected_weight = mst_basic_test_case()
+        mst = prim(graph)
+        self.assertEqual(8, len(mst))
+        self.assertEqual(expected_weight, sum(graph.edge_weight(u, v) for u, v in mst))
+
+    def test_rand_matrices(self):
+        for n in (1, 2, 10, 30):
+            for edge_probability in (0.1, 0.5, 1):
+                adj_matrix = _rand_adj_matrix(n, edge_probability, 10)
+                has_edges = any(w >= 0 for row in adj_matrix for w in row)
+                expected = minimum_spanning_tree(adj_matrix) if has_edges else ()
+                for method in (prim, kruskal):
+                    mst = method(adj_matrix)
+                    self.assertEqual(len(expected), len(mst))
+                    self.assertEqual(_matrix_tree_weight(adj_matrix, expected), _matrix_tree_weight(adj_matrix, mst))
+                    self.assertTrue(all(a < b for a, b in mst))
+
+
+def _main():
+    # The matroid version takes O(|V| |E|^2) time, so it runs at 10^3 vertices only with about as many edges, which
+    # takes it some 10s where 5000 edges take minutes. At 10^5 vertices its adjacency matrix alone wouldn't fit in
+    # memory, so that size is left to Kruskal and Prim.
+    for n, edge_probability in ((200, 0.1), (1000, 0.002)):
+        adj_matrix = _rand_adj_matrix(n, edge_probability)
+        edge_count = sum(w >= 0 for row in adj_matrix for w in row)
+        for method in (minimum_spanning_tree, kruskal, prim):
+            start_time = time.time()
+            method(adj_matrix)
+            print('%s, %d-vertex adjacency matrix with %d edges: %.3fs.' % (
+                method.__name__, n, edge_count, time.time() - start_time))
+
+    n = 1000
+    adj_matrix = _rand_adj_matrix(n, 1)
+    for method in (kruskal, prim):
+        start_time = time.time()
+        method(adj_matrix)
+        print('%s, %d-vertex complete adjacency matrix: %.3fs.' % (method.__name__, n, time.time() - start_time))
+
+    n, m = 100000, 500000
+    graph = Graph(ordered=False)
+    for i in range(n):
+        graph.add_vertex(Vertex(i, ordered=False))
+    for i in range(1, n):
+        graph.add_2_edges(i, randint(0, i - 1), randint(0, 100))
+    for _ in range(m - n):
+        u, v = randint(0, n - 1), randint(0, n - 1)
+        if u != v and not graph.has_edge(u, v):
+            graph.add_2_edges(u, v, randint(0, 100))
+    for method in (kruskal, prim):
+        start_time = time.time()
+        method(graph)
+        print('%s, %d-vertex Graph with %d edges: %.3fs.' % (method.__name__, n, m, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
@@ -1,17 +1,29 @@
 from P6_Graph.directed_graph import Graph, Vertex
 from typing import Callable, Any
-from P6_Graph.SingleSourceShortestPaths.common import extract_min, reconstruct_path, dijkstra_basic_test_case
+from P6_Graph.SingleSourceShortestPaths.common import HeapFrontier, DictFrontier, reconstruct_path,\
+    dijkstra_basic_test_case
 from unittest import TestCase
 from sys import stdout
-
-
-def astar(graph: Graph, src_key, dst_key, heuristic_func: Callable[[Any], float]=None) -> dict:
-    open_set = {src_key: 0}
+import time
+
+
+def astar(graph: Graph, src_key, dst_key, heuristic_func: Callable[[Any], float]=None,
+          frontier_class=HeapFrontier) -> dict:
+    """
+    :param graph:
+    :param src_key:
+    :param dst_key:
+    :param heuristic_func: The admissible heuristic, evaluated once per vertex.
+    :param frontier_class: The open set implementation, HeapFrontier or DictFrontier.
+    :return: The came_from dictionary.
+    """
+    open_set = frontier_class(heuristic_func)  # Diff from Dijkstra
+    open_set[src_key] = 0
     closed_set = set()
     came_from = {src_key: None}
 
     while open_set:
-        u, u_cost = extract_min(open_set, heuristic_func)  # Diff from Dijkstra
+        u, u_cost = open_set.extract_min()
         closed_set.add(u)
 
         if u == dst_key:  # Diff from dijkstra
@@ -20,7 +32,7 @@ def astar(graph: Graph, src_key, dst_key, heuristic_func: Callable[[Any], float]
         for v, w in graph.get_vertex(u).successors():
             if v in closed_set:
                 continue
-            new_cost = u_cost + graph.edge_weight(u, v)
+            new_cost = u_cost + w
             if v not in open_set or open_set[v] > new_cost:
                 open_set[v] = new_cost
                 came_from[v] = u
@@ -30,20 +42,39 @@ def astar(graph: Graph, src_key, dst_key, heuristic_func: Callable[[Any], float]
 class TestAStar(TestCase):
     def test_astar_as_dijkstra(self):
         graph, src, expected_results = dijkstra_basic_test_case()
-        came_from = astar(graph, src, None, None)
-        for dst, expected in expected_results.items():
-            self.assertSequenceEqual(reconstruct_path(came_from, src, dst), expected)
-
-
-def terrain_to_graph(terrain):
-    graph = Graph()
+        for frontier_class in (HeapFrontier, DictFrontier):
+            came_from = astar(graph, src, None, None, frontier_class)
+            for dst, expected in expected_results.items():
+                self.assertSequenceEqual(reconstruct_path(came_from, src, dst), expected)
+
+    def test_astar_frontiers_agree(self):
+        terrain = [[(x * 7 + y * 13) % 5 + 1 for x in range(20)] for y in range(20)]
+        for y in range(3, 17):
+            terrain[y][10] = -1
+        graph = terrain_to_graph(terrain)
+        src, dst = (2, 10), (18, 10)
+
+        def h(key):
+            return abs(key[0] - dst[0]) + abs(key[1] - dst[1])
+
+        costs = []
+        for frontier_class in (HeapFrontier, DictFrontier):
+            path = reconstruct_path(astar(graph, src, dst, h, frontier_class), src, dst)
+            self.assertEqual(src, path[0])
+            self.assertEqual(dst, path[-1])
+            costs.append(sum(graph.edge_weight(path[i], path[i + 1]) for i in range(len(path) - 1)))
+        self.assertEqual(costs[0], costs[1])
+
+
+def terrain_to_graph(terrain, ordered: bool = True):
+    graph = Graph(ordered)
     if not terrain or not terrain[0]:
         return graph
     h = len(terrain)
     w = len(terrain[0])
     for x in range(0, w):
         for y in range(0, h):
-            graph.add_vertex(Vertex((x, y)))
+            graph.add_vertex(Vertex((x, y), ordered))
 
     for x in range(0, w):
         for y in range(0, h):
@@ -136,6 +167,37 @@ def _main():
     came_from = astar(graph, src, dst, h)
     draw_path(graph, terrain, came_from, src, dst)
 
+    benchmark_frontiers()
+
+
+def benchmark_frontiers(sizes=(100, 500, 1000), dict_frontier_max_size=500):
+    """
+    Compares DictFrontier and HeapFrontier on square grids built by terrain_to_graph. DictFrontier is skipped on grids
+    wider than dict_frontier_max_size, since it takes O(V^2) time there.
+    """
+    from P6_Graph.SingleSourceShortestPaths.dijkstra import dijkstra
+    for n in sizes:
+        terrain = [[(x * 7 + y * 13) % 5 + 1 for x in range(n)] for y in range(n)]
+        start_time = time.time()
+        graph = terrain_to_graph(terrain)
+        print('%d x %d grid built in %.2fs.' % (n, n, time.time() - start_time))
+        src, dst = (0, 0), (n - 1, n - 1)
+
+        def h(key):
+            return abs(key[0] - dst[0]) + abs(key[1] - dst[1])
+
+        for frontier_class in (DictFrontier, HeapFrontier):
+            if frontier_class is DictFrontier and n > dict_frontier_max_size:
+                print('  %s: skipped.' % frontier_class.__name__)
+                continue
+            start_time = time.time()
+            dijkstra(graph, src, frontier_class)
+            dijkstra_time = time.time() - start_time
+            start_time = time.time()
+            astar(graph, src, dst, h, frontier_class)
+            astar_time = time.time() - start_time
+            print('  %s: dijkstra %.2fs, astar %.2fs.' % (frontier_class.__name__, dijkstra_time, astar_time))
+
 
 if __name__ == '__main__':
     _main()
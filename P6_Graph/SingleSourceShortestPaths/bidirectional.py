@@ -0,0 +1,154 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.ElementaryGraphAlgorithms.representation import get_transpose
+from P6_Graph.SingleSourceShortestPaths.common import HeapFrontier, reconstruct_path, dijkstra_basic_test_case
+from P6_Graph.SingleSourceShortestPaths.dijkstra import dijkstra
+from P6_Graph.SingleSourceShortestPaths.astar import terrain_to_graph
+from typing import Callable, Any
+from unittest import TestCase
+from random import randint
+
+
+def bidirectional_dijkstra(graph: Graph, src_key, dst_key, reverse_graph: Graph=None,
+                           frontier_class=HeapFrontier) -> dict:
+    """
+    Point-to-point shortest path by running Dijkstra forward from src_key and backward from dst_key, stopping as soon
+    as the two frontiers meet.
+    :param graph:
+    :param src_key:
+    :param dst_key:
+    :param reverse_graph: The transpose of graph, graph.transpose() by default, which is cached across queries until
+    graph is modified.
+    :param frontier_class: The open set implementation.
+    :return: The came_from dictionary, from which reconstruct_path(came_from, src_key, dst_key) gets the path.
+    """
+    return _bidirectional_search(graph, reverse_graph, src_key, dst_key, None, frontier_class)
+
+
+def bidirectional_astar(graph: Graph, src_key, dst_key, heuristic_func: Callable[[Any, Any], float],
+                        reverse_graph: Graph=None, frontier_class=HeapFrontier) -> dict:
+    """
+    Bidirectional A* with average potentials: the forward search uses (h(v, dst) - h(src, v)) / 2 as its heuristic
+    and the backward search uses the negation, so that both are consistent and the bidirectional Dijkstra stopping
+    rule still holds.
+    :param graph:
+    :param src_key:
+    :param dst_key:
+    :param heuristic_func: heuristic_func(u, v) is a consistent estimate of the distance from u to v.
+    :param reverse_graph: The transpose of graph, see bidirectional_dijkstra.
+    :param frontier_class: The open set implementation.
+    :return: The came_from dictionary, from which reconstruct_path(came_from, src_key, dst_key) gets the path.
+    """
+    def potential(v_key):
+        return (heuristic_func(v_key, dst_key) - heuristic_func(src_key, v_key)) / 2
+    return _bidirectional_search(graph, reverse_graph, src_key, dst_key, potential, frontier_class)
+
+
+def _bidirectional_search(graph: Graph, reverse_graph: Graph, src_key, dst_key,
+                          potential: Callable[[Any], float], frontier_class) -> dict:
+    came_from = {src_key: None}
+    if src_key == dst_key:
+        return came_from
+    if reverse_graph is None:
+        reverse_graph = graph.transpose()
+
+    # Index 0 is the forward search, 1 the backward one.
+    graphs = (graph, reverse_graph)
+    open_sets = (frontier_class(potential), frontier_class((lambda v_key: -potential(v_key)) if potential else None))
+    closed_sets = (set(), set())
+    costs = ({src_key: 0}, {dst_key: 0})
+    came_froms = (came_from, {dst_key: None})
+    open_sets[0][src_key] = 0
+    open_sets[1][dst_key] = 0
+    best_cost = float('inf')
+    meeting_edge = None
+
+    while open_sets[0] and open_sets[1]:
+        if open_sets[0].min_priority() + open_sets[1].min_priority() >= best_cost:
+            break
+        side = 0 if len(open_sets[0]) <= len(open_sets[1]) else 1
+        open_set, closed_set, cost, other_cost = open_sets[side], closed_sets[side], costs[side], costs[1 - side]
+        u, u_cost = open_set.extract_min()
+        closed_set.add(u)
+        for v, w in graphs[side].get_vertex(u).successors():
+            new_cost = u_cost + w
+            if v in other_cost and new_cost + other_cost[v] < best_cost:
+                best_cost = new_cost + other_cost[v]
+                meeting_edge = (u, v) if side == 0 else (v, u)
+            if v in closed_set:
+                continue
+            if v not in open_set or open_set[v] > new_cost:
+                open_set[v] = new_cost
+                cost[v] = new_cost
+                came_froms[side][v] = u
+
+    if meeting_edge is None:
+        return came_from
+    a, b = meeting_edge
+    path = reconstruct_path(came_from, src_key, a)
+    backward_path = [b]
+    while backward_path[-1] != dst_key:
+        backward_path.append(came_froms[1][backward_path[-1]])
+    # Zero-weight cycles may make both halves share a vertex.
+    positions = {v: i for i, v in enumerate(path)}
+    for j, v in enumerate(backward_path):
+        if v in positions:
+            path, backward_path = path[:positions[v]], backward_path[j:]
+            break
+    path.extend(backward_path)
+    for i in range(1, len(path)):
+        came_from[path[i]] = path[i - 1]
+    return came_from
+
+
+def _path_cost(graph: Graph, path: list) -> float:
+    return sum(graph.edge_weight(path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+class TestBidirectional(TestCase):
+    def test_basic(self):
+        graph, src, expected_results = dijkstra_basic_test_case()
+        reverse_graph = get_transpose(graph)
+        for dst, expected in expected_results.items():
+            self.assertSequenceEqual(reconstruct_path(bidirectional_dijkstra(graph, src, dst), src, dst), expected)
+            came_from = bidirectional_astar(graph, src, dst, lambda _u, _v: 0, reverse_graph)
+            self.assertSequenceEqual(reconstruct_path(came_from, src, dst), expected)
+
+    def test_rand_graphs(self):
+        for _ in range(20):
+            graph = Graph()
+            for i in range(30):
+                graph.add_vertex(Vertex(i))
+            for _ in range(80):
+                u, v = randint(0, 29), randint(0, 29)
+                if not graph.has_edge(u, v):
+                    graph.add_edge(u, v, randint(0, 10))
+            reverse_graph = get_transpose(graph)
+            came_from = dijkstra(graph, 0)
+            for dst in range(30):
+                expected = reconstruct_path(came_from, 0, dst)
+                path = reconstruct_path(bidirectional_dijkstra(graph, 0, dst, reverse_graph), 0, dst)
+                self.assertEqual(bool(expected), bool(path))
+                if path:
+                    self.assertEqual((0, dst), (path[0], path[-1]))
+                    self.assertEqual(_path_cost(graph, expected), _path_cost(graph, path))
+
+    def test_terrain(self):
+        terrain = [[(x * 7 + y * 13) % 5 + 1 for x in range(15)] for y in range(15)]
+        for y in range(2, 13):
+            terrain[y][7] = -1
+        graph = terrain_to_graph(terrain)
+        reverse_graph = get_transpose(graph)
+
+        def h(u, v):
+            return abs(u[0] - v[0]) + abs(u[1] - v[1])
+
+        src = (1, 7)
+        came_from = dijkstra(graph, src)
+        for dst in ((13, 7), (7, 0), (1, 8), (14, 14)):
+            expected = _path_cost(graph, reconstruct_path(came_from, src, dst))
+            for result in (bidirectional_dijkstra(graph, src, dst, reverse_graph),
+                           bidirectional_astar(graph, src, dst, h, reverse_graph)):
+                path = reconstruct_path(result, src, dst)
+                self.assertEqual((src, dst), (path[0], path[-1]))
+                self.assertEqual(expected, _path_cost(graph, path))
+        self.assertSequenceEqual([], reconstruct_path(bidirectional_dijkstra(graph, src, (7, 5)), src, (7, 5)))
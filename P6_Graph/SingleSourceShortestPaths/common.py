@@ -1,27 +1,90 @@
 from typing import Tuple, Any, Callable
 from P6_Graph.directed_graph import Graph, Vertex
+from P2_Sorting.HeapSort.indexed_heap import IndexedMinHeap
 
 
 def extract_min(open_set: dict, heuristic_func: Callable[[Any], float]=None) -> Tuple[Any, float]:
     """
-    Viewing open_set as a priority queue, this function retrieves the item with the minimum cost.
+    Viewing open_set as a priority queue, this function retrieves the item with the minimum cost. O(n) time, where
+    n = len(open_set).
     :param open_set:
     :param heuristic_func:
     :return:
     """
     assert open_set
-    if not heuristic_func:
-        def heuristic_func(_): return 0
+    min_priority = float('inf')
     min_cost = float('inf')
     min_vertex_key = None
     for vertex_key, cost in open_set.items():
-        if cost + heuristic_func(vertex_key) < min_cost + heuristic_func(min_vertex_key):
+        priority = cost + heuristic_func(vertex_key) if heuristic_func else cost
+        if min_vertex_key is None or priority < min_priority:
+            min_priority = priority
             min_cost = cost
             min_vertex_key = vertex_key
     open_set.pop(min_vertex_key)
     return min_vertex_key, min_cost
 
 
+class DictFrontier(dict):
+    """
+    The open set of Dijkstra or A* as a plain dict from vertex keys to costs. Extracting the minimum scans the whole
+    dict, so a full search runs in O(V^2) time.
+    """
+    def __init__(self, heuristic_func: Callable[[Any], float]=None):
+        super().__init__()
+        self._heuristic_func = heuristic_func
+
+    def min_priority(self) -> float:
+        heuristic_func = self._heuristic_func
+        return min(cost + heuristic_func(k) if heuristic_func else cost for k, cost in self.items())
+
+    def extract_min(self) -> Tuple[Any, float]:
+        return extract_min(self, self._heuristic_func)
+
+
+class HeapFrontier(object):
+    """
+    The open set of Dijkstra or A* backed by an indexed binary heap with decrease-key, so that a full search runs in
+    O((V + E) log V) time. The heuristic is evaluated once per vertex and cached. The cost of a vertex already in the
+    frontier can only be decreased.
+    """
+    def __init__(self, heuristic_func: Callable[[Any], float]=None):
+        self._heuristic_func = heuristic_func
+        self._heuristics = {}
+        self._costs = {}
+        self._heap = IndexedMinHeap()
+
+    def __len__(self):
+        return len(self._costs)
+
+    def __contains__(self, vertex_key):
+        return vertex_key in self._costs
+
+    def __getitem__(self, vertex_key) -> float:
+        return self._costs[vertex_key]
+
+    def __setitem__(self, vertex_key, cost: float):
+        heuristic_func = self._heuristic_func
+        priority = cost
+        if heuristic_func:
+            h = self._heuristics.get(vertex_key)
+            if h is None:
+                h = self._heuristics[vertex_key] = heuristic_func(vertex_key)
+            priority += h
+        if vertex_key in self._costs:
+            self._heap.decrease_key(vertex_key, priority)
+        else:
+            self._heap.push(vertex_key, priority)
+        self._costs[vertex_key] = cost
+
+    def min_priority(self) -> float:
+        return self._heap.peek()[1]
+
+    def extract_min(self) -> Tuple[Any, float]:
+        vertex_key, _ = self._heap.pop()
+        return vertex_key, self._costs.pop(vertex_key)
+
+
 def reconstruct_path(came_from: dict, src_key, dst_key) -> list:
     """
     Reconstruct path from the came_from dictionary.
@@ -34,7 +97,7 @@ def reconstruct_path(came_from: dict, src_key, dst_key) -> list:
     while dst_key != src_key:
         path.append(dst_key)
         dst_key = came_from[dst_key] if dst_key in came_from else None
-        if not dst_key:
+        if dst_key is None:
             return []
     path.append(src_key)
     path.reverse()
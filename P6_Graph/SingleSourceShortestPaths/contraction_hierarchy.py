@@ -0,0 +1,403 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.SingleSourceShortestPaths.common import reconstruct_path, dijkstra_basic_test_case
+from P6_Graph.SingleSourceShortestPaths.dijkstra import dijkstra
+from P6_Graph.SingleSourceShortestPaths.astar import terrain_to_graph
+from P2_Sorting.HeapSort.indexed_heap import IndexedMinHeap
+from array import array
+from bisect import bisect_left
+from heapq import heappush, heappop
+from unittest import TestCase
+from random import randint
+from struct import Struct
+import os
+import pickle
+import tempfile
+import time
+
+
+# Witness searches settle at most this many vertices per edge per vertex of the remaining graph by default, so that
+# they reach about as far in the sparse graph at the start as in the denser core left at the end.
+DEFAULT_WITNESS_SETTLES_PER_DEGREE = 50
+
+# Vertex count, upward edge count, downward edge count and shortcut count.
+_CH_HEADER = Struct('<qqqq')
+
+
+class ContractionHierarchy(object):
+    """
+    The result of contracting a static graph. Vertices are numbered 0 .. n - 1 by contraction order, keys[i] being the
+    key of vertex i. The upward graph is stored in the compressed sparse row layout of CSRGraph: the edges and
+    shortcuts u -> v with v > u are up_targets[up_offsets[u] .. up_offsets[u + 1] - 1], sorted by v, with their
+    weights in up_weights and in up_middles the contracted vertex a shortcut bypasses, -1 for an original edge. The
+    down arrays hold the edges and shortcuts u -> v with u > v the same way, in the row of v.
+    """
+    def __init__(self, keys, up: tuple, down: tuple, shortcut_len: int):
+        """
+        :param keys: The vertex keys in contraction order.
+        :param up: (offsets, targets, weights, middles) of the upward edges.
+        :param down: (offsets, targets, weights, middles) of the downward edges, reversed.
+        :param shortcut_len: The number of shortcuts.
+        """
+        assert len(up[0]) == len(down[0]) == len(keys) + 1
+        self.keys = keys
+        self._indices = {k: i for i, k in enumerate(keys)}
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middles = up
+        self.down_offsets, self.down_targets, self.down_weights, self.down_middles = down
+        self.shortcut_len = shortcut_len
+
+    def save(self, path):
+        """Writes a header with the vertex, edge and shortcut counts, the upward and downward arrays, then the keys."""
+        with open(path, 'wb') as f:
+            f.write(_CH_HEADER.pack(len(self.keys), len(self.up_targets), len(self.down_targets), self.shortcut_len))
+            for buffer in self._buffers():
+                f.write(memoryview(buffer).cast('B'))
+            pickle.dump(self.keys, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path) -> 'ContractionHierarchy':
+        with open(path, 'rb') as f:
+            n, up_len, down_len, shortcut_len = _CH_HEADER.unpack(f.read(_CH_HEADER.size))
+            up = (array('q'), array('q'), array('d'), array('q'))
+            down = (array('q'), array('q'), array('d'), array('q'))
+            for buffers, m in ((up, up_len), (down, down_len)):
+                for buffer, size in zip(buffers, (n + 1, m, m, m)):
+                    buffer.frombytes(f.read(size * 8))
+            keys = pickle.load(f)
+        return ContractionHierarchy(keys, up, down, shortcut_len)
+
+    def _buffers(self) -> tuple:
+        return (self.up_offsets, self.up_targets, self.up_weights, self.up_middles,
+                self.down_offsets, self.down_targets, self.down_weights, self.down_middles)
+
+    def distance(self, src_key, dst_key) -> float:
+        """The shortest path distance from src_key to dst_key, inf if unreachable."""
+        return self._search(self._indices[src_key], self._indices[dst_key])[0]
+
+    def shortest_path(self, src_key, dst_key) -> list:
+        """
+        The shortest path from src_key to dst_key with all shortcuts unpacked, the same vertex sequence as
+        reconstruct_path on the result of dijkstra. Empty if unreachable.
+        """
+        src, dst = self._indices[src_key], self._indices[dst_key]
+        cost, meeting, forward_parents, backward_parents = self._search(src, dst)
+        if meeting < 0:
+            return []
+        upward_path = []
+        u = meeting
+        while u >= 0:
+            upward_path.append(u)
+            u = forward_parents[u]
+        upward_path.reverse()
+        u = backward_parents[meeting]
+        while u >= 0:
+            upward_path.append(u)
+            u = backward_parents[u]
+        path = [src]
+        for i in range(len(upward_path) - 1):
+            self._unpack_edge(upward_path[i], upward_path[i + 1], path)
+        keys = self.keys
+        return [keys[u] for u in path]
+
+    def _search(self, src: int, dst: int) -> tuple:
+        """
+        Bidirectional Dijkstra restricted to upward edges in both directions, with stall-on-demand: a vertex reached
+        more cheaply through an edge down from a higher vertex that the same search already reached isn't on a
+        shortest up-down path, so its edges are not relaxed. heapq with stale entries skipped beats decrease-key here.
+        :return: (the distance, the meeting vertex or -1, the forward parents, the backward parents), with the parents
+        -1 at src and dst.
+        """
+        if src == dst:
+            return 0, src, {src: -1}, {dst: -1}
+        forward_costs, backward_costs = {src: 0}, {dst: 0}
+        forward_parents, backward_parents = {src: -1}, {dst: -1}
+        searches = ((forward_costs, backward_costs, forward_parents, [(0, src)], self.up_offsets, self.up_targets,
+                     self.up_weights, self.down_offsets, self.down_targets, self.down_weights),
+                    (backward_costs, forward_costs, backward_parents, [(0, dst)], self.down_offsets,
+                     self.down_targets, self.down_weights, self.up_offsets, self.up_targets, self.up_weights))
+        best_cost = float('inf')
+        meeting = -1
+        side = 0
+        while True:
+            # Each search stops once its minimum reaches best_cost; the searches alternate while both run.
+            heap = searches[side][3]
+            if not heap or heap[0][0] >= best_cost:
+                side = 1 - side
+                heap = searches[side][3]
+                if not heap or heap[0][0] >= best_cost:
+                    break
+            costs, other_costs, parents, heap, offsets, targets, weights, stall_offsets, stall_targets, \
+                stall_weights = searches[side]
+            u_cost, u = heappop(heap)
+            side = 1 - side
+            if u_cost > costs[u]:
+                continue
+            other_cost = other_costs.get(u)
+            if other_cost is not None and u_cost + other_cost < best_cost:
+                best_cost = u_cost + other_cost
+                meeting = u
+            stalled = False
+            for i in range(stall_offsets[u], stall_offsets[u + 1]):
+                v_cost = costs.get(stall_targets[i])
+                if v_cost is not None and v_cost + stall_weights[i] < u_cost:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                new_cost = u_cost + weights[i]
+                v_cost = costs.get(v)
+                if v_cost is None or new_cost < v_cost:
+                    costs[v] = new_cost
+                    parents[v] = u
+                    heappush(heap, (new_cost, v))
+        return best_cost, meeting, forward_parents, backward_parents
+
+    def _middle(self, u: int, v: int) -> int:
+        if u < v:
+            lo, hi = self.up_offsets[u], self.up_offsets[u + 1]
+            return self.up_middles[bisect_left(self.up_targets, v, lo, hi)]
+        lo, hi = self.down_offsets[v], self.down_offsets[v + 1]
+        return self.down_middles[bisect_left(self.down_targets, u, lo, hi)]
+
+    def _unpack_edge(self, u: int, v: int, path: list):
+        """Appends the vertices after u on the unpacked edge u -> v to path."""
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle(a, b)
+            if middle < 0:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+
+def _witness_costs(out_edges: list, src: int, excluded: int, targets, max_cost, hop_limit: int,
+                   settle_limit: int) -> dict:
+    """
+    Dijkstra from src avoiding excluded, over paths of at most hop_limit edges, bounded by max_cost and the number of
+    settled vertices, and stopping once all targets are settled. Preprocessing runs millions of these small searches,
+    so they use heapq with stale entries skipped rather than decrease-key.
+    """
+    costs = {src: 0}
+    heap = [(0, 0, src)]
+    targets_left = len(targets)
+    settled = 0
+    while heap and settled < settle_limit:
+        u_cost, hops, u = heappop(heap)
+        if u_cost > max_cost:
+            break
+        if u_cost > costs[u]:
+            continue
+        settled += 1
+        if u in targets:
+            targets_left -= 1
+            if not targets_left:
+                break
+        if hops == hop_limit:
+            continue
+        for v, (w, _) in out_edges[u].items():
+            new_cost = u_cost + w
+            if v != excluded and new_cost <= max_cost and (v not in costs or new_cost < costs[v]):
+                costs[v] = new_cost
+                heappush(heap, (new_cost, hops + 1, v))
+    return costs
+
+
+def _shortcuts(out_edges: list, in_edges: list, v: int, hop_limit: int, settle_limit: int) -> list:
+    """The shortcuts (u, w, weight) needed if v is contracted now."""
+    shortcuts = []
+    if not in_edges[v] or not out_edges[v]:
+        return shortcuts
+    v_out_edges = out_edges[v]
+    max_out_weight = max(w for w, _ in v_out_edges.values())
+    for u, (in_weight, _) in in_edges[v].items():
+        witness_costs = _witness_costs(out_edges, u, v, v_out_edges, in_weight + max_out_weight, hop_limit,
+                                       settle_limit)
+        for w, (out_weight, _) in v_out_edges.items():
+            if w != u and witness_costs.get(w, float('inf')) > in_weight + out_weight:
+                shortcuts.append((u, w, in_weight + out_weight))
+    return shortcuts
+
+
+def _settle_limit(edge_len: int, vertex_len: int) -> int:
+    return max(1, DEFAULT_WITNESS_SETTLES_PER_DEGREE * edge_len // vertex_len)
+
+
+def _csr_arrays(rows: list, ranks: list) -> tuple:
+    """(offsets, targets, weights, middles) of the rows of edges, renumbered by rank, see ContractionHierarchy."""
+    offsets, targets, weights, middles = array('q', [0]), array('q'), array('d'), array('q')
+    for row in rows:
+        for v, weight, middle in sorted((ranks[v], weight, -1 if middle is None else ranks[middle])
+                                        for v, (weight, middle) in row.items()):
+            targets.append(v)
+            weights.append(weight)
+            middles.append(middle)
+        offsets.append(len(targets))
+    return offsets, targets, weights, middles
+
+
+def contract_graph(graph: Graph, settle_limit: int = None, hop_limit: int = None) -> ContractionHierarchy:
+    """
+    Contraction hierarchy preprocessing. Vertices are contracted in increasing order of twice the edge difference
+    (shortcuts added minus edges removed), plus the number of contracted neighbours, plus the level of the vertex in
+    the hierarchy: one above the highest level of its contracted neighbours. The priorities of the neighbours of a
+    contracted vertex are recomputed right away, and that of the top vertex is checked again before it's contracted.
+    A shortcut is added whenever the witness search finds no path at most as short.
+    :param graph: The graph, with non-negative weights.
+    :param settle_limit: The maximum number of vertices a witness search settles, or None for
+    DEFAULT_WITNESS_SETTLES_PER_DEGREE times the average out degree of the remaining graph, updated as it gets denser.
+    :param hop_limit: The maximum number of edges on a witness path, None for no limit. Small limits speed up
+    preprocessing at the cost of more shortcuts.
+    :return: The contraction hierarchy.
+    """
+    keys = list(graph.vertex_keys())
+    n = len(keys)
+    indices = {k: i for i, k in enumerate(keys)}
+    out_edges = [{} for _ in range(n)]
+    in_edges = [{} for _ in range(n)]
+    edge_len = 0
+    for u, u_key in enumerate(keys):
+        for v_key, w in graph.get_vertex(u_key).successors():
+            v = indices[v_key]
+            if u != v:
+                out_edges[u][v] = (w, None)
+                in_edges[v][u] = (w, None)
+                edge_len += 1
+
+    contracted_neighbours = [0] * n
+    levels = [0] * n
+    hop_limit = hop_limit or n
+    current_settle_limit = settle_limit or _settle_limit(edge_len, n)
+
+    def shortcuts_and_priority(_v) -> tuple:
+        _shortcut_list = _shortcuts(out_edges, in_edges, _v, hop_limit, current_settle_limit)
+        return _shortcut_list, (2 * (len(_shortcut_list) - len(in_edges[_v]) - len(out_edges[_v])) +
+                                contracted_neighbours[_v] + levels[_v])
+
+    heap = IndexedMinHeap()
+    for v in range(n):
+        heap.push(v, shortcuts_and_priority(v)[1])
+
+    ranks = [0] * n
+    order = []
+    forward = [None] * n
+    backward = [None] * n
+    shortcut_len = 0
+    while heap:
+        v, old_priority = heap.peek()
+        shortcuts, new_priority = shortcuts_and_priority(v)
+        if new_priority > old_priority:
+            heap.update_key(v, new_priority)
+            if heap.peek()[0] != v:
+                continue
+        heap.pop()
+
+        for u, w, weight in shortcuts:
+            old_edge = out_edges[u].get(w)
+            if old_edge is None or weight < old_edge[0]:
+                if old_edge is None:
+                    edge_len += 1
+                if old_edge is None or old_edge[1] is None:
+                    shortcut_len += 1
+                out_edges[u][w] = (weight, v)
+                in_edges[w][u] = (weight, v)
+
+        ranks[v] = len(order)
+        order.append(v)
+        forward[v], backward[v] = out_edges[v], in_edges[v]
+        out_edges[v], in_edges[v] = {}, {}
+        neighbours = set(forward[v])
+        neighbours.update(backward[v])
+        for w in forward[v]:
+            in_edges[w].pop(v)
+        for u in backward[v]:
+            out_edges[u].pop(v)
+        edge_len -= len(forward[v]) + len(backward[v])
+        if settle_limit is None and len(order) < n:
+            current_settle_limit = _settle_limit(edge_len, n - len(order))
+        for u in neighbours:
+            contracted_neighbours[u] += 1
+            levels[u] = max(levels[u], levels[v] + 1)
+            heap.update_key(u, shortcuts_and_priority(u)[1])
+
+    return ContractionHierarchy(tuple(keys[v] for v in order),
+                                _csr_arrays([forward[v] for v in order], ranks),
+                                _csr_arrays([backward[v] for v in order], ranks), shortcut_len)
+
+
+def _path_cost(graph: Graph, path: list) -> float:
+    return sum(graph.edge_weight(path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+class TestContractionHierarchy(TestCase):
+    def test_basic(self):
+        graph, src, expected_results = dijkstra_basic_test_case()
+        ch = contract_graph(graph)
+        for dst, expected in expected_results.items():
+            self.assertSequenceEqual(expected, ch.shortest_path(src, dst))
+        self.assertEqual(20, ch.distance(1, 5))
+        self.assertEqual(float('inf'), ch.distance(1, 7))
+
+    def test_rand_graphs(self):
+        for settle_limit, hop_limit in ((None, None), (None, 1), (1, None)):
+            graph = Graph()
+            for i in range(40):
+                graph.add_vertex(Vertex(i))
+            for _ in range(120):
+                u, v = randint(0, 39), randint(0, 39)
+                if not graph.has_edge(u, v):
+                    graph.add_edge(u, v, randint(0, 20))
+            ch = contract_graph(graph, settle_limit, hop_limit)
+            for src in range(0, 40, 3):
+                came_from = dijkstra(graph, src)
+                for dst in range(40):
+                    expected = reconstruct_path(came_from, src, dst)
+                    path = ch.shortest_path(src, dst)
+                    self.assertEqual(bool(expected), bool(path))
+                    if path:
+                        self.assertEqual((src, dst), (path[0], path[-1]))
+                        self.assertEqual(_path_cost(graph, expected), _path_cost(graph, path))
+                        self.assertEqual(_path_cost(graph, path), ch.distance(src, dst))
+
+    def test_save_load(self):
+        graph = terrain_to_graph([[(x * 7 + y * 13) % 5 + 1 for x in range(8)] for y in range(8)])
+        ch = contract_graph(graph)
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'ch.bin')
+            ch.save(path)
+            loaded = ContractionHierarchy.load(path)
+        self.assertSequenceEqual(ch.keys, loaded.keys)
+        self.assertSequenceEqual(ch._buffers(), loaded._buffers())
+        self.assertEqual(ch.shortcut_len, loaded.shortcut_len)
+        self.assertSequenceEqual(ch.shortest_path((0, 0), (7, 7)), loaded.shortest_path((0, 0), (7, 7)))
+
+
+def _main():
+    query_count = 1000
+    for n in (100, 200, 300):
+        terrain = [[(x * 7 + y * 13) % 5 + 1 for x in range(n)] for y in range(n)]
+        graph = terrain_to_graph(terrain, ordered=False)
+        start_time = time.time()
+        ch = contract_graph(graph)
+        preprocessing_time = time.time() - start_time
+        queries = [((randint(0, n - 1), randint(0, n - 1)), (randint(0, n - 1), randint(0, n - 1)))
+                   for _ in range(query_count)]
+        start_time = time.time()
+        for src, dst in queries:
+            ch.distance(src, dst)
+        distance_time = (time.time() - start_time) / query_count
+        start_time = time.time()
+        for src, dst in queries:
+            ch.shortest_path(src, dst)
+        path_time = (time.time() - start_time) / query_count
+        start_time = time.time()
+        for src, _ in queries[:10]:
+            dijkstra(graph, src)
+        dijkstra_time = (time.time() - start_time) / 10
+        print('%d x %d grid: preprocessing %.2fs, %d shortcuts, distance %.1fus, path %.1fus, dijkstra %.1fus.' %
+              (n, n, preprocessing_time, ch.shortcut_len, distance_time * 1e6, path_time * 1e6, dijkstra_time * 1e6))
+
+if __name__ == '__main__':
+    _main()
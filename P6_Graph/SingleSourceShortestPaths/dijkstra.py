@@ -1,14 +1,22 @@
-from P6_Graph.SingleSourceShortestPaths.common import extract_min, reconstruct_path, dijkstra_basic_test_case
+from P6_Graph.SingleSourceShortestPaths.common import HeapFrontier, DictFrontier, reconstruct_path,\
+    dijkstra_basic_test_case
 from P6_Graph.directed_graph import Graph
 from unittest import TestCase
 
 
-def dijkstra(graph: Graph, src_key) -> dict:
-    open_set = {src_key: 0}
+def dijkstra(graph: Graph, src_key, frontier_class=HeapFrontier) -> dict:
+    """
+    :param graph:
+    :param src_key:
+    :param frontier_class: The open set implementation, HeapFrontier or DictFrontier.
+    :return: The came_from dictionary.
+    """
+    open_set = frontier_class()
+    open_set[src_key] = 0
     closed_set = set()
     came_from = {src_key: None}
     while open_set:
-        u, u_cost = extract_min(open_set)
+        u, u_cost = open_set.extract_min()
         closed_set.add(u)
         for v, w in graph.get_vertex(u).successors():
             if v in closed_set:
@@ -23,6 +31,7 @@ def dijkstra(graph: Graph, src_key) -> dict:
 class TestDijkstra(TestCase):
     def test_dijkstra_basic(self):
         graph, src, expected_results = dijkstra_basic_test_case()
-        came_from = dijkstra(graph, src)
-        for dst, expected in expected_results.items():
-            self.assertSequenceEqual(reconstruct_path(came_from, src, dst), expected)
+        for frontier_class in (HeapFrontier, DictFrontier):
+            came_from = dijkstra(graph, src, frontier_class)
+            for dst, expected in expected_results.items():
+                self.assertSequenceEqual(reconstruct_path(came_from, src, dst), expected)
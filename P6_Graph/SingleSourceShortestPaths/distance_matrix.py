@@ -0,0 +1,183 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from P6_Graph.csr_graph import CSRGraph
+from P6_Graph.SingleSourceShortestPaths.common import reconstruct_path
+from P6_Graph.SingleSourceShortestPaths.dijkstra import dijkstra
+from P6_Graph.SingleSourceShortestPaths.astar import terrain_to_graph
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
+from array import array
+from typing import Sequence
+from unittest import TestCase
+from random import randint, sample
+import os
+import tempfile
+import time
+
+
+class DistanceMatrix(object):
+    """
+    Row-major matrix of shortest path distances in an array('d'), with one row per source and one column per target.
+    Unreachable targets are inf. numpy.frombuffer(matrix.data).reshape(matrix.shape) views it without copying.
+    """
+    def __init__(self, sources: Sequence, targets: Sequence, data: array):
+        assert len(data) == len(sources) * len(targets)
+        self.sources = tuple(sources)
+        self.targets = tuple(targets)
+        self.data = data
+
+    @property
+    def shape(self):
+        return len(self.sources), len(self.targets)
+
+    def __getitem__(self, ij) -> float:
+        i, j = ij
+        return self.data[i * len(self.targets) + j]
+
+    def row(self, i: int):
+        n = len(self.targets)
+        return self.data[i * n:(i + 1) * n]
+
+
+def _distance_rows(graph: CSRGraph, source_indices: Sequence[int], target_indices: Sequence[int]) -> array:
+    """
+    Runs Dijkstra from each source over the CSR buffers, stopping once every target is settled. The distance and
+    settled buffers are allocated once and only the touched entries are reset between sources.
+    """
+    n = graph.vertex_len
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    inf = float('inf')
+    distances = array('d', [inf]) * n
+    settled = bytearray(n)
+    is_target = bytearray(n)
+    for t in target_indices:
+        is_target[t] = 1
+    target_count = sum(is_target)
+    touched = []
+    heap = []
+    result = array('d')
+    for s in source_indices:
+        distances[s] = 0.0
+        touched.append(s)
+        heap.append((0.0, s))
+        remaining = target_count
+        while heap and remaining:
+            d, u = heappop(heap)
+            if settled[u]:
+                continue
+            settled[u] = 1
+            if is_target[u]:
+                remaining -= 1
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                new_distance = d + weights[i]
+                if new_distance < distances[v]:
+                    if distances[v] == inf:
+                        touched.append(v)
+                    distances[v] = new_distance
+                    heappush(heap, (new_distance, v))
+        for t in target_indices:
+            result.append(distances[t] if settled[t] else inf)
+        for v in touched:
+            distances[v] = inf
+            settled[v] = 0
+        touched.clear()
+        heap.clear()
+    return result
+
+
+_worker_graph = None
+
+
+def _init_worker(path):
+    global _worker_graph
+    _worker_graph = CSRGraph.load(path)
+
+
+def _worker_distance_rows(source_indices, target_indices) -> bytes:
+    return _distance_rows(_worker_graph, source_indices, target_indices).tobytes()
+
+
+def distance_matrix(graph, sources: Sequence, targets: Sequence, workers: int = 1,
+                    chunk_size: int = 16) -> DistanceMatrix:
+    """
+    Many-to-many shortest path distances.
+    :param graph: A Graph or CSRGraph with non-negative weights. A Graph is converted to a CSRGraph first.
+    :param sources: The source vertex keys.
+    :param targets: The target vertex keys.
+    :param workers: With more than one worker, sources are split into chunks of chunk_size and fanned out across a
+    process pool. The workers share a memory-mapped copy of the CSR graph.
+    :param chunk_size: Sources per task in parallel mode.
+    :return: The distance matrix.
+    """
+    csr = graph if isinstance(graph, CSRGraph) else CSRGraph.from_graph(graph)
+    source_indices = [csr.index_of(s) for s in sources]
+    target_indices = [csr.index_of(t) for t in targets]
+    if workers <= 1 or len(source_indices) <= chunk_size:
+        return DistanceMatrix(sources, targets, _distance_rows(csr, source_indices, target_indices))
+
+    data = array('d')
+    with tempfile.TemporaryDirectory() as dir_name:
+        path = os.path.join(dir_name, 'graph.csr')
+        csr.save(path)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path,)) as executor:
+            futures = [executor.submit(_worker_distance_rows, source_indices[i:i + chunk_size], target_indices)
+                       for i in range(0, len(source_indices), chunk_size)]
+            for future in futures:
+                data.frombytes(future.result())
+    return DistanceMatrix(sources, targets, data)
+
+
+def _path_cost(graph: Graph, path: list) -> float:
+    if not path:
+        return float('inf')
+    return sum(graph.edge_weight(path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+class TestDistanceMatrix(TestCase):
+    def _check(self, graph, sources, targets, matrix):
+        self.assertEqual((len(sources), len(targets)), matrix.shape)
+        for i, s in enumerate(sources):
+            came_from = dijkstra(graph, s)
+            for j, t in enumerate(targets):
+                self.assertEqual(_path_cost(graph, reconstruct_path(came_from, s, t)), matrix[i, j])
+            self.assertSequenceEqual([matrix[i, j] for j in range(len(targets))], matrix.row(i))
+
+    def test_rand_graph(self):
+        graph = Graph()
+        for i in range(50):
+            graph.add_vertex(Vertex(i * 3))
+        for _ in range(150):
+            u, v = randint(0, 49) * 3, randint(0, 49) * 3
+            if not graph.has_edge(u, v):
+                graph.add_edge(u, v, randint(0, 10))
+        sources = sample(range(0, 150, 3), 10)
+        targets = sample(range(0, 150, 3), 7) + [sources[0]]
+        self._check(graph, sources, targets, distance_matrix(graph, sources, targets))
+        self._check(graph, sources, targets, distance_matrix(CSRGraph.from_graph(graph), sources, targets))
+        self._check(graph, sources, targets, distance_matrix(graph, sources, targets, workers=2, chunk_size=3))
+
+    def test_terrain(self):
+        graph = terrain_to_graph([[(x * 7 + y * 13) % 5 + 1 for x in range(10)] for y in range(10)])
+        sources = [(0, 0), (9, 9), (3, 4)]
+        targets = [(5, 5), (0, 9), (0, 0)]
+        self._check(graph, sources, targets, distance_matrix(graph, sources, targets))
+
+
+def _main():
+    n = 200
+    graph = CSRGraph.from_graph(terrain_to_graph([[(x * 7 + y * 13) % 5 + 1 for x in range(n)] for y in range(n)],
+                                                 ordered=False))
+    depots = [(randint(0, n - 1), randint(0, n - 1)) for _ in range(20)]
+    customers = [(randint(0, n - 1), randint(0, n - 1)) for _ in range(200)]
+    start_time = time.time()
+    for s in depots:
+        dijkstra(graph, s)
+    print('dijkstra per source: %.2fs.' % (time.time() - start_time))
+    for workers in (1, 4):
+        start_time = time.time()
+        distance_matrix(graph, depots, customers, workers=workers, chunk_size=5)
+        print('distance_matrix, %d workers: %.2fs.' % (workers, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()
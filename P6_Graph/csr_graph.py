@@ -0,0 +1,424 @@
+from P6_Graph.directed_graph import Graph, Vertex
+from array import array
+from bisect import bisect_left
+from unittest import TestCase
+from random import randint
+from struct import Struct
+from mmap import mmap, ACCESS_READ
+from numbers import Integral
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+
+
+# Vertex count and edge count.
+_CSR_HEADER = Struct('<qq')
+
+
+class CSRVertex(object):
+    """A read-only view of a vertex in a CSRGraph, with the same query API as Vertex."""
+    def __init__(self, graph: 'CSRGraph', index: int):
+        self._graph = graph
+        self._index = index
+
+    @property
+    def key(self):
+        return self._graph._keys[self._index]
+
+    def successors(self):
+        graph = self._graph
+        keys, targets, weights = graph._keys, graph._targets, graph._weights
+        for i in range(graph._offsets[self._index], graph._offsets[self._index + 1]):
+            yield keys[targets[i]], weights[i]
+
+    def _edge_position(self, successor_key) -> int:
+        graph = self._graph
+        if not graph.has_vertex(successor_key):
+            return -1
+        target = graph.index_of(successor_key)
+        lo, hi = graph._offsets[self._index], graph._offsets[self._index + 1]
+        i = bisect_left(graph._targets, target, lo, hi)
+        return i if i < hi and graph._targets[i] == target else -1
+
+    def has_successor(self, successor_key):
+        return self._edge_position(successor_key) >= 0
+
+    def weight(self, successor_key) -> float:
+        i = self._edge_position(successor_key)
+        return self._graph._weights[i] if i >= 0 else float('inf')
+
+    @property
+    def successor_len(self):
+        return self._graph._offsets[self._index + 1] - self._graph._offsets[self._index]
+
+
+class CSRGraph(object):
+    """
+    Immutable directed graph in the compressed sparse row layout. Vertices are numbered 0 .. n - 1 in the order of
+    vertex_keys(), and the successors of vertex i are targets[offsets[i] .. offsets[i + 1] - 1], sorted by vertex
+    number, with the corresponding weights. Integer vertex keys are stored in an array('q') as well; other keys are
+    kept in a tuple.
+    """
+    def __init__(self, keys, offsets: array, targets: array, weights: array):
+        assert len(offsets) == len(keys) + 1
+        assert len(targets) == len(weights) == offsets[-1]
+        self._keys = keys
+        self._offsets = offsets
+        self._targets = targets
+        self._weights = weights
+        self._mmap = None  # Keeps the file mapping of a loaded graph open.
+        self._transpose = None
+        if all(keys[i] == i for i in range(len(keys))):
+            self._indices = None  # Vertex keys are exactly 0 .. n - 1.
+        else:
+            self._indices = {k: i for i, k in enumerate(keys)}
+
+    @staticmethod
+    def _pack_keys(keys):
+        if all(isinstance(k, int) for k in keys):
+            try:
+                return array('q', keys)
+            except OverflowError:
+                pass
+        return tuple(keys)
+
+    @staticmethod
+    def from_graph(graph: Graph) -> 'CSRGraph':
+        keys = list(graph.vertex_keys())
+        indices = {k: i for i, k in enumerate(keys)}
+        offsets = array('q', [0])
+        targets = array('q')
+        weights = array('d')
+        for k in keys:
+            # The successors of an unordered vertex aren't sorted by vertex number.
+            successors = graph.get_vertex(k).successors()
+            for target, weight in sorted((indices[v_key], weight) for v_key, weight in successors):
+                targets.append(target)
+                weights.append(weight)
+            offsets.append(len(targets))
+        return CSRGraph(CSRGraph._pack_keys(keys), offsets, targets, weights)
+
+    @staticmethod
+    def from_edges(vertex_keys, src_keys, dst_keys, weights=None) -> 'CSRGraph':
+        """
+        Builds a CSR graph from parallel edge arrays in O(V + E log d) time, where d is the maximum out degree.
+        :param vertex_keys: All vertex keys, in the order of vertex numbering.
+        :param src_keys: The source vertex key of each edge.
+        :param dst_keys: The destination vertex key of each edge.
+        :param weights: The weight of each edge, all 0 if omitted.
+        :return: The CSR graph.
+        """
+        keys = list(vertex_keys)
+        n = len(keys)
+        indices = {k: i for i, k in enumerate(keys)}
+        assert len(indices) == n
+        m = len(src_keys)
+        assert len(dst_keys) == m and (weights is None or len(weights) == m)
+
+        # Counting sort edges by source.
+        offsets = array('q', [0]) * (n + 1)
+        for u in src_keys:
+            offsets[indices[u] + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        next_positions = array('q', offsets)
+        targets = array('q', [0]) * m
+        packed_weights = array('d', [0.0]) * m
+        for j in range(m):
+            u = indices[src_keys[j]]
+            pos = next_positions[u]
+            targets[pos] = indices[dst_keys[j]]
+            if weights is not None:
+                packed_weights[pos] = weights[j]
+            next_positions[u] = pos + 1
+
+        # Sort each row by target.
+        for u in range(n):
+            lo, hi = offsets[u], offsets[u + 1]
+            if hi - lo <= 1:
+                continue
+            row = sorted(zip(targets[lo:hi], packed_weights[lo:hi]))
+            for i in range(hi - lo):
+                assert i == 0 or row[i - 1][0] != row[i][0], 'Duplicate edge'
+                targets[lo + i], packed_weights[lo + i] = row[i]
+        return CSRGraph(CSRGraph._pack_keys(keys), offsets, targets, packed_weights)
+
+    def transpose(self) -> 'CSRGraph':
+        """
+        The graph with every edge reversed, built once in O(V + E) time and cached. Rows come out sorted by scanning
+        sources in order.
+        """
+        if self._transpose is not None:
+            return self._transpose
+        n, m = len(self._keys), len(self._targets)
+        offsets = array('q', [0]) * (n + 1)
+        for v in self._targets:
+            offsets[v + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        next_positions = array('q', offsets)
+        targets = array('q', [0]) * m
+        weights = array('d', [0.0]) * m
+        for u in range(n):
+            for i in range(self._offsets[u], self._offsets[u + 1]):
+                v = self._targets[i]
+                pos = next_positions[v]
+                targets[pos] = u
+                weights[pos] = self._weights[i]
+                next_positions[v] = pos + 1
+        self._transpose = CSRGraph(self._keys, offsets, targets, weights)
+        self._transpose._transpose = self
+        return self._transpose
+
+    def save(self, path):
+        """
+        Writes the graph to a file: a header with the vertex and edge counts, the offsets, targets and weights buffers,
+        then the pickled vertex keys. load can memory-map the buffers instead of reading them.
+        """
+        with open(path, 'wb') as f:
+            f.write(_CSR_HEADER.pack(len(self._keys), len(self._targets)))
+            for buffer in (self._offsets, self._targets, self._weights):
+                f.write(memoryview(buffer).cast('B'))
+            pickle.dump(self._keys, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path, use_mmap: bool = True) -> 'CSRGraph':
+        """
+        Reads a graph written by save. With use_mmap, the offsets, targets and weights are read-only views of a shared
+        memory map of the file, so that processes loading the same file share its pages.
+        """
+        with open(path, 'rb') as f:
+            n, m = _CSR_HEADER.unpack(f.read(_CSR_HEADER.size))
+            sizes = ((n + 1) * 8, m * 8, m * 8)
+            if use_mmap:
+                mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+                view = memoryview(mm)
+                start = _CSR_HEADER.size
+                offsets = view[start:start + sizes[0]].cast('q')
+                start += sizes[0]
+                targets = view[start:start + sizes[1]].cast('q')
+                start += sizes[1]
+                weights = view[start:start + sizes[2]].cast('d')
+                f.seek(start + sizes[2])
+            else:
+                mm = None
+                offsets, targets, weights = array('q'), array('q'), array('d')
+                for buffer, size in zip((offsets, targets, weights), sizes):
+                    buffer.frombytes(f.read(size))
+            keys = pickle.load(f)
+        graph = CSRGraph(keys, offsets, targets, weights)
+        graph._mmap = mm
+        return graph
+
+    def index_of(self, key) -> int:
+        """The vertex number of a key. Raises a KeyError if the key is not a vertex."""
+        if self._indices is None:
+            if not self.has_vertex(key):
+                raise KeyError(str(key))
+            return int(key)
+        return self._indices[key]
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def targets(self):
+        return self._targets
+
+    @property
+    def weights(self):
+        return self._weights
+
+    def has_vertex(self, key):
+        if self._indices is None:
+            return isinstance(key, Integral) and 0 <= key < len(self._keys)
+        return key in self._indices
+
+    def get_vertex(self, key) -> CSRVertex:
+        return CSRVertex(self, self.index_of(key))
+
+    def vertex_keys(self):
+        for v_key in self._keys:
+            yield v_key
+
+    def vertices(self):
+        for i in range(len(self._keys)):
+            yield CSRVertex(self, i)
+
+    @property
+    def vertex_len(self):
+        return len(self._keys)
+
+    @property
+    def edge_len(self):
+        return len(self._targets)
+
+    def has_edge(self, src_key, dst_key):
+        assert self.has_vertex(src_key)
+        assert self.has_vertex(dst_key)
+        return self.get_vertex(src_key).has_successor(dst_key)
+
+    def edge_weight(self, src_key, dst_key):
+        assert self.has_edge(src_key, dst_key)
+        return self.get_vertex(src_key).weight(dst_key)
+
+
+def _random_edges(vertex_count, edge_count):
+    edges = set()
+    while len(edges) < edge_count:
+        edges.add((randint(0, vertex_count - 1), randint(0, vertex_count - 1)))
+    return list(edges)
+
+
+class TestCSRGraph(TestCase):
+    def test_from_graph(self):
+        graph = Graph()
+        for k in ('a', 'b', 'c', 'd'):
+            graph.add_vertex(Vertex(k))
+        graph.add_edge('a', 'c', 2)
+        graph.add_edge('a', 'b', 1)
+        graph.add_edge('c', 'a', 3)
+        graph.add_edge('d', 'd', 4)
+        csr = CSRGraph.from_graph(graph)
+        self.assertEqual(4, csr.vertex_len)
+        self.assertEqual(4, csr.edge_len)
+        self.assertSequenceEqual(['a', 'b', 'c', 'd'], list(csr.vertex_keys()))
+        for u in graph.vertex_keys():
+            self.assertSequenceEqual(list(graph.get_vertex(u).successors()), list(csr.get_vertex(u).successors()))
+            self.assertEqual(graph.get_vertex(u).successor_len, csr.get_vertex(u).successor_len)
+            for v in graph.vertex_keys():
+                self.assertEqual(graph.has_edge(u, v), csr.has_edge(u, v))
+                self.assertEqual(graph.get_vertex(u).weight(v), csr.get_vertex(u).weight(v))
+        self.assertFalse(csr.has_vertex('e'))
+        self.assertRaises(KeyError, lambda: csr.get_vertex('e'))
+
+    def test_from_unordered_graph(self):
+        graph = Graph(ordered=False)
+        for k in range(4):
+            graph.add_vertex(Vertex(k, ordered=False))
+        for v, w in ((3, 3.0), (1, 5.0), (2, 7.0)):
+            graph.add_edge(0, v, w)
+        graph.add_edge(2, 0, 1.0)
+        csr = CSRGraph.from_graph(graph)
+        for u in graph.vertex_keys():
+            self.assertSetEqual(set(graph.get_vertex(u).successors()), set(csr.get_vertex(u).successors()))
+            for v in graph.vertex_keys():
+                self.assertEqual(graph.has_edge(u, v), csr.has_edge(u, v))
+                self.assertEqual(graph.get_vertex(u).weight(v), csr.get_vertex(u).weight(v))
+
+    def test_from_edges(self):
+        edges = _random_edges(50, 300)
+        weights = [randint(1, 10) for _ in edges]
+        csr = CSRGraph.from_edges(range(50), [e[0] for e in edges], [e[1] for e in edges], weights)
+        graph = Graph()
+        for i in range(50):
+            graph.add_vertex(Vertex(i))
+        for (u, v), w in zip(edges, weights):
+            graph.add_edge(u, v, w)
+        self.assertEqual(300, csr.edge_len)
+        for u in range(50):
+            self.assertSequenceEqual(list(graph.get_vertex(u).successors()), list(csr.get_vertex(u).successors()))
+        self.assertRaises(AssertionError, lambda: CSRGraph.from_edges(range(2), [0, 0], [1, 1]))
+        for k in (-1, 50, 'a'):
+            self.assertFalse(csr.has_vertex(k))
+            self.assertRaises(KeyError, lambda: csr.index_of(k))
+            self.assertRaises(KeyError, lambda: csr.get_vertex(k))
+        self.assertEqual(49, csr.index_of(49))
+
+    def test_transpose(self):
+        edges = _random_edges(30, 100)
+        weights = [randint(1, 10) for _ in edges]
+        transpose = CSRGraph.from_edges(range(30), [e[0] for e in edges], [e[1] for e in edges], weights).transpose()
+        self.assertEqual(100, transpose.edge_len)
+        for v in range(30):
+            expected = sorted((u, w) for (u, dst), w in zip(edges, weights) if dst == v)
+            self.assertSequenceEqual(expected, list(transpose.get_vertex(v).successors()))
+
+    def test_save_load(self):
+        edges = _random_edges(30, 100)
+        csr = CSRGraph.from_edges([i * 2 for i in range(30)], [e[0] * 2 for e in edges], [e[1] * 2 for e in edges],
+                                  [randint(1, 10) / 4 for _ in edges])
+        with tempfile.TemporaryDirectory() as dir_name:
+            path = os.path.join(dir_name, 'graph.csr')
+            csr.save(path)
+            for use_mmap in (True, False):
+                loaded = CSRGraph.load(path, use_mmap)
+                self.assertSequenceEqual(list(csr.vertex_keys()), list(loaded.vertex_keys()))
+                for u in csr.vertex_keys():
+                    self.assertSequenceEqual(list(csr.get_vertex(u).successors()),
+                                             list(loaded.get_vertex(u).successors()))
+                    self.assertTrue(all(loaded.has_edge(u, v) for v, _ in csr.get_vertex(u).successors()))
+                del loaded
+
+    def test_algorithms(self):
+        from P6_Graph.ElementaryGraphAlgorithms.bfs import bfs
+        from P6_Graph.ElementaryGraphAlgorithms.dfs import dfs
+        from P6_Graph.ElementaryGraphAlgorithms.scc import scc_tarjan
+        from P6_Graph.ElementaryGraphAlgorithms.topological_sort import topological_sort_kahn
+        from P6_Graph.SingleSourceShortestPaths.dijkstra import dijkstra
+        from P6_Graph.SingleSourceShortestPaths.astar import astar, terrain_to_graph
+
+        edges = _random_edges(40, 80)
+        graph = Graph()
+        for i in range(40):
+            graph.add_vertex(Vertex(i))
+        for u, v in edges:
+            graph.add_edge(u, v, randint(1, 10))
+        csr = CSRGraph.from_graph(graph)
+        self.assertEqual(bfs(graph), bfs(csr))
+        self.assertEqual(dfs(graph), dfs(csr))
+        self.assertEqual(scc_tarjan(graph), scc_tarjan(csr))
+        self.assertEqual(topological_sort_kahn(graph), topological_sort_kahn(csr))
+        self.assertEqual(dijkstra(graph, 0), dijkstra(csr, 0))
+
+        graph = terrain_to_graph([[1, 2, 3], [1, -1, 2], [3, 1, 1]])
+        csr = CSRGraph.from_graph(graph)
+        self.assertEqual(astar(graph, (0, 0), (2, 2)), astar(csr, (0, 0), (2, 2)))
+
+
+def _measure_build(build):
+    tracemalloc.start()
+    start_time = time.time()
+    graph = build()
+    delta_time = time.time() - start_time
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return graph, delta_time, memory
+
+
+def _main():
+    from P6_Graph.ElementaryGraphAlgorithms.bfs import bfs
+    vertex_count, edge_count = 100000, 1000000
+    edges = _random_edges(vertex_count, edge_count)
+
+    def build_graph():
+        _graph = Graph()
+        for _i in range(vertex_count):
+            _graph.add_vertex(Vertex(_i))
+        for u, v in edges:
+            _graph.add_edge(u, v, 1)
+        return _graph
+
+    graph, graph_time, graph_memory = _measure_build(build_graph)
+    csr, csr_time, csr_memory = _measure_build(lambda: CSRGraph.from_graph(graph))
+    print('%d vertices, %d edges.' % (vertex_count, edge_count))
+    for name, g, build_time, memory in (('Graph', graph, graph_time, graph_memory),
+                                        ('CSRGraph', csr, csr_time, csr_memory)):
+        start_time = time.time()
+        count = 0
+        for u in g.vertex_keys():
+            for _ in g.get_vertex(u).successors():
+                count += 1
+        scan_time = time.time() - start_time
+        start_time = time.time()
+        bfs(g)
+        bfs_time = time.time() - start_time
+        print('%s: build %.2fs, %.1f bytes/edge, edge scan %.0f edges/s, bfs %.2fs.' %
+              (name, build_time, memory / edge_count, count / scan_time, bfs_time))
+
+
+if __name__ == '__main__':
+    _main()
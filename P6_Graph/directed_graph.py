@@ -1,18 +1,41 @@
 from P3_DataStructures.RBTree.sorted_map import SortedMap
+from P3_DataStructures.BTree.bplus_tree import BPlusTreeMap
+from unittest import TestCase
+from struct import Struct
+from mmap import mmap, ACCESS_READ
+from random import randint
+import os
+import tempfile
+import time
+
+
+# Record layout of binary edge files: little-endian int64 source, int64 destination, float64 weight.
+EDGE_RECORD = Struct('<qqd')
+DEFAULT_CHUNK_SIZE = 1 << 20
+
 
 class Vertex(object):
-    def __init__(self, key):
+    def __init__(self, key, ordered: bool = True, sorted_map_class=SortedMap):
+        """
+        :param key: The vertex key.
+        :param ordered: If True, successors are kept in a sorted map and iterated in key order. Otherwise they are kept
+        in a dict and iterated in insertion order.
+        :param sorted_map_class: The sorted map of an ordered vertex, SortedMap or BPlusTreeMap.
+        """
         assert key is not None
         self._key = key
-        self._successors = SortedMap()
+        self._successors = sorted_map_class() if ordered else {}
+        self._sorted_successor_keys = None
 
     def add_successor(self, successor_key, weight: float):
         assert successor_key not in self._successors
         self._successors[successor_key] = weight
+        self._sorted_successor_keys = None
 
     def remove_successor(self, successor_key):
         assert successor_key in self._successors
         self._successors.pop(successor_key)
+        self._sorted_successor_keys = None
 
     @property
     def key(self):
@@ -22,11 +45,22 @@ class Vertex(object):
         for key, weight in self._successors.items():
             yield key, weight
 
+    def sorted_successors(self):
+        """Successors in key order. For an unordered vertex, the sorted key index is built once and cached."""
+        successors = self._successors
+        if not isinstance(successors, dict):
+            yield from successors.items()
+            return
+        if self._sorted_successor_keys is None:
+            self._sorted_successor_keys = sorted(successors)
+        for key in self._sorted_successor_keys:
+            yield key, successors[key]
+
     def has_successor(self, successor_key):
-        return successor_key in self._successors.keys()
+        return successor_key in self._successors
 
     def weight(self, successor_key) -> float:
-        if successor_key in self._successors.keys():
+        if successor_key in self._successors:
             return self._successors[successor_key]
         return float('inf')
 
@@ -36,13 +70,36 @@ class Vertex(object):
 
 
 class Graph(object):
-    def __init__(self):
-        self._vertices = SortedMap()
+    def __init__(self, ordered: bool = True, sorted_map_class=SortedMap):
+        """
+        :param ordered: If True, vertices are kept in a sorted map and iterated in key order. Otherwise they are kept in
+        a dict and iterated in insertion order, which makes building and lookups much faster. Vertices added to an
+        unordered graph should be created with Vertex(key, ordered=False) as well.
+        :param sorted_map_class: The sorted map of an ordered graph and of the vertices created by new_vertex and the
+        loaders, SortedMap or BPlusTreeMap. Both provide from_sorted.
+        """
+        self._ordered = ordered
+        self._sorted_map_class = sorted_map_class
+        self._vertices = sorted_map_class() if ordered else {}
+        self._sorted_vertex_keys = None
+        self._transpose = None
+
+    @property
+    def ordered(self):
+        return self._ordered
+
+    def new_vertex(self, key) -> Vertex:
+        """Creates and adds a vertex in the same mode as this graph."""
+        v = Vertex(key, self._ordered, self._sorted_map_class)
+        self.add_vertex(v)
+        return v
 
     def add_vertex(self, v: Vertex):
         assert v
         assert v.key not in self._vertices
         self._vertices[v.key] = v
+        self._sorted_vertex_keys = None
+        self._transpose = None
 
     def has_vertex(self, key):
         return key in self._vertices
@@ -54,10 +111,33 @@ class Graph(object):
         for v_key in self._vertices.keys():
             yield v_key
 
+    def sorted_vertex_keys(self):
+        """Vertex keys in key order. For an unordered graph, the sorted key index is built once and cached."""
+        if self._ordered:
+            yield from self._vertices.keys()
+            return
+        if self._sorted_vertex_keys is None:
+            self._sorted_vertex_keys = sorted(self._vertices)
+        yield from self._sorted_vertex_keys
+
     def vertices(self):
         for v in self._vertices.values():
             yield v
 
+    def transpose(self) -> 'Graph':
+        """
+        The graph with every edge reversed, in the same mode, built once in O(V + E) time and cached until this graph
+        is modified through its methods. The transpose itself must not be modified.
+        """
+        if self._transpose is None:
+            tr = Graph(self._ordered, self._sorted_map_class)
+            for v_key in self.vertex_keys():
+                tr.new_vertex(v_key)
+            for u in self.vertices():
+                for v_key, weight in u.successors():
+                    tr.get_vertex(v_key).add_successor(u.key, weight)
+            self._transpose = tr
+        return self._transpose
 
     @property
     def vertex_len(self):
@@ -69,11 +149,13 @@ class Graph(object):
         src = self._vertices[src_key]
         assert not src.has_successor(dst_key)
         src.add_successor(dst_key, weight)
+        self._transpose = None
 
     def remove_edge(self, src_key, dst_key):
         assert self.has_edge(src_key, dst_key)
         src: Vertex = self._vertices[src_key]
         src.remove_successor(dst_key)
+        self._transpose = None
 
     def add_2_edges(self, vert_key1, vert_key2, weight: float = 0):
         assert vert_key1 != vert_key2
@@ -81,9 +163,10 @@ class Graph(object):
         assert vert_key2 in self._vertices
         u = self._vertices[vert_key1]
         v = self._vertices[vert_key2]
-        assert not u.has_successor(v) and not v.has_successor(u)
+        assert not u.has_successor(vert_key2) and not v.has_successor(vert_key1)
         u.add_successor(vert_key2, weight)
         v.add_successor(vert_key1, weight)
+        self._transpose = None
 
     def has_edge(self, src_key: Vertex, dst_key: Vertex):
         assert src_key in self._vertices
@@ -97,3 +180,258 @@ class Graph(object):
         src = self._vertices[src_key]
         assert src.has_successor(dst_key)
         return src.weight(dst_key)
+
+    @staticmethod
+    def from_edge_list(path_or_iterable, ordered: bool = True, trusted: bool = False, binary: bool = False,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE, sorted_map_class=SortedMap) -> 'Graph':
+        """
+        Builds a graph from an edge list. Vertices are created as they first appear.
+        :param path_or_iterable: Either an iterable of (u,), (u, v) or (u, v, weight) tuples, where (u,) only adds
+        the vertex u, or the path of an edge file. A
+        text edge file has one "u v [weight]" edge per line, or DIMACS "a u v weight" lines, in which case the
+        "p sp n m" line creates vertices 1 .. n. Lines starting with "#", "%" or "c" are comments. A binary edge
+        file is a sequence of EDGE_RECORD records and is memory-mapped.
+        :param ordered: Whether to build an ordered graph.
+        :param trusted: If True, the input is trusted to contain no duplicate edge, and the per-edge checks are skipped.
+        :param binary: Whether the edge file is binary.
+        :param chunk_size: How many bytes to parse at a time.
+        :param sorted_map_class: The sorted map of an ordered graph, see Graph.
+        :return: The graph.
+        """
+        if isinstance(path_or_iterable, (str, bytes, os.PathLike)):
+            if binary:
+                edges = iter_binary_edge_file(path_or_iterable, chunk_size)
+            else:
+                edges = iter_text_edge_file(path_or_iterable, chunk_size)
+        else:
+            edges = path_or_iterable
+        graph = Graph(ordered, sorted_map_class)
+        graph._load_edges(edges, trusted)
+        return graph
+
+    @staticmethod
+    def from_adjacency_file(path, ordered: bool = True, trusted: bool = False,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE, sorted_map_class=SortedMap) -> 'Graph':
+        """
+        Builds a graph from an adjacency list file, where each line "u v1 v2:w2 ..." lists a vertex and its successors,
+        each with an optional weight after a colon. Lines starting with "#" or "%" are comments.
+        :param path: The path of the file.
+        :param ordered: Whether to build an ordered graph.
+        :param trusted: If True, the input is trusted to contain no duplicate edge, and the per-edge checks are skipped.
+        :param chunk_size: How many bytes to parse at a time.
+        :param sorted_map_class: The sorted map of an ordered graph, see Graph.
+        :return: The graph.
+        """
+        graph = Graph(ordered, sorted_map_class)
+        graph._load_edges(iter_adjacency_file(path, chunk_size), trusted)
+        return graph
+
+    def _load_edges(self, edges, trusted: bool):
+        self._transpose = None
+        if self._ordered and not self._vertices:
+            # Load into dicts, then bulk-build every sorted map from sorted input in linear time.
+            staging = Graph(ordered=False)
+            staging._load_edges(edges, trusted)
+            sorted_map_class = self._sorted_map_class
+            for v in staging.vertices():
+                v._successors = sorted_map_class.from_sorted(sorted(v._successors.items()))
+            self._vertices = sorted_map_class.from_sorted(sorted(staging._vertices.items()))
+            return
+
+        vertices = self._vertices
+        for edge in edges:
+            if len(edge) == 3:
+                u, v, weight = edge
+            elif len(edge) == 2:
+                (u, v), weight = edge, 0
+            else:
+                if edge[0] not in vertices:
+                    self.new_vertex(edge[0])
+                continue
+            if u not in vertices:
+                self.new_vertex(u)
+            if v not in vertices:
+                self.new_vertex(v)
+            if trusted:
+                vertices[u]._successors[v] = weight
+            else:
+                self.add_edge(u, v, weight)
+
+
+def _parse_number(token: str):
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _iter_text_lines(path, chunk_size: int):
+    with open(path, 'r') as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            for line in lines:
+                yield line
+
+
+def iter_text_edge_file(path, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Streams (u, v, weight) tuples from a text or DIMACS edge file. See Graph.from_edge_list for the format."""
+    for line in _iter_text_lines(path, chunk_size):
+        tokens = line.split()
+        if not tokens or tokens[0][0] in '#%c':
+            continue
+        if tokens[0] == 'p':
+            # DIMACS problem line: p sp <vertex count> <edge count>
+            for v in range(1, int(tokens[2]) + 1):
+                yield v,
+            continue
+        if tokens[0] == 'a':
+            tokens = tokens[1:]
+        yield int(tokens[0]), int(tokens[1]), _parse_number(tokens[2]) if len(tokens) > 2 else 0
+
+
+def iter_binary_edge_file(path, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Streams (u, v, weight) tuples from a memory-mapped binary edge file of EDGE_RECORD records."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        assert size % EDGE_RECORD.size == 0
+        if size == 0:
+            return
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as mm:
+            view = memoryview(mm)
+            step = max(1, chunk_size // EDGE_RECORD.size) * EDGE_RECORD.size
+            try:
+                for start in range(0, size, step):
+                    for edge in EDGE_RECORD.iter_unpack(view[start:start + step]):
+                        yield edge
+            finally:
+                view.release()
+
+
+def write_binary_edge_file(path, edges):
+    """Writes (u, v, weight) tuples to a binary edge file that Graph.from_edge_list can memory-map."""
+    with open(path, 'wb') as f:
+        for u, v, weight in edges:
+            f.write(EDGE_RECORD.pack(u, v, weight))
+
+
+def iter_adjacency_file(path, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Streams (u, v, weight) tuples from an adjacency list file, and a (u,) tuple for each vertex without successors.
+    See Graph.from_adjacency_file for the format.
+    """
+    for line in _iter_text_lines(path, chunk_size):
+        tokens = line.split()
+        if not tokens or tokens[0][0] in '#%':
+            continue
+        u = int(tokens[0])
+        if len(tokens) == 1:
+            yield u,
+        for token in tokens[1:]:
+            v, _, weight = token.partition(':')
+            yield u, int(v), _parse_number(weight) if weight else 0
+
+
+class TestGraph(TestCase):
+    def test_ordered_and_unordered(self):
+        keys = (5, 1, 4, 2, 3)
+        for ordered, sorted_map_class in ((True, SortedMap), (True, BPlusTreeMap), (False, SortedMap)):
+            graph = Graph(ordered, sorted_map_class)
+            for k in keys:
+                graph.new_vertex(k)
+            for k in keys:
+                for j in keys:
+                    if (k + j) % 2:
+                        graph.add_edge(k, j, k * j)
+            self.assertEqual(ordered, graph.ordered)
+            self.assertSequenceEqual(sorted(keys) if ordered else keys, list(graph.vertex_keys()))
+            self.assertSequenceEqual(sorted(keys), list(graph.sorted_vertex_keys()))
+            self.assertSequenceEqual([(2, 10), (4, 20)], list(graph.get_vertex(5).sorted_successors()))
+            self.assertTrue(graph.has_edge(5, 2))
+            self.assertFalse(graph.has_edge(5, 3))
+            self.assertEqual(20, graph.edge_weight(5, 4))
+            self.assertEqual(float('inf'), graph.get_vertex(5).weight(3))
+
+            transpose = graph.transpose()
+            self.assertIs(transpose, graph.transpose())
+            self.assertEqual(ordered, transpose.ordered)
+            self.assertSequenceEqual([(2, 10), (4, 20)], list(transpose.get_vertex(5).sorted_successors()))
+            graph.remove_edge(5, 2)
+            self.assertSequenceEqual([(4, 20)], list(graph.get_vertex(5).sorted_successors()))
+            self.assertSequenceEqual([(1, 2), (3, 6)], list(graph.transpose().get_vertex(2).sorted_successors()))
+            graph.new_vertex(0)
+            self.assertSequenceEqual([0, 1, 2, 3, 4, 5], list(graph.sorted_vertex_keys()))
+            self.assertEqual(6, graph.vertex_len)
+
+    def test_from_edge_list(self):
+        edges = [(1, 2, 3), (2, 3, 4.5), (3, 1, 1), (1, 3, 2), (4, 4, 0)]
+        expected = {1: [(2, 3), (3, 2)], 2: [(3, 4.5)], 3: [(1, 1)], 4: [(4, 0)], 5: []}
+        with tempfile.TemporaryDirectory() as dir_name:
+            text_path = os.path.join(dir_name, 'edges.txt')
+            with open(text_path, 'w') as f:
+                f.write('# comment\n1 2 3\n2 3 4.5\n\n3 1 1\n1 3 2\n4 4\n')
+            dimacs_path = os.path.join(dir_name, 'edges.gr')
+            with open(dimacs_path, 'w') as f:
+                f.write('c comment\np sp 5 5\na 1 2 3\na 2 3 4.5\na 3 1 1\na 1 3 2\na 4 4 0\n')
+            binary_path = os.path.join(dir_name, 'edges.bin')
+            write_binary_edge_file(binary_path, edges)
+            adj_path = os.path.join(dir_name, 'adj.txt')
+            with open(adj_path, 'w') as f:
+                f.write('% comment\n1 2:3 3:2\n2 3:4.5\n3 1:1\n4 4\n5\n')
+
+            for ordered in (True, False):
+                for trusted in (True, False):
+                    graphs = (
+                        Graph.from_edge_list(edges + [(5,)], ordered, trusted),
+                        Graph.from_edge_list(text_path, ordered, trusted),
+                        Graph.from_edge_list(dimacs_path, ordered, trusted),
+                        Graph.from_edge_list(binary_path, ordered, trusted, binary=True, chunk_size=1),
+                        Graph.from_adjacency_file(adj_path, ordered, trusted),
+                    )
+                    for graph in graphs:
+                        if not graph.has_vertex(5):
+                            graph.add_vertex(Vertex(5, ordered))
+                        self.assertEqual(ordered, graph.ordered)
+                        self.assertDictEqual(expected, {u: list(graph.get_vertex(u).sorted_successors())
+                                                        for u in graph.vertex_keys()})
+        graph = Graph.from_edge_list(edges, sorted_map_class=BPlusTreeMap)
+        self.assertDictEqual({u: s for u, s in expected.items() if u != 5},
+                             {u: list(graph.get_vertex(u).successors()) for u in graph.vertex_keys()})
+        self.assertRaises(AssertionError, lambda: Graph.from_edge_list([(1, 2), (1, 2)]))
+
+
+def _main():
+    from P6_Graph.SingleSourceShortestPaths.astar import terrain_to_graph
+    for n in (100, 500, 2000):
+        terrain = [[1] * n for _ in range(n)]
+        for ordered in (True, False):
+            start_time = time.time()
+            graph = terrain_to_graph(terrain, ordered)
+            build_time = time.time() - start_time
+            start_time = time.time()
+            for x in range(n):
+                for y in range(n):
+                    graph.get_vertex((x, y)).has_successor((x, y + 1))
+            lookup_time = time.time() - start_time
+            print('%d x %d grid, ordered=%r: build %.2fs, %d lookups %.2fs.' %
+                  (n, n, ordered, build_time, n * n, lookup_time))
+
+    vertex_count, edge_count = 100000, 500000
+    edges = list({(randint(0, vertex_count - 1), randint(0, vertex_count - 1), 1) for _ in range(edge_count)})
+    start_time = time.time()
+    graph = Graph()
+    for u, v, w in edges:
+        if not graph.has_vertex(u):
+            graph.new_vertex(u)
+        if not graph.has_vertex(v):
+            graph.new_vertex(v)
+        graph.add_edge(u, v, w)
+    print('Ordered graph from %d edges, one add_edge at a time: %.2fs.' % (len(edges), time.time() - start_time))
+    start_time = time.time()
+    Graph.from_edge_list(edges)
+    print('Ordered graph from %d edges, from_edge_list: %.2fs.' % (len(edges), time.time() - start_time))
+
+
+if __name__ == '__main__':
+    _main()